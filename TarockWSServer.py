@@ -6,69 +6,476 @@ import asyncio
 import logging
 import argparse
 import json
-from typing import Optional, Dict
-from tarockgame.game import GameType, Game, IllegalPlay, GameStage, Suit, Card
-from collections import defaultdict, deque
+import glob
+import gzip
+import hashlib
+import http
+import mimetypes
+import multiprocessing
+import os
+import signal
+import tempfile
+import time
+import posixpath
+import re
+import zlib
+from typing import Optional, Dict, List, Tuple, Union
+from tarockgame.game import GameType, Game, IllegalPlay, GameStage, Card
+from collections import deque
 from random import choice
-from prometheus_client import start_http_server, Summary, Gauge, Counter
+from prometheus_client import start_http_server, Summary, Gauge, Counter, Histogram, CollectorRegistry, multiprocess
+from concurrent.futures import Executor, ProcessPoolExecutor
+from tarockgame import bot, endgame
+from tarockgame.encoding import StateEncoder, BinaryStateEncoder, dumps, binary_dumps, BINARY_PROTOCOL, JSON_PROTOCOL
+from tarockgame.gamelog import GameLog
+from websockets.datastructures import Headers
+import atlas
 
+try:
+    import brotli
+except ImportError:
+    brotli = None
 
-PYTAROCK_PLAYERS = Gauge(name='pytarock_players', documentation='Number of players connected')
-PYTAROCK_TABLES = Gauge(name='pytarock_tables', documentation='Number of active tables')
+
+# livesum adds up the values of all live worker processes when running with --processes
+PYTAROCK_PLAYERS = Gauge(name='pytarock_players', documentation='Number of players connected',
+                         multiprocess_mode='livesum')
+PYTAROCK_TABLES = Gauge(name='pytarock_tables', documentation='Number of active tables',
+                        multiprocess_mode='livesum')
+PYTAROCK_SPECTATORS = Gauge(name='pytarock_spectators', documentation='Number of spectators connected',
+                            multiprocess_mode='livesum')
+PYTAROCK_BOT_TASKS = Gauge(name='pytarock_bot_tasks', documentation='Number of tables running bots or autoplay',
+                           multiprocess_mode='livesum')
+# The default buckets start at 5ms, most of the work of the server takes less
+FAST_BUCKETS = (.0001, .00025, .0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1., 2.5)
+PYTAROCK_MESSAGE_SECONDS = Histogram(name='pytarock_message_seconds', labelnames=['type'], buckets=FAST_BUCKETS,
+                                     documentation='Time to apply an inbound message to the game, by message type')
+PYTAROCK_BROADCAST_SECONDS = Histogram(name='pytarock_broadcast_seconds', buckets=FAST_BUCKETS,
+                                       documentation='Time to build and encode the state updates of a table')
+PYTAROCK_BROADCAST_BYTES = Histogram(name='pytarock_broadcast_bytes', documentation='Size of a state update',
+                                     buckets=(64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384))
+PYTAROCK_SEND_SECONDS = Histogram(name='pytarock_send_seconds', buckets=FAST_BUCKETS,
+                                  documentation='Time until a state update is handed to a connection')
+PYTAROCK_MERGED_UPDATES = Counter(name='pytarock_merged_updates',
+                                  documentation='Number of state updates merged into a pending one for a slow client')
+PYTAROCK_SLOW_CLIENTS = Counter(name='pytarock_slow_clients',
+                                documentation='Number of clients disconnected for falling behind')
+PYTAROCK_LOOP_LAG = Histogram(name='pytarock_loop_lag_seconds', buckets=FAST_BUCKETS,
+                              documentation='Delay of the event loop in waking up a sleeping task')
 
 logger = logging.getLogger(__name__)
 
+# Clients choose the wire format by websocket subprotocol, without one they get JSON
+SUBPROTOCOLS = [BINARY_PROTOCOL, JSON_PROTOCOL]
+
 def _(msg):
     return msg
 
+class BotPlayer:
+    # Fills an empty seat. It looks like a connection to the Table, but ignores all messages.
+    data: dict
+
+    def __init__(self):
+        self.data = dict()
+
+    async def send(self, msg):
+        pass
+
+
+class Bots:
+    # Lets the Monte Carlo bot choose moves without blocking the event loop. The searches run in worker
+    # processes; without workers they run in a thread, which holds the GIL against the event loop, so
+    # only max_threads searches run there at the same time. Autoplay plays the first legal card,
+    # unless autoplay is set.
+    budget: float
+    executor: Optional[Executor]
+    workers: int
+    limit: Optional[asyncio.Semaphore]
+    autoplay: bool
+
+    def __init__(self, budget: float = 0.5, workers: int = 2, max_threads: int = 1, autoplay: bool = False):
+        self.budget = budget
+        self.workers = workers
+        self.autoplay = autoplay
+        self.executor = ProcessPoolExecutor(max_workers=workers) if workers > 0 else None
+        self.limit = asyncio.Semaphore(max_threads) if workers <= 0 else None
+
+    async def choose_card(self, game: Game, playerid: int) -> Card:
+        if game.game_stage is GameStage.TALONTAKEN:
+            return bot.choose_drop(game, playerid)
+        view = bot.SeatView(game, playerid)
+        loop = asyncio.get_running_loop()
+        if self.limit is None:
+            # The thread only waits for the worker processes
+            return await loop.run_in_executor(None, bot.choose_card, view, self.budget,
+                                              self.executor, self.workers)
+        async with self.limit:
+            return await loop.run_in_executor(None, bot.choose_card, view, self.budget)
+
+
+class Scheduler:
+    # Paces the moves tables make on their own (bots and autoplay) and limits how many
+    # tables compute a move at the same time, across the whole server.
+    # Broadcasts of a table are delayed by window seconds to combine the changes of actions
+    # arriving shortly after each other, but by at most max_window seconds.
+    delay: float
+    max_tasks: int
+    window: float
+    max_window: float
+
+    def __init__(self, delay: float = 0.1, max_tasks: int = 8, window: float = 0.005, max_window: float = 0.025):
+        self.delay = delay
+        self.max_tasks = max_tasks
+        self.limit = asyncio.Semaphore(max_tasks)
+        self.window = window
+        self.max_window = max_window
+
+
+class Outbox:
+    # Sends the messages for one connection from its own task, so that a slow client holds up nobody else.
+    # State updates waiting to be sent are merged into one with the latest value per key; a client that
+    # falls more than max_pending updates behind is disconnected.
+    websocket: websockets.WebSocketServerProtocol
+    max_pending: int
+    binary: bool
+    queue: deque
+    pending: int
+    closed: bool
+
+    def __init__(self, websocket, max_pending: int = 200):
+        self.websocket = websocket
+        self.max_pending = max_pending
+        self.binary = websocket.subprotocol == BINARY_PROTOCOL
+        # [message, encoded message or None, mergeable, number of messages merged into it]
+        self.queue = deque()
+        self.pending = 0
+        self.closed = False
+        self.ready = asyncio.Event()
+        self.task = asyncio.create_task(self._run())
+
+    def put(self, msg: Dict, encoded: Optional[Union[str, bytes]] = None, merge: bool = True):
+        if self.closed:
+            return
+        if merge and self.queue and self.queue[-1][2]:
+            entry = self.queue[-1]
+            # The queued message may be shared with other connections (spectators), merge into a copy
+            entry[0] = {**entry[0], **msg}
+            entry[1] = None
+            entry[3] += 1
+            PYTAROCK_MERGED_UPDATES.inc()
+        else:
+            self.queue.append([msg, encoded, merge, 1])
+        self.pending += 1
+        if self.pending > self.max_pending:
+            logger.info(f'Disconnecting a client {self.pending!s} messages behind')
+            PYTAROCK_SLOW_CLIENTS.inc()
+            self.close()
+            asyncio.create_task(self.websocket.close(code=1008, reason='Too slow'))
+            return
+        self.ready.set()
+
+    async def _run(self):
+        try:
+            while True:
+                await self.ready.wait()
+                self.ready.clear()
+                while self.queue:
+                    msg, encoded, _, count = self.queue.popleft()
+                    # Slow clients show up as long sends, websockets waits while the connection's buffer is full
+                    t = time.perf_counter()
+                    if encoded is None:
+                        encoded = binary_dumps(msg) if self.binary else dumps(msg)
+                    await self.websocket.send(encoded)
+                    PYTAROCK_SEND_SECONDS.observe(time.perf_counter() - t)
+                    self.pending -= count
+        except websockets.ConnectionClosed:
+            self.close()
+
+    def close(self):
+        self.closed = True
+        self.queue.clear()
+        if self.task is not asyncio.current_task():
+            self.task.cancel()
+
+
 class Table:
+    name: str
     players: list
-    game: Optional[Game]
+    _game: Optional[Game]
+    bots: Bots
+    scheduler: Scheduler
+    bot_task: Optional[asyncio.Task]
+    autoplay: bool
+    reserved: List[Optional[str]]
+    keep_until: float
+    log: Optional[GameLog]
+    state_handle: Optional[asyncio.TimerHandle]
+    state_first: float
+    spectators: set
+    spectator_state: Dict
 
-    def __init__(self):
+    def __init__(self, name: str = '', bots: Optional[Bots] = None, scheduler: Optional[Scheduler] = None,
+                 log: Optional[GameLog] = None):
+        self.name = name
         self.players = [None]*4
-        self.game = Game(primary_player=0)
+        self.log = log
+        self._game = None
+        self.bots = Bots() if bots is None else bots
+        self.scheduler = Scheduler() if scheduler is None else scheduler
+        self.bot_task = None
+        self.autoplay = False
+        # Names of the players seated before a restart or a disconnect, they get their seats back by name
+        self.reserved = [None]*4
+        self.keep_until = 0.
+        self.state_handle = None
+        self.state_first = 0.
+        # Spectators share one public state, which is encoded once per update for all of them
+        self.spectators = set()
+        self.spectator_state = {}
+
+    @property
+    def game(self) -> Game:
+        # Dealt on first use, restored tables get their game from the snapshot instead
+        if self._game is None:
+            self.new_game(primary_player=0)
+        return self._game
+
+    @game.setter
+    def game(self, game: Game):
+        self._game = game
 
-    async def send_state(self, playerIDs = range(4)):
-        tasks = []
+    def new_game(self, primary_player: int):
+        self.game = Game(primary_player=primary_player)
+        if self.log is not None:
+            self.log.start(self.game, self.name)
+
+    def send_state(self, playerIDs = range(4)):
+        # Only queues the updates, see Outbox
+        t = time.perf_counter()
+        if self.state_handle is not None:
+            self.state_handle.cancel()
+            self.state_handle = None
+        groups = self.game.take_changes()
+        encoders = {False: StateEncoder(), True: BinaryStateEncoder()}
         for playerid in playerIDs:
             player = self.players[playerid]
-            if player is None:
+            if player is None or isinstance(player, BotPlayer):
                 continue
             else:
-                old_state = player.data['state']
-                msg = self.game.get_state_update(playerid=playerid, players=self.players, old_state=old_state)
-                player.data['state'] = self.game.get_state(playerid=playerid, players=self.players)
+                # get_state_update keeps player.data['state'] up to date
+                msg = self.game.get_state_update(playerid=playerid, players=self.players,
+                                                 old_state=player.data['state'], groups=groups)
                 if msg:
-                    tasks.append(asyncio.create_task(player.send(json.dumps(msg))))
-        if tasks:
-            await asyncio.wait(tasks)
+                    encoded = encoders[player.outbox.binary].encode(msg)
+                    PYTAROCK_BROADCAST_BYTES.observe(len(encoded) if player.outbox.binary
+                                                     else len(encoded.encode('utf-8')))
+                    player.outbox.put(msg, encoded)
+        if self.spectators:
+            msg = self.game.get_state_update(playerid=0, players=self.players, old_state=self.spectator_state,
+                                             groups=groups, public=True)
+            if msg:
+                # Encoded at most once per wire format
+                encoded = {}
+                for spectator in self.spectators:
+                    binary = spectator.outbox.binary
+                    if binary not in encoded:
+                        encoded[binary] = encoders[binary].encode(msg)
+                    spectator.outbox.put(msg, encoded[binary])
+        PYTAROCK_BROADCAST_SECONDS.observe(time.perf_counter() - t)
 
-    async def remove(self, player):
+    def schedule_state(self):
+        # Sends the state once no further action arrived for scheduler.window seconds, see Scheduler
+        window = self.scheduler.window
+        if window <= 0:
+            self.send_state()
+            return
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        if self.state_handle is None:
+            self.state_first = now
+        else:
+            self.state_handle.cancel()
+        self.state_handle = loop.call_at(min(now + window, self.state_first + self.scheduler.max_window),
+                                         self.send_state)
+
+    async def remove(self, player, reserve: bool = False):
+        # With reserve, the seat is kept for the player to reconnect (see claim_seat)
         if player.data['table'] != self:
             raise IllegalPlay('Player is not at this table')
         player.data['table'] = None
         i = self.players.index(player)
         self.players[i] = None
-        await self.send_state()
+        if reserve:
+            self.reserved[i] = player.data['name']
+        self.game.touch('names')
+        self.send_state()
 
     async def add(self, player):
         player.data = dict()
-        if len(self) >= 4:
+        free = [idx for idx in range(4) if self.players[idx] is None and self.reserved[idx] is None]
+        if not free:
+            free = [idx for idx in range(4) if self.players[idx] is None]
+        if not free:
+            # Humans take over seats from bots
+            free = [idx for idx in range(4) if isinstance(self.players[idx], BotPlayer)]
+        if not free:
             raise IllegalPlay('This table is already full.')
-        i = choice([idx for idx in range(4) if self.players[idx] is None])
+        i = choice(free)
         self.players[i] = player
+        self.reserved[i] = None
         player.data['table'] = self
         player.data['name'] = f'Spieler {i+1}'
         player.data['i'] = i
         player.data['state'] = {}
-        await self.send_state()
+        self.game.touch('names')
+        self.send_state()
+
+    def add_spectator(self, websocket):
+        websocket.data = {'table': self, 'spectator': True}
+        # Later updates are computed against spectator_state, so every spectator starts from it
+        if self.spectators:
+            # Sends the pending changes to the others first, spectator_state is then up to date
+            self.send_state()
+        else:
+            self.spectator_state = self.game.get_state(playerid=0, players=self.players, public=True)
+        self.spectators.add(websocket)
+        websocket.outbox.put(dict(self.spectator_state))
+
+    def remove_spectator(self, websocket):
+        self.spectators.discard(websocket)
+        websocket.data['table'] = None
+        if not self.spectators:
+            # Not updated without spectators, the next one starts from a new state
+            self.spectator_state = {}
+
+    def claim_seat(self, player):
+        # Moves a player to the free seat reserved for their name
+        name = player.data['name']
+        for i in range(4):
+            if self.players[i] is None and self.reserved[i] == name:
+                self.players[player.data['i']] = None
+                self.players[i] = player
+                self.reserved[i] = None
+                player.data['i'] = i
+                player.data['state'] = {}
+                self.game.touch('names')
+                return
+
+    def add_bot(self, i: int, name: Optional[str] = None):
+        player = BotPlayer()
+        player.data['table'] = self
+        player.data['name'] = f'Bot {i+1}' if name is None else name
+        player.data['i'] = i
+        player.data['state'] = {}
+        self.players[i] = player
+        self.reserved[i] = None
+
+    async def add_bots(self):
+        for i in range(4):
+            if self.players[i] is None:
+                self.add_bot(i)
+        self.game.touch('names')
+        self.send_state()
+
+    def snapshot(self) -> Dict:
+        seats = []
+        for player, reserved in zip(self.players, self.reserved):
+            if player is None:
+                seats.append(None if reserved is None else {'name': reserved})
+            else:
+                seats.append({'name': player.data['name'], 'bot': isinstance(player, BotPlayer)})
+        return {'game': self.game.snapshot(), 'seats': seats}
+
+    def restore(self, data: Dict, keep: float):
+        # Humans are not connected after a restart, the table is kept for keep seconds for them to return
+        self.game = Game.from_snapshot(data['game'])
+        # The game was logged from its start before the restart
+        self.game.log = self.log
+        for i, seat in enumerate(data['seats']):
+            if seat is None:
+                continue
+            if seat.get('bot'):
+                self.add_bot(i, seat['name'])
+            else:
+                self.reserved[i] = seat['name']
+        self.keep_until = time.monotonic() + keep
+
+    def is_bot(self, playerid: Optional[int]) -> bool:
+        return playerid is not None and isinstance(self.players[playerid], BotPlayer)
+
+    async def bot_step(self, playerid: Optional[int] = None) -> bool:
+        # Makes one move for playerid (or for any bot that is due) and returns False if there was none
+        game = self.game
+        primary = game.primary_player
+        if playerid is None and self.is_bot(primary):
+            if game.game_stage is GameStage.PREGAME:
+                game.set_game_type(bot.choose_game_type(game, primary))
+                return True
+            if game.game_stage is GameStage.TYPESELECTED and game.game_type is not GameType.NEGATIVE \
+                    and all(game.talons_in_center):
+                if not game.talons_uncovered:
+                    game.uncover_talon(primary)
+                else:
+                    game.take_talon(primary, bot.choose_talon(game, primary))
+                return True
+        if game.game_stage is GameStage.TALONTAKEN:
+            seat = primary
+        elif game.move is None and game.game_stage is GameStage.TYPESELECTED:
+            seat = primary
+        else:
+            seat = game.move
+        if seat is None or (playerid is None and not self.is_bot(seat)) or (playerid is not None and seat != playerid):
+            return False
+        if not game.legal_moves(seat):
+            return False
+        card = await self.bots.choose_card(game, seat)
+        if self.game is not game or card not in game.legal_moves(seat):
+            # The game went on while the bot was thinking
+            return True
+        game.play_card(seat, card)
+        return True
+
+    async def autoplay_step(self) -> bool:
+        if self.game.move is None:
+            return False
+        if self.bots.autoplay:
+            return await self.bot_step(self.game.move)
+        return self.game.autoplay()
+
+    def run_bots(self):
+        # Moves for bots and autoplay are made in the background, one task per table
+        if self.bot_task is None or self.bot_task.done():
+            self.bot_task = asyncio.create_task(self._run_bots())
+
+    def stop_autoplay(self):
+        if self.autoplay and self.bot_task is not None:
+            self.bot_task.cancel()
+            self.bot_task = None
+        self.autoplay = False
+
+    async def _run_bots(self):
+        PYTAROCK_BOT_TASKS.inc()
+        try:
+            while self:
+                async with self.scheduler.limit:
+                    moved = await self.bot_step() or (self.autoplay and await self.autoplay_step())
+                if not moved:
+                    break
+                self.schedule_state()
+                await asyncio.sleep(self.scheduler.delay)
+            self.autoplay = False
+        except IllegalPlay as ex:
+            self.autoplay = False
+            logger.warning(f'Bot made an illegal move: {ex!s}')
+        finally:
+            PYTAROCK_BOT_TASKS.dec()
 
     def __len__(self):
         return sum([0 if x is None else 1 for x in self.players])
 
     def __bool__(self):
-        return len(self) != 0
+        # Tables without humans are deleted, even if bots are still seated
+        return any([x is not None and not isinstance(x, BotPlayer) for x in self.players])
 
 class WSGame:
     tables: Dict[str, Table]
@@ -76,55 +483,114 @@ class WSGame:
                         'negative': GameType.NEGATIVE,
                         'colorgame': GameType.COLORGAME,
                         'sechserdreier': GameType.SECHSERDREIER}
-    suits = {'H': Suit.HEARTS,
-             'C': Suit.CLUBS,
-             'S': Suit.SPADES,
-             'D': Suit.DIAMONDS,
-             'T': Suit.TAROCK}
 
-    def __init__(self):
-        self.tables = defaultdict(Table)
+    # Messages by which a human takes over from autoplay
+    actions = ('ouvert', 'select_gametype', 'take_talon', 'move', 'claim', 'teams', 'new_game', 'finish_game')
+    # Message types with their own label in the metrics
+    message_types = actions + ('my_name', 'autoplay', 'add_bots')
 
-    async def unregister(self, websocket):
-        if websocket.data['table'] is not None:
-            await websocket.data['table'].remove(websocket)
-            PYTAROCK_PLAYERS.dec()
-        websocket.data['table'] = None
-        for tablename in list(self.tables.keys()):
-            if not self.tables[tablename]:
-                logger.debug(f'Deleted table "{tablename}"')
-                del self.tables[tablename]
+    def __init__(self, bots: Optional[Bots] = None, scheduler: Optional[Scheduler] = None,
+                 log: Optional[GameLog] = None, max_pending: int = 200, grace: float = 0.):
+        self.bots = Bots() if bots is None else bots
+        self.scheduler = Scheduler() if scheduler is None else scheduler
+        self.log = log
+        self.max_pending = max_pending
+        self.grace = grace
+        self.tables = dict()
+        # Tables without humans that are kept until the given time, see reap()
+        self.idle = dict()
+
+    def table(self, name: str) -> Table:
+        # Returns the table name, a new one if there is none yet
+        table = self.tables.get(name)
+        if table is None:
+            table = self.tables[name] = Table(name=name, bots=self.bots, scheduler=self.scheduler, log=self.log)
+        return table
+
+    def delete(self, name: str):
+        self.tables.pop(name).stop_autoplay()
+        self.idle.pop(name, None)
+        logger.debug(f'Deleted table "{name}"')
         PYTAROCK_TABLES.set(len(self.tables))
 
+    def release(self, table: Table):
+        # Called when a human or spectator left table; only this table is checked, not the whole server
+        if table or table.spectators:
+            return
+        table.keep_until = max(table.keep_until, time.monotonic() + self.grace)
+        if time.monotonic() >= table.keep_until:
+            self.delete(table.name)
+        else:
+            self.idle[table.name] = table.keep_until
+
+    async def reap(self, interval: float = 1.):
+        # Deletes the idle tables nobody returned to in time
+        while True:
+            await asyncio.sleep(interval)
+            now = time.monotonic()
+            for name, keep_until in list(self.idle.items()):
+                table = self.tables.get(name)
+                if table is None or table or table.spectators:
+                    del self.idle[name]
+                elif now >= keep_until:
+                    self.delete(name)
+
+    async def unregister(self, websocket):
+        data = getattr(websocket, 'data', {})
+        table = data.get('table')
+        if table is not None:
+            if data.get('spectator'):
+                table.remove_spectator(websocket)
+                PYTAROCK_SPECTATORS.dec()
+            else:
+                await table.remove(websocket, reserve=self.grace > 0)
+                PYTAROCK_PLAYERS.dec()
+            self.release(table)
+
     async def user_exception(self, websocket, msg):
-        task = asyncio.create_task(websocket.send(json.dumps({'alertmsg': msg})))
-        await asyncio.wait([task])
+        websocket.outbox.put({'alertmsg': msg}, merge=False)
 
     async def register(self, websocket, path: str):
-        name = path.split('/')[-1]
+        name = table_name(path)
         if not name:
             raise IllegalPlay('Table name must not be empty.')
         websocket.data = dict()
-        table = self.tables[name]
+        table = self.table(name)
+        self.idle.pop(name, None)
         PYTAROCK_TABLES.set(len(self.tables))
+        if spectating(path):
+            table.add_spectator(websocket)
+            PYTAROCK_SPECTATORS.inc()
+            return
         await table.add(websocket)
+        table.run_bots()
         PYTAROCK_PLAYERS.inc()
-        logger.debug(f'Current tables: {self.tables.keys()!s}')
+        logger.debug(f'Player joined table "{name}", {len(self.tables)!s} tables')
 
     async def __call__(self, websocket, path):
         # register(websocket) sends user_event() to websocket
+        websocket.outbox = Outbox(websocket, max_pending=self.max_pending)
         try:
             await self.register(websocket, path)
         except IllegalPlay as ex:
             await self.user_exception(websocket, str(ex))
         try:
             async for message in websocket:
+                if websocket.data.get('spectator'):
+                    # Spectators cannot act
+                    continue
+                t = time.perf_counter()
                 data = json.loads(message)
                 logger.debug(f"event: {data}")
+                kind = next((key for key in data if key in self.message_types), 'other')
                 table = websocket.data['table']
                 try:
+                    if any(action in data for action in self.actions):
+                        table.stop_autoplay()
                     if 'my_name' in data:
                         websocket.data['name'] = data['my_name']
+                        table.game.touch('names')
+                        table.claim_seat(websocket)
                     if 'ouvert' in data:
                         if websocket.data['i'] != table.game.primary_player:
                             raise IllegalPlay('Only the primary player can select ouvert.')
@@ -138,41 +604,340 @@ class WSGame:
                     if 'take_talon' in data:
                         table.game.take_talon(websocket.data['i'], data['take_talon'])
                     if 'move' in data:
-                        card_s = data['move']
-                        card = Card(suit=self.suits[card_s[0]], value=int(card_s[1:]))
+                        card = Card.from_enc_str(data['move'])
                         table.game.play_card(websocket.data['i'], card)
+                    if 'claim' in data:
+                        # Plays out the remaining tricks if they are certain to go to the player
+                        endgame.claim(table.game, websocket.data['i'])
                     if 'autoplay' in data:
-                        a = True
-                        while a:
-                            a = table.game.autoplay()
-                            await table.send_state()
-                            await asyncio.sleep(0.1)
+                        table.autoplay = True
+                    if 'add_bots' in data:
+                        await table.add_bots()
                     if 'teams' in data:
                         teams = data['teams']
+                        if not isinstance(teams, list):
+                            raise IllegalPlay('Each player and talon needs to be in team 0 or 1.')
                         teams1 = deque(teams[:4])
                         teams1.rotate(websocket.data['i'])
-                        table.game.teams = list(teams1) + teams[4:]
-                        table.game.calculate_score()
+                        table.game.set_teams(list(teams1) + teams[4:])
                     if 'new_game' in data:
                         if table.game.game_stage != GameStage.POSTGAME:
                             raise IllegalPlay('Game is not finished yet.')
                         new_primary = (table.game.primary_player + 1) % 4
-                        table.game = Game(primary_player=new_primary)
+                        table.new_game(primary_player=new_primary)
+                        logger.debug(f'New game with seed {table.game.seed!s}')
                     if 'finish_game' in data:
                         if table.game.primary_player != websocket.data['i']:
                             raise IllegalPlay('Only the primary player can end the game.')
-                        table.game.game_stage = GameStage.POSTGAME
-                        table.game.calculate_score()
+                        table.game.finish_game()
 
-                    await table.send_state()
+                    PYTAROCK_MESSAGE_SECONDS.labels(kind).observe(time.perf_counter() - t)
+                    table.schedule_state()
+                    table.run_bots()
 
                 except IllegalPlay as ex:
+                    PYTAROCK_MESSAGE_SECONDS.labels(kind).observe(time.perf_counter() - t)
                     await self.user_exception(websocket, str(ex))
 
         finally:
+            websocket.outbox.close()
             await self.unregister(websocket)
 
 
+def table_name(path: str) -> str:
+    return path.split('?')[0].split('/')[-1]
+
+
+def spectating(path: str) -> bool:
+    # Spectators connect to the path of the table with ?watch
+    return 'watch' in path.partition('?')[2].split('&')
+
+
+def shard(name: str, processes: int) -> int:
+    return zlib.crc32(name.encode('utf-8')) % processes
+
+
+class Snapshots:
+    # Writes all tables to a file every few seconds and on shutdown, a restarted server resumes from it.
+    # Each table is one line of JSON, which is only encoded again after the table changed.
+    path: str
+    interval: float
+    keep: float
+    lines: Dict[str, Tuple[Game, int, bytes]]
+    stale: List[str]
+
+    def __init__(self, path: str, interval: float = 5., keep: float = 600.):
+        self.path = path
+        self.interval = interval
+        self.keep = keep
+        self.lines = {}
+        self.stale = []
+
+    @staticmethod
+    def files(path: str) -> List[str]:
+        # The snapshot itself and the ones of the processes of a sharded server, named path.<number>;
+        # other files such as backups next to it are left alone
+        shards = [f for f in glob.glob(glob.escape(path) + '.*') if re.fullmatch(r'\.\d+', f[len(path):])]
+        files = [path] + sorted(shards, key=lambda f: int(f[len(path) + 1:]))
+        return [f for f in files if os.path.isfile(f)]
+
+    @staticmethod
+    def read(path: str) -> List[bytes]:
+        lines = []
+        for filename in Snapshots.files(path):
+            with open(filename, 'rb') as f:
+                lines.extend(line for line in f.read().split(b'\n') if line)
+        return lines
+
+    @staticmethod
+    def write_file(path: str, data: bytes):
+        # Replaces the file atomically, so a crash leaves the previous snapshot intact
+        with open(path + '.tmp', 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(path + '.tmp', path)
+
+    def load(self, wsgame: 'WSGame'):
+        for line in self.read(self.path):
+            try:
+                name, data = json.loads(line)
+                table = Table(name=name, bots=wsgame.bots, scheduler=wsgame.scheduler)
+                table.log = wsgame.log
+                table.restore(data, self.keep)
+            except (ValueError, KeyError, TypeError, IllegalPlay) as ex:
+                logger.warning(f'Could not restore a table from the snapshot: {ex!r}')
+                continue
+            wsgame.tables[name] = table
+            wsgame.idle[name] = table.keep_until
+            self.lines[name] = (table.game, table.game.version, line)
+        self.stale = [f for f in self.files(self.path) if f != self.path]
+        PYTAROCK_TABLES.set(len(wsgame.tables))
+        logger.info(f'Restored {len(wsgame.tables)!s} tables from {self.path!s}')
+
+    def dump(self, tables: Dict[str, Table]) -> bytes:
+        lines = {}
+        for name, table in tables.items():
+            cached = self.lines.get(name)
+            if cached is not None and cached[0] is table.game and cached[1] == table.game.version:
+                lines[name] = cached
+            else:
+                line = json.dumps([name, table.snapshot()], separators=(',', ':')).encode('utf-8')
+                lines[name] = (table.game, table.game.version, line)
+        self.lines = lines
+        return b''.join(line + b'\n' for _, _, line in lines.values())
+
+    def write(self, data: bytes):
+        self.write_file(self.path, data)
+        for filename in self.stale:
+            os.remove(filename)
+        self.stale = []
+
+    def save(self, tables: Dict[str, Table]):
+        self.write(self.dump(tables))
+
+    async def run(self, tables: Dict[str, Table]):
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(self.interval)
+            t = time.monotonic()
+            data = self.dump(tables)
+            await loop.run_in_executor(None, self.write, data)
+            logger.debug(f'Snapshot of {len(tables)!s} tables ({len(data)!s} bytes) in {time.monotonic() - t:.3f}s')
+
+
+def split_snapshots(path: str, processes: int):
+    # Sorts the tables of the snapshots into one file per worker process of a sharded server
+    shards = [[] for _ in range(processes)]
+    for line in Snapshots.read(path):
+        try:
+            name = json.loads(line)[0]
+        except (ValueError, IndexError):
+            continue
+        shards[shard(name, processes)].append(line)
+    old = Snapshots.files(path)
+    new = [f'{path!s}.{i!s}' for i in range(processes)]
+    for filename, lines in zip(new, shards):
+        Snapshots.write_file(filename, b''.join(line + b'\n' for line in lines))
+    for filename in old:
+        if filename not in new:
+            os.remove(filename)
+
+
+class Asset:
+    # A file served from memory, with its compressed variants
+    body: bytes
+    content_type: str
+    etag: str
+    version: str
+    encodings: Dict[str, bytes]
+
+    # Compressing only pays off for text, the images are compressed already
+    compressible = ('text/', 'application/javascript', 'application/json', 'image/svg+xml')
+
+    def __init__(self, body: bytes, content_type: str):
+        self.body = body
+        self.content_type = content_type
+        self.version = hashlib.sha1(body).hexdigest()[:12]
+        self.etag = f'"{self.version!s}"'
+        self.encodings = {}
+        if content_type.startswith(self.compressible):
+            if brotli is not None:
+                self.encodings['br'] = brotli.compress(body)
+            self.encodings['gzip'] = gzip.compress(body, compresslevel=9, mtime=0)
+            self.encodings = {k: v for k, v in self.encodings.items() if len(v) < len(body)}
+
+
+class StaticFiles:
+    # Serves the web frontend from memory on the port of the websocket server.
+    # References between the files in HTML and CSS get the version of the referenced file appended
+    # (?v=...), responses to such URLs may be cached for a year. Other files are revalidated by ETag.
+    root: str
+    max_age: int
+    files: Dict[str, Asset]
+
+    references = re.compile(rb'((?:href|src)="|url\("?)([^"():?#]+)')
+
+    def __init__(self, root: str, max_age: int = 3600):
+        self.root = root
+        self.max_age = max_age
+        self.files = {}
+        bodies = {}
+        for directory, _, filenames in os.walk(root):
+            for filename in filenames:
+                path = os.path.join(directory, filename)
+                with open(path, 'rb') as f:
+                    bodies[os.path.relpath(path, root).replace(os.sep, '/')] = f.read()
+        if 'img/cards.png' not in bodies:
+            # atlas.py was not run, build the sprite atlas here
+            png, manifest = atlas.build_atlas(os.path.join(root, 'img'))
+            bodies['img/cards.png'] = png
+            bodies['img/cards.json'] = json.dumps(manifest).encode('utf-8')
+            bodies['css/atlas.css'] = atlas.atlas_css(manifest).encode('utf-8')
+        # CSS refers to images and HTML to CSS, so the referenced files get their versions first
+        order = {'.css': 1, '.html': 2}
+        for path in sorted(bodies, key=lambda p: order.get(posixpath.splitext(p)[1], 0)):
+            body = bodies[path]
+            if path.endswith(('.css', '.html')):
+                body = self.references.sub(lambda m: m.group(1) + self.versioned(path, m.group(2)), body)
+            content_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+            if content_type.startswith('text/') or content_type == 'application/javascript':
+                content_type += '; charset=utf-8'
+            self.files[path] = Asset(body, content_type)
+        logger.info(f'Serving {len(self.files)!s} files from {root!s} '
+                    f'({sum(len(a.body) for a in self.files.values())!s} bytes)')
+
+    def versioned(self, path: str, reference: bytes) -> bytes:
+        target = posixpath.normpath(posixpath.join(posixpath.dirname(path), reference.decode('utf-8')))
+        asset = self.files.get(target)
+        if asset is None:
+            return reference
+        return reference + f'?v={asset.version!s}'.encode('ascii')
+
+    def response(self, path: str, headers) -> Tuple[http.HTTPStatus, List[Tuple[str, str]], bytes]:
+        path, _, query = path.partition('?')
+        path = posixpath.normpath('/' + path).lstrip('/')
+        if path in ('', '.'):
+            path = 'index.html'
+        asset = self.files.get(path)
+        if asset is None:
+            return http.HTTPStatus.NOT_FOUND, [('Content-Type', 'text/plain')], b'Not found\n'
+        if f'v={asset.version!s}' in query.split('&'):
+            cache = 'public, max-age=31536000, immutable'
+        elif path.endswith('.html'):
+            cache = 'no-cache'
+        else:
+            cache = f'public, max-age={self.max_age!s}'
+        response_headers = [('ETag', asset.etag), ('Cache-Control', cache)]
+        if asset.encodings:
+            response_headers.append(('Vary', 'Accept-Encoding'))
+        if asset.etag in headers.get('If-None-Match', ''):
+            return http.HTTPStatus.NOT_MODIFIED, response_headers, b''
+        body = asset.body
+        accepted = [e.split(';')[0].strip() for e in headers.get('Accept-Encoding', '').split(',')]
+        for encoding in ('br', 'gzip'):
+            if encoding in asset.encodings and encoding in accepted:
+                body = asset.encodings[encoding]
+                response_headers.append(('Content-Encoding', encoding))
+                break
+        response_headers.append(('Content-Type', asset.content_type))
+        return http.HTTPStatus.OK, response_headers, body
+
+    async def process_request(self, path: str, headers):
+        # Hook of websockets.serve: websocket connections go on to the handshake, the rest is served here
+        if headers.get('Upgrade', '').lower() == 'websocket':
+            return None
+        return self.response(path, headers)
+
+
+async def pipe(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    try:
+        while True:
+            data = await reader.read(65536)
+            if not data:
+                break
+            writer.write(data)
+            await writer.drain()
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+
+
+class Router:
+    # Front of the sharded server: forwards each connection to the worker that owns its table
+    # and answers requests for static files itself
+    socket_paths: List[str]
+    static: Optional[StaticFiles]
+
+    def __init__(self, socket_paths: List[str], static: Optional[StaticFiles] = None):
+        self.socket_paths = socket_paths
+        self.static = static
+
+    def worker(self, path: str) -> int:
+        # Every player of a table lands on the same worker
+        return shard(table_name(path), len(self.socket_paths))
+
+    async def __call__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            request = await reader.readuntil(b'\r\n\r\n')
+            path = request.split(b' ', 2)[1].decode('latin-1')
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, IndexError, ConnectionError):
+            writer.close()
+            return
+        if self.static is not None:
+            headers = Headers()
+            for line in request.decode('latin-1').split('\r\n')[1:]:
+                name, sep, value = line.partition(':')
+                if sep:
+                    headers[name.strip()] = value.strip()
+            if headers.get('Upgrade', '').lower() != 'websocket':
+                await self.send_static(writer, *self.static.response(path, headers))
+                return
+        worker = self.worker(path)
+        try:
+            worker_reader, worker_writer = await asyncio.open_unix_connection(self.socket_paths[worker])
+        except OSError as ex:
+            logger.warning(f'Worker {worker!s} is not reachable: {ex!s}')
+            writer.close()
+            return
+        worker_writer.write(request)
+        await asyncio.gather(pipe(reader, worker_writer), pipe(worker_reader, writer))
+
+    @staticmethod
+    async def send_static(writer: asyncio.StreamWriter, status: http.HTTPStatus, headers: List[Tuple[str, str]],
+                          body: bytes):
+        head = f'HTTP/1.1 {status.value!s} {status.phrase!s}\r\n'
+        for name, value in headers + [('Content-Length', str(len(body))), ('Connection', 'close')]:
+            head += f'{name!s}: {value!s}\r\n'
+        writer.write(head.encode('latin-1') + b'\r\n' + body)
+        try:
+            await writer.drain()
+        except ConnectionError:
+            pass
+        writer.close()
+
+
 def get_args(args=None):
     parser = argparse.ArgumentParser(description='Start the Tarock WebSocket Server')
     parser.add_argument('host', type=str, default='localhost', nargs='?',
@@ -181,10 +946,159 @@ def get_args(args=None):
                         help='port to listen on')
     parser.add_argument('--debug', action='store_true',
                         help='activate debug messages')
+    parser.add_argument('--bot-time', type=float, default=0.5,
+                        help='seconds a bot may think per move')
+    parser.add_argument('--bot-workers', type=int, default=2,
+                        help='worker processes for bots (0: think in a thread, one bot at a time)')
+    parser.add_argument('--bot-autoplay', action='store_true',
+                        help='let the bot choose the autoplay moves instead of playing the first legal card')
+    parser.add_argument('--autoplay-delay', type=float, default=0.1,
+                        help='seconds between two moves made by bots or autoplay')
+    parser.add_argument('--broadcast-window', type=float, default=0.005,
+                        help='seconds to wait for further actions before sending the state of a table (0: no wait)')
+    parser.add_argument('--max-broadcast-delay', type=float, default=0.025,
+                        help='maximum seconds a state is held back by --broadcast-window')
+    parser.add_argument('--max-autoplay', type=int, default=8,
+                        help='maximum number of tables computing a bot or autoplay move at once (per process)')
+    parser.add_argument('--processes', type=int, default=1,
+                        help='number of worker processes, tables are distributed by name')
+    parser.add_argument('--snapshot', type=str, default=None,
+                        help='file to save the tables to and to restore them from on startup')
+    parser.add_argument('--snapshot-interval', type=float, default=5.,
+                        help='seconds between two snapshots')
+    parser.add_argument('--game-log', type=str, default=None,
+                        help='file to append all game actions to (see python -m tarockgame.gamelog)')
+    parser.add_argument('--max-pending', type=int, default=200,
+                        help='number of state updates a client may fall behind before it is disconnected')
+    parser.add_argument('--table-grace', type=float, default=0.,
+                        help='seconds a table is kept after the last player left, for players to reconnect')
+    parser.add_argument('--htdocs', type=str, default=None,
+                        help='serve the web frontend from this directory (e.g. htdocs) on the same port')
+    parser.add_argument('--static-max-age', type=int, default=3600,
+                        help='seconds browsers may cache static files requested without version')
+    parser.add_argument('--metrics-port', type=int, default=8000,
+                        help='port of the Prometheus metrics (0: no metrics server)')
 
     return parser.parse_args(args=args)
 
 
+def make_game(args, log: Optional[GameLog] = None) -> WSGame:
+    return WSGame(bots=Bots(budget=args.bot_time, workers=args.bot_workers, autoplay=args.bot_autoplay),
+                  scheduler=Scheduler(delay=args.autoplay_delay, max_tasks=args.max_autoplay,
+                                      window=args.broadcast_window, max_window=args.max_broadcast_delay),
+                  log=log, max_pending=args.max_pending, grace=args.table_grace)
+
+
+async def measure_loop_lag(interval: float = 0.25):
+    # A busy event loop wakes this task up late, which delays every table of the process
+    loop = asyncio.get_running_loop()
+    while True:
+        t = loop.time()
+        await asyncio.sleep(interval)
+        PYTAROCK_LOOP_LAG.observe(max(0., loop.time() - t - interval))
+
+
+async def flush_log(log: GameLog, interval: float = 1.):
+    while True:
+        await asyncio.sleep(interval)
+        log.flush()
+
+
+def run_server(args, serve, snapshot: Optional[str] = None, game_log: Optional[str] = None):
+    # serve(wsgame) returns the server to run; the tables are saved to snapshot when the loop ends
+    log = None if game_log is None else GameLog(game_log)
+    mygame = make_game(args, log)
+    snapshots = None
+    if snapshot is not None:
+        snapshots = Snapshots(snapshot, interval=args.snapshot_interval)
+        snapshots.load(mygame)
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    loop.run_until_complete(serve(mygame))
+    if snapshots is not None:
+        loop.create_task(snapshots.run(mygame.tables))
+    if log is not None:
+        loop.create_task(flush_log(log))
+    loop.create_task(measure_loop_lag())
+    loop.create_task(mygame.reap())
+    loop.add_signal_handler(signal.SIGTERM, loop.stop)
+    try:
+        loop.run_forever()
+    finally:
+        if snapshots is not None:
+            snapshots.save(mygame.tables)
+            logger.info(f'Saved {len(mygame.tables)!s} tables to {snapshot!s}')
+        if log is not None:
+            log.close()
+
+
+def run_worker(args, index: int, socket_path: str):
+    logging.basicConfig(level=logging.DEBUG if args.debug else logging.INFO)
+    snapshot = None if args.snapshot is None else f'{args.snapshot!s}.{index!s}'
+    game_log = None if args.game_log is None else f'{args.game_log!s}.{index!s}'
+    run_server(args, lambda mygame: websockets.unix_serve(mygame, socket_path, subprotocols=SUBPROTOCOLS),
+               snapshot, game_log)
+
+
+def run_sharded(args):
+    # The workers are spawned after PROMETHEUS_MULTIPROC_DIR is set, so their metrics are
+    # written to files that the front process collects
+    if 'PROMETHEUS_MULTIPROC_DIR' not in os.environ:
+        os.environ['PROMETHEUS_MULTIPROC_DIR'] = tempfile.mkdtemp(prefix='pytarock-metrics-')
+    socket_dir = tempfile.mkdtemp(prefix='pytarock-')
+    socket_paths = [os.path.join(socket_dir, f'worker{i!s}.sock') for i in range(args.processes)]
+    if args.snapshot is not None:
+        split_snapshots(args.snapshot, args.processes)
+    context = multiprocessing.get_context('spawn')
+    workers = [context.Process(target=run_worker, args=(args, i, path), name=f'pytarock-worker-{i!s}')
+               for i, path in enumerate(socket_paths)]
+    for worker in workers:
+        worker.start()
+
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    if args.metrics_port:
+        start_http_server(args.metrics_port, registry=registry)
+
+    async def serve():
+        while not all(os.path.exists(path) for path in socket_paths):
+            if not all(worker.is_alive() for worker in workers):
+                raise RuntimeError('A worker process failed to start.')
+            await asyncio.sleep(0.1)
+        server = await asyncio.start_server(Router(socket_paths, make_static(args)), args.host, args.port)
+        stop = asyncio.Event()
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, stop.set)
+        async with server:
+            await stop.wait()
+            # Stop the workers before their connections are closed, so they save the tables with the players seated
+            for worker in workers:
+                worker.terminate()
+            for worker in workers:
+                await asyncio.get_running_loop().run_in_executor(None, worker.join)
+
+    try:
+        asyncio.run(serve())
+    finally:
+        for worker in workers:
+            worker.terminate()
+        for worker in workers:
+            worker.join()
+            multiprocess.mark_process_dead(worker.pid)
+        for path in socket_paths:
+            if os.path.exists(path):
+                os.remove(path)
+        os.rmdir(socket_dir)
+
+
+def make_static(args) -> Optional[StaticFiles]:
+    if args.htdocs is None:
+        return None
+    if not args.debug:
+        # websockets logs every plain HTTP request as a failed connection
+        logging.getLogger('websockets.server').setLevel(logging.WARNING)
+    return StaticFiles(args.htdocs, max_age=args.static_max_age)
+
+
 def main(args=None):
     if args is None:
         args = get_args()
@@ -193,13 +1107,17 @@ def main(args=None):
 
     logger.info(f'Starting server at {args.host!s}:{args.port!s}')
 
+    if args.processes > 1:
+        run_sharded(args)
+        return
 
-    mygame = WSGame()
-    start_http_server(8000)
-    start_server = websockets.serve(mygame, args.host, args.port)
-
-    asyncio.get_event_loop().run_until_complete(start_server)
-    asyncio.get_event_loop().run_forever()
+    if args.metrics_port:
+        start_http_server(args.metrics_port)
+    static = make_static(args)
+    process_request = None if static is None else static.process_request
+    run_server(args, lambda mygame: websockets.serve(mygame, args.host, args.port, subprotocols=SUBPROTOCOLS,
+                                                                process_request=process_request),
+               args.snapshot, args.game_log)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+# *-* encoding: utf-8 *-*
+
+# Packs the card images of htdocs/img into one sprite atlas, so that the browser loads one image
+# instead of 55. The images are stacked vertically in img/cards.png, their positions are written to
+# img/cards.json and the CSS classes of the cards to css/atlas.css. Run it after changing a card image.
+# All images need the same size and format; their scanlines are copied without decoding the pixels.
+
+import argparse
+import json
+import struct
+import zlib
+from os.path import join
+from typing import Dict, List, Tuple
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+SUITS = ('H', 'C', 'D', 'S')
+# Same order as the cards in tarockgame.cards.DECK, after the back of the cards
+NAMES = ['backside'] + [f'{suit!s}{rank!s}' for suit in SUITS for rank in range(1, 9)] + \
+        [f'T{rank!s}' for rank in range(1, 23)]
+# Bytes per pixel of 8-bit images by color type: grey, -, RGB, palette, grey+alpha, -, RGBA
+BYTES_PER_PIXEL = {0: 1, 2: 3, 3: 1, 4: 2, 6: 4}
+
+
+def read_png(path: str) -> Tuple[bytes, bytes]:
+    # Returns the header and the decompressed image data; ancillary chunks are dropped
+    with open(path, 'rb') as f:
+        data = f.read()
+    if not data.startswith(PNG_SIGNATURE):
+        raise ValueError(f'{path!s} is not a PNG file')
+    offset = len(PNG_SIGNATURE)
+    header = None
+    idat = []
+    while offset < len(data):
+        length, kind = struct.unpack_from('>I4s', data, offset)
+        chunk = data[offset + 8:offset + 8 + length]
+        if kind == b'IHDR':
+            header = chunk
+        elif kind == b'IDAT':
+            idat.append(chunk)
+        elif kind == b'PLTE':
+            raise ValueError(f'{path!s}: images with a palette are not supported')
+        offset += 12 + length
+    width, height, depth, color, _, _, interlace = struct.unpack('>IIBBBBB', header)
+    if depth != 8 or interlace or color not in BYTES_PER_PIXEL:
+        raise ValueError(f'{path!s}: only non-interlaced 8-bit images are supported')
+    return header, zlib.decompress(b''.join(idat))
+
+
+def first_row_independent(row: bytes, bpp: int) -> bytes:
+    # The filters Up, Average and Paeth of the first row refer to a row of zeros above the image,
+    # which is the last row of the previous image in the atlas. Rewrite them without that reference.
+    kind, line = row[0], bytearray(row[1:])
+    if kind == 2:
+        kind = 0
+    elif kind == 3:
+        for i in range(bpp, len(line)):
+            line[i] = (line[i] + (line[i - bpp] >> 1)) & 0xff
+        kind = 0
+    elif kind == 4:
+        # Paeth predicts the pixel to the left if the row above is zero, like Sub
+        kind = 1
+    return bytes([kind]) + bytes(line)
+
+
+def chunk(kind: bytes, data: bytes) -> bytes:
+    return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+
+
+def build_atlas(img_dir: str) -> Tuple[bytes, Dict]:
+    header = None
+    rows: List[bytes] = []
+    for name in NAMES:
+        image_header, data = read_png(join(img_dir, f'{name!s}.png'))
+        if header is None:
+            header = image_header
+        elif image_header != header:
+            raise ValueError(f'{name!s}.png differs in size or format from {NAMES[0]!s}.png')
+        width, height, _, color = struct.unpack('>IIBB', header[:10])
+        stride = 1 + width * BYTES_PER_PIXEL[color]
+        rows.append(first_row_independent(data[:stride], BYTES_PER_PIXEL[color]) + data[stride:])
+    width, height = struct.unpack('>II', header[:8])
+    atlas_header = struct.pack('>II', width, height * len(NAMES)) + header[8:]
+    png = PNG_SIGNATURE + chunk(b'IHDR', atlas_header) + \
+        chunk(b'IDAT', zlib.compress(b''.join(rows), 9)) + chunk(b'IEND', b'')
+    manifest = {'image': 'cards.png',
+                'width': width,
+                'height': height,
+                'cards': {name: [0, i * height] for i, name in enumerate(NAMES)}}
+    return png, manifest
+
+
+def atlas_css(manifest: Dict) -> str:
+    # Percentages scale the atlas with the size of the card elements. Every card sets the atlas as its
+    # image, to take precedence over its single image in cards.css, which is the fallback without atlas.css.
+    n = len(manifest['cards'])
+    image = f'url("../img/{manifest["image"]!s}")'
+    lines = ['/* Generated by atlas.py */',
+             '.playingcard {',
+             f'    background-image: {image!s};',
+             f'    background-size: 100% {100 * n!s}%;',
+             '    background-position: 0 0;',
+             '}']
+    for i, name in enumerate(manifest['cards']):
+        if name == 'backside':
+            continue
+        position = 100 * i / (n - 1)
+        lines.append(f'.playingcard.{name[0].lower()!s}-{name[1:]!s} '
+                     f'{{ background-image: {image!s}; background-position: 0 {position:.4f}%; }}')
+    return '\n'.join(lines) + '\n'
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description='Pack the card images into one sprite atlas')
+    parser.add_argument('--htdocs', type=str, default='htdocs',
+                        help='directory of the web frontend')
+    args = parser.parse_args(args)
+
+    png, manifest = build_atlas(join(args.htdocs, 'img'))
+    with open(join(args.htdocs, 'img', manifest['image']), 'wb') as f:
+        f.write(png)
+    with open(join(args.htdocs, 'img', 'cards.json'), 'w') as f:
+        json.dump(manifest, f, indent=2)
+    with open(join(args.htdocs, 'css', 'atlas.css'), 'w') as f:
+        f.write(atlas_css(manifest))
+    print(f'Packed {len(manifest["cards"])!s} images into {manifest["image"]!s} ({len(png)!s} bytes)')
+
+
+if __name__ == '__main__':
+    main()
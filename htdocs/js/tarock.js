@@ -68,6 +68,14 @@ class GameConfig {
             self.finish_game()
         };
 
+        document.getElementById('claimButton').onclick = function () {
+            self.claim()
+        };
+
+        document.getElementById('addBots').onclick = function () {
+            self.add_bots()
+        };
+
         for (let i=0; i < 6; i++) {
             document.getElementById('points_'+i+'_A').onclick = function () {self.update_teams()};
             document.getElementById('points_'+i+'_B').onclick = function () {self.update_teams()};
@@ -80,10 +88,18 @@ class GameConfig {
         this.websocket.send(JSON.stringify({'new_game': true}));
     }
 
+    add_bots() {
+        this.websocket.send(JSON.stringify({'add_bots': true}));
+    }
+
     finish_game() {
         this.websocket.send(JSON.stringify({'finish_game': true}));
     }
 
+    claim() {
+        this.websocket.send(JSON.stringify({'claim': true}));
+    }
+
     update_teams() {
         let teams = [];
         for (let i=0; i < 6; i++) {
@@ -131,6 +147,15 @@ class GameConfig {
         this.websocket.send(JSON.stringify({'autoplay': true}))
     }
 
+    set_hand_strength(chances) {
+        // Chances to win with the dealt hand, in the order of the game types
+        let gametypes = ['positive', 'negative', 'colorgame', 'sechserdreier'];
+        for (let i = 0; i < gametypes.length; i++) {
+            document.getElementById('strength_' + gametypes[i]).textContent =
+                chances === null ? '' : ' (' + chances[i] + '%)';
+        }
+    }
+
     set_gametype(gametype) {
         document.getElementById('gametype').innerText = _(gametype);
         let stichecounter_visible = gametype === 'Negative';
@@ -382,6 +407,7 @@ class CardManager {
 
         document.getElementById('gametypebox').hidden = !(stage === 'pregame' && this.primary === 0);
         document.getElementById('gametype_info').hidden = (stage === 'pregame');
+        document.getElementById('claimButton').hidden = (stage !== 'ingame');
 
         document.getElementById('talon_a').hidden = (stage === 'ingame' || stage === 'postgame');
         document.getElementById('talon_b').hidden = (stage === 'ingame' || stage === 'postgame');
@@ -412,21 +438,93 @@ let nc = null;
 let t = new Translator();
 let _ = function (msg) {return t.translate(msg); };
 
-function preload_all_cards() {
-    suits = ["H", "D", "S", "C", "T"];
-    let max_rank = 8;
-    for (let k=0; k<suits.length; k++) {
-        suit = suits[k];
-        if (suit === 'T') {
-            max_rank = 22;
-        } else {
-            max_rank = 8;
+// Decoder of the binary state updates (websocket subprotocol tarock.bin.v1), see tarockgame/encoding.py
+const BINARY_KEYS = ['player_0', 'playerhand_1', 'playerhand_2', 'playerhand_3', 'talon_a', 'talon_b',
+    'move', 'played_0', 'played_1', 'played_2', 'played_3', 'stage', 'legal_moves', 'taken_0',
+    'taken_cards', 'post_talon_a', 'post_talon_b', 'teams', 'score', 'single_score', 'stiche',
+    'player_names', 'primary', 'gametype', 'alertmsg', 'running_score', 'hand_strength'];
+const utf8 = new TextDecoder();
+
+function card_name(index) {
+    if (index >= 32) {
+        return 'T' + (index - 31);
+    }
+    return 'HCDS'[index >> 3] + ((index & 7) + 1);
+}
+
+function decodeBinary(buffer) {
+    let bytes = new Uint8Array(buffer);
+    let offset = 0;
+    let varint = function () {
+        let n = 0;
+        let scale = 1;
+        while (true) {
+            let b = bytes[offset++];
+            n += (b & 0x7f) * scale;
+            scale *= 128;
+            if (b < 0x80) {
+                return n;
+            }
         }
-        for (let rank=1; rank <= max_rank; rank++) {
-            var img=new Image();
-            img.src="img/"+suit+rank+'.png';
+    };
+    let value = function () {
+        let kind = bytes[offset++];
+        switch (kind) {
+            case 0: return null;
+            case 1: return false;
+            case 2: return true;
+            case 3: {
+                let n = varint();
+                return n % 2 ? -(n + 1) / 2 : n / 2;
+            }
+            case 4: {
+                let n = varint();
+                offset += n;
+                return utf8.decode(bytes.subarray(offset - n, offset));
+            }
+            case 5: {
+                let cards = [];
+                for (let i = 0; i < 54; i++) {
+                    if (bytes[offset + (i >> 3)] & (1 << (i & 7))) {
+                        cards.push(card_name(i));
+                    }
+                }
+                offset += 7;
+                return cards;
+            }
+            case 6: {
+                let n = varint();
+                let cards = [];
+                for (let i = 0; i < n; i++) {
+                    let index = bytes[offset++];
+                    cards.push(index === 255 ? null : card_name(index));
+                }
+                return cards;
+            }
+            case 7: {
+                let n = varint();
+                let list = [];
+                for (let i = 0; i < n; i++) {
+                    list.push(value());
+                }
+                return list;
+            }
         }
+        throw new Error('Unknown type ' + kind);
+    };
+    let data = {};
+    while (offset < bytes.length) {
+        let tag = bytes[offset++];
+        let key = tag === 255 ? value() : BINARY_KEYS[tag];
+        data[key] = value();
     }
+    return data;
+}
+
+function preload_all_cards() {
+    // All cards are in one sprite atlas, see atlas.py
+    var img=new Image();
+    img.src="img/cards.png";
 }
 
 document.addEventListener("DOMContentLoaded", async function (event) {
@@ -434,7 +532,10 @@ document.addEventListener("DOMContentLoaded", async function (event) {
 
     await t.init();
 
-    table = window.location.search.substr(1);
+    // ?TABLE&watch opens the table as a spectator
+    let params = window.location.search.substr(1).split('&');
+    table = params[0];
+    let watch = params.includes('watch');
     if (table === '') {
         window.location.search = '?' + makeid(6)
         return;
@@ -443,8 +544,9 @@ document.addEventListener("DOMContentLoaded", async function (event) {
     // Figure out the correct URI for the WebSocket connection
     let url = null;
     let ws_hostname = location.hostname;
-    let proto = "wss://"
-    let port = ""
+    // The Python server can serve the page itself (--htdocs), then the websocket is on the same port
+    let proto = location.protocol === 'http:' ? "ws://" : "wss://"
+    let port = location.port ? ":" + location.port : ""
     if (location.hostname === 'localhost') {
         proto = "ws://"
         port = ":31426"
@@ -452,9 +554,11 @@ document.addEventListener("DOMContentLoaded", async function (event) {
     else if (location.hostname === 'www.tarock.link') {
         ws_hostname = "ws1.tarock.link"
     }
-    url = proto + ws_hostname + port + "/tarockws/" + table
+    url = proto + ws_hostname + port + "/tarockws/" + table + (watch ? "?watch" : "")
 
-    var websocket = new WebSocket(url);
+    // The server sends binary state updates if it supports them, JSON otherwise
+    var websocket = new WebSocket(url, ['tarock.bin.v1', 'tarock.json']);
+    websocket.binaryType = 'arraybuffer';
     var roomname_a = document.getElementById('roomname_a');
     roomname_a.textContent = table
     roomname_a.href = window.location.href;
@@ -463,7 +567,7 @@ document.addEventListener("DOMContentLoaded", async function (event) {
     nc = new GameConfig(websocket);
 
     websocket.onmessage = async function (event) {
-        let data = JSON.parse(event.data);
+        let data = event.data instanceof ArrayBuffer ? decodeBinary(event.data) : JSON.parse(event.data);
         if ('alertmsg' in data) {
             //alert(data.alertmsg);
             nc.errmsg(data.alertmsg);
@@ -515,6 +619,9 @@ document.addEventListener("DOMContentLoaded", async function (event) {
         if ('stiche' in data) {
             nc.set_stiche(data.stiche);
         }
+        if ('hand_strength' in data) {
+            nc.set_hand_strength(data.hand_strength);
+        }
 
     };
 
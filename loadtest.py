@@ -0,0 +1,288 @@
+#!/usr/bin/env python
+# *-* encoding: utf-8 *-*
+
+# Load test for TarockWSServer: fills tables with four websocket clients each, plays full games
+# with the messages of htdocs/js/tarock.js and reports round-trip latencies per action.
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+from collections import defaultdict, Counter
+from typing import Dict, List, Optional
+
+import websockets
+
+from tarockgame.encoding import decode_binary, BINARY_PROTOCOL
+
+GAMETYPES = ['positive', 'positive', 'negative', 'colorgame', 'sechserdreier']
+
+
+class Stats:
+    latencies: Dict[str, List[float]]
+
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.received = 0
+        self.received_bytes = 0
+        self.sent = 0
+        self.games = 0
+        self.alerts = Counter()
+        self.errors = 0
+
+    def report(self, elapsed: float, server_cpu: Optional[float]) -> Dict:
+        actions = {}
+        for action, values in sorted(self.latencies.items()):
+            values = sorted(values)
+            actions[action] = {'count': len(values),
+                               **{f'p{q!s}': 1000*values[min(len(values) - 1, int(len(values) * q / 100))]
+                                  for q in (50, 90, 99)},
+                               'max': 1000*values[-1]}
+        return {'seconds': elapsed,
+                'games': self.games,
+                'messages_received_per_second': self.received / elapsed,
+                'messages_sent_per_second': self.sent / elapsed,
+                'bytes_received_per_message': self.received_bytes / max(1, self.received),
+                'alerts': dict(self.alerts),
+                'errors': self.errors,
+                'server_cpu_seconds': server_cpu,
+                'server_cpu_percent': None if server_cpu is None else 100 * server_cpu / elapsed,
+                'latency_ms': actions}
+
+
+class Client:
+    # One seat; answers every state update the way a player using tarock.js would
+    def __init__(self, url: str, games: int, stats: Stats, rng: random.Random, think: float, timeout: float,
+                 binary: bool = False):
+        self.url = url
+        self.binary = binary
+        self.games = games
+        self.stats = stats
+        self.rng = rng
+        self.think = think
+        self.timeout = timeout
+        self.state = {}
+        self.pending = None
+        self.played = 0
+        self.decided = None
+
+    async def send(self, ws, action: str, msg: Dict):
+        if self.think:
+            await asyncio.sleep(self.rng.uniform(0, 2 * self.think))
+        self.pending = (action, time.perf_counter())
+        self.stats.sent += 1
+        await ws.send(json.dumps(msg))
+
+    async def act(self, ws):
+        state = self.state
+        stage = state.get('stage')
+        mine = state.get('primary') == 0
+        # Messages caused by other players must not make a client repeat its last action
+        decision = (self.played, stage, state.get('primary'), tuple(state.get('talon_a') or ()),
+                    tuple(state.get('talon_b') or ()), tuple(state.get('legal_moves') or ()), 'teams_sent' in state)
+        if decision == self.decided:
+            return
+        self.decided = decision
+        if stage == 'pregame' and mine:
+            await self.send(ws, 'select_gametype', {'select_gametype': self.rng.choice(GAMETYPES)})
+        elif stage == 'talon' and mine and state.get('gametype') != 'Negative' and \
+                len(state.get('talon_a') or []) == 3 and len(state.get('talon_b') or []) == 3:
+            # The first take_talon uncovers the talons, the second one takes one of them
+            await self.send(ws, 'take_talon', {'take_talon': self.rng.randrange(2)})
+        elif state.get('legal_moves') and (state.get('move') is not None or mine):
+            # Nobody has the move before the first card of a negative game, the primary player leads
+            await self.send(ws, 'move', {'move': self.rng.choice(state['legal_moves'])})
+        elif stage == 'postgame' and mine and self.played < self.games:
+            if 'teams_sent' not in state:
+                state['teams_sent'] = True
+                await self.send(ws, 'teams', {'teams': [0, 1, 1, 1, 1, 1]})
+            else:
+                await self.send(ws, 'new_game', {'new_game': True})
+
+    async def run(self, connecting: asyncio.Semaphore):
+        async with connecting:
+            ws = await websockets.connect(self.url, max_size=None,
+                                          subprotocols=[BINARY_PROTOCOL] if self.binary else None)
+        try:
+            while True:
+                try:
+                    data = await asyncio.wait_for(ws.recv(), self.timeout)
+                except asyncio.TimeoutError:
+                    self.stats.errors += 1
+                    return
+                msg = decode_binary(data) if isinstance(data, bytes) else json.loads(data)
+                self.stats.received += 1
+                self.stats.received_bytes += len(data)
+                if self.pending is not None:
+                    action, t = self.pending
+                    self.stats.latencies[action].append(time.perf_counter() - t)
+                    self.pending = None
+                if 'alertmsg' in msg:
+                    self.stats.alerts[msg['alertmsg']] += 1
+                    # The action was based on an outdated state, decide again with the current one
+                    self.decided = None
+                    await self.act(ws)
+                    continue
+                was_postgame = self.state.get('stage') == 'postgame'
+                self.state.update(msg)
+                if self.state.get('stage') == 'postgame' and not was_postgame:
+                    self.played += 1
+                    if self.state.get('primary') == 0:
+                        self.stats.games += 1
+                if self.state.get('stage') != 'postgame':
+                    self.state.pop('teams_sent', None)
+                elif self.played >= self.games:
+                    return
+                await self.act(ws)
+        finally:
+            await ws.close()
+
+
+def process_tree_cpu(pid: int) -> Optional[float]:
+    # CPU seconds of pid and all its descendants (Linux only)
+    try:
+        parents = {}
+        times = {}
+        for entry in os.listdir('/proc'):
+            if not entry.isdigit():
+                continue
+            try:
+                with open(f'/proc/{entry!s}/stat') as f:
+                    fields = f.read().rsplit(')', 1)[1].split()
+            except OSError:
+                continue
+            parents[int(entry)] = int(fields[1])
+            times[int(entry)] = int(fields[11]) + int(fields[12])
+    except OSError:
+        return None
+    tree = {pid}
+    changed = True
+    while changed:
+        children = {p for p, parent in parents.items() if parent in tree} - tree
+        changed = bool(children)
+        tree |= children
+    return sum(times.get(p, 0) for p in tree) / os.sysconf('SC_CLK_TCK')
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+async def wait_for_port(port: int, timeout: float = 20.):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            _, writer = await asyncio.open_connection('127.0.0.1', port)
+            writer.close()
+            return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            await asyncio.sleep(0.1)
+
+
+async def run(args) -> Dict:
+    server = None
+    server_pid = args.server_pid
+    port = args.port
+    if args.spawn:
+        port = port or free_port()
+        server = subprocess.Popen([sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'main.py'),
+                                   '127.0.0.1', str(port)] + args.server_args.split(),
+                                  stdout=subprocess.DEVNULL, stderr=None if args.verbose else subprocess.DEVNULL)
+        server_pid = server.pid
+    try:
+        await wait_for_port(port)
+        stats = Stats()
+        rng = random.Random(args.seed)
+        clients = [Client(f'ws://127.0.0.1:{port!s}/tarockws/load{args.seed!s}-{i // 4!s}', args.games, stats,
+                          random.Random(rng.getrandbits(64)), args.think, args.timeout, args.binary)
+                   for i in range(4 * args.tables)]
+        connecting = asyncio.Semaphore(args.connect_rate)
+
+        async def run_client(client: Client):
+            try:
+                await client.run(connecting)
+            except (OSError, websockets.WebSocketException):
+                stats.errors += 1
+
+        cpu = None if server_pid is None else process_tree_cpu(server_pid)
+        t = time.perf_counter()
+        await asyncio.gather(*[run_client(c) for c in clients])
+        elapsed = time.perf_counter() - t
+        if cpu is not None:
+            cpu_end = process_tree_cpu(server_pid)
+            cpu = None if cpu_end is None else cpu_end - cpu
+        return stats.report(elapsed, cpu)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description='Play many games against a local Tarock server and '
+                                                 'report round-trip latencies')
+    parser.add_argument('--port', type=int, default=None,
+                        help='port of the server (default with --spawn: a free port, otherwise 31426)')
+    parser.add_argument('--spawn', action='store_true',
+                        help='start a server for the test')
+    parser.add_argument('--server-args', type=str, default='',
+                        help='extra arguments for the spawned server')
+    parser.add_argument('--verbose', action='store_true',
+                        help='show the log of the spawned server')
+    parser.add_argument('--server-pid', type=int, default=None,
+                        help='process id of a running server, to report its CPU time')
+    parser.add_argument('--tables', type=int, default=250,
+                        help='number of tables, each with four clients')
+    parser.add_argument('--games', type=int, default=2,
+                        help='games per table')
+    parser.add_argument('--think', type=float, default=0.,
+                        help='mean seconds a client waits before each action')
+    parser.add_argument('--connect-rate', type=int, default=200,
+                        help='maximum number of clients connecting at the same time')
+    parser.add_argument('--timeout', type=float, default=60.,
+                        help='seconds a client waits for a message before giving up')
+    parser.add_argument('--binary', action='store_true',
+                        help='negotiate the binary protocol instead of JSON')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='random seed, also part of the table names')
+    parser.add_argument('--json', action='store_true',
+                        help='print the report as JSON')
+    parser.add_argument('--max-p99', type=float, default=None,
+                        help='exit with an error if the 99th percentile latency of an action exceeds this (ms)')
+    args = parser.parse_args(args)
+    if args.port is None and not args.spawn:
+        args.port = 31426
+
+    report = asyncio.run(run(args))
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print(f"{report['games']!s} games at {args.tables!s} tables in {report['seconds']:.1f}s, "
+              f"{report['messages_received_per_second']:.0f} messages/s received, "
+              f"{report['messages_sent_per_second']:.0f} messages/s sent, "
+              f"{report['bytes_received_per_message']:.0f} bytes/message, "
+              f"{sum(report['alerts'].values())!s} alerts, {report['errors']!s} errors")
+        for alert, n in report['alerts'].items():
+            print(f'Alert "{alert!s}": {n!s}')
+        if report['server_cpu_seconds'] is not None:
+            print(f"Server CPU: {report['server_cpu_seconds']:.1f}s ({report['server_cpu_percent']:.0f}%)")
+        for action, l in report['latency_ms'].items():
+            print(f"{action:16s} n={l['count']:<7d} p50={l['p50']:.1f}ms p90={l['p90']:.1f}ms "
+                  f"p99={l['p99']:.1f}ms max={l['max']:.1f}ms")
+    failed = report['errors'] > 0
+    if args.max_p99 is not None:
+        failed |= any(l['p99'] > args.max_p99 for l in report['latency_ms'].values())
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
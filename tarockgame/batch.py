@@ -0,0 +1,278 @@
+#!/usr/bin/env python
+# *-* encoding: utf-8 *-*
+
+# Vectorised engine that plays many games in lockstep, mirroring the rules in game.py.
+# Requires numpy, which is not needed by the server itself.
+
+import argparse
+import time
+from typing import Callable, List, Optional, Sequence, Union
+
+import numpy as np
+
+from .cards import DECK, Suit, PAGAT, MOND, SKUES, UNDROPPABLE_MASK, TRICK_RANKS, POINT_MASKS
+from .game import Game, GameType, Deal, DEAL_SIZES
+
+N_CARDS = len(DECK)
+BITS = np.left_shift(np.uint64(1), np.arange(N_CARDS, dtype=np.uint64))
+SUIT_OF = np.array([c.suit.value for c in DECK], dtype=np.int8)
+IS_TAROCK = SUIT_OF == Suit.TAROCK.value
+POINTS = np.array([next(p for p, m in POINT_MASKS.items() if m >> c.index & 1) for c in DECK], dtype=np.int16)
+DROPPABLE = np.array([not UNDROPPABLE_MASK >> c.index & 1 for c in DECK], dtype=bool)
+# RANKS[trumps][suit value][card index], see cards.TRICK_RANKS
+RANKS = np.zeros((2, 6, N_CARDS), dtype=np.int16)
+for _trumps in (False, True):
+    for _suit in Suit:
+        RANKS[int(_trumps), _suit.value] = TRICK_RANKS[_trumps][_suit]
+OWNER_BY_POSITION = np.repeat(np.arange(len(DEAL_SIZES)), DEAL_SIZES)
+
+# A policy gets the legal card masks (games x 54) and the random generator and returns one card index per game
+Policy = Callable[[np.ndarray, np.random.Generator], np.ndarray]
+
+
+def first_legal(legal: np.ndarray, rng: np.random.Generator) -> np.ndarray:
+    # Same choice as Game.autoplay: the lowest legal card
+    return legal.argmax(axis=1)
+
+
+def random_legal(legal: np.ndarray, rng: np.random.Generator) -> np.ndarray:
+    keys = rng.random(legal.shape)
+    keys[~legal] = -1.
+    return keys.argmax(axis=1)
+
+
+POLICIES = {'first': first_legal,
+            'random': random_legal}
+
+
+def masks_to_array(masks) -> np.ndarray:
+    masks = np.asarray(masks, dtype=np.uint64)
+    return (masks[..., None] & BITS) != 0
+
+
+def array_to_masks(holdings: np.ndarray) -> np.ndarray:
+    return (holdings.astype(np.uint64) * BITS).sum(axis=-1, dtype=np.uint64)
+
+
+def random_deals(count: int, rng: np.random.Generator) -> np.ndarray:
+    # Returns a (count, 6, 54) boolean array: four hands followed by the two talons
+    perm = rng.random((count, N_CARDS)).argsort(axis=1)
+    owner = np.empty((count, N_CARDS), dtype=np.int8)
+    owner[np.arange(count)[:, None], perm] = OWNER_BY_POSITION
+    return owner[:, None, :] == np.arange(len(DEAL_SIZES))[None, :, None]
+
+
+class BatchGame:
+    count: int
+    game_type: GameType
+    hands: np.ndarray
+    talons: np.ndarray
+    taken: np.ndarray
+    tricks: np.ndarray
+    primary: np.ndarray
+
+    def __init__(self,
+                 count: int,
+                 game_type: GameType,
+                 primary_player: Union[int, Sequence[int]] = 0,
+                 seed: Optional[int] = None,
+                 deals: Optional[Sequence[Deal]] = None,
+                 policy: Union[str, Policy] = 'random',
+                 cross_check: bool = False,
+                 ):
+        self.rng = np.random.default_rng(seed)
+        self.count = count
+        self.game_type = game_type
+        self.policy = POLICIES[policy] if isinstance(policy, str) else policy
+        self.rows = np.arange(count)
+        self.primary = np.broadcast_to(np.asarray(primary_player, dtype=np.int8), (count,)).copy()
+        if deals is None:
+            holdings = random_deals(count, self.rng)
+        else:
+            holdings = masks_to_array([tuple(d) for d in deals])
+            assert holdings.shape[0] == count
+        self.hands = holdings[:, :4].copy()
+        self.talons = holdings[:, 4:].copy()
+        # Cards scored by each player and the talons left over, in the order of Game.single_score
+        self.taken = np.zeros((count, 6, N_CARDS), dtype=bool)
+        self.tricks = np.zeros((count, 4), dtype=np.int8)
+        self.trumps = game_type is not GameType.COLORGAME
+
+        self.games: Optional[List[Game]] = None
+        if cross_check:
+            deal_masks = array_to_masks(holdings)
+            self.games = [Game(primary_player=int(self.primary[i]), deal=tuple(int(m) for m in deal_masks[i]))
+                          for i in range(count)]
+
+    def _choose(self, seats: np.ndarray, legal: np.ndarray) -> np.ndarray:
+        assert legal.any(axis=1).all(), 'No legal card'
+        chosen = self.policy(legal, self.rng)
+        if self.games is not None:
+            for i, game in enumerate(self.games):
+                expected = masks_to_array(game.legal_moves(int(seats[i])).mask)
+                assert (expected == legal[i]).all(), f'Legal moves differ in game {i!s}'
+                game.play_card(int(seats[i]), DECK[chosen[i]])
+        return chosen
+
+    def select_game_type(self):
+        if self.games is not None:
+            for game in self.games:
+                game.set_game_type(self.game_type)
+        if self.game_type is GameType.NEGATIVE:
+            return
+        primary_hands = self.hands[self.rows, self.primary]
+        if self.game_type is GameType.SECHSERDREIER:
+            primary_hands |= self.talons.any(axis=1)
+            self.talons[:] = False
+            n_drop = 6
+        else:
+            talon = self.rng.integers(0, 2, self.count)
+            if self.games is not None:
+                for i, game in enumerate(self.games):
+                    game.take_talon(int(self.primary[i]), int(talon[i]))
+                    game.take_talon(int(self.primary[i]), int(talon[i]))
+            primary_hands |= self.talons[self.rows, talon]
+            self.talons[self.rows, talon] = False
+            n_drop = 3
+        self.hands[self.rows, self.primary] = primary_hands
+        for _ in range(n_drop):
+            legal = self.hands[self.rows, self.primary] & DROPPABLE
+            chosen = self._choose(self.primary, legal)
+            self.hands[self.rows, self.primary, chosen] = False
+            self.taken[self.rows, self.primary, chosen] = True
+
+    def play_trick(self, leader: np.ndarray) -> np.ndarray:
+        trick = np.zeros((self.count, N_CARDS), dtype=bool)
+        played = np.zeros((self.count, 4), dtype=np.int8)
+        lead_suit = np.zeros(self.count, dtype=np.int8)
+        best_rank = np.zeros(self.count, dtype=np.int16)
+        best_seat = leader.copy()
+        for k in range(4):
+            seat = (leader + k) % 4
+            hand = self.hands[self.rows, seat]
+            if k == 0:
+                legal = hand.copy()
+                if self.game_type is GameType.COLORGAME:
+                    colors = hand & ~IS_TAROCK
+                    has_colors = colors.any(axis=1)
+                    legal[has_colors] = colors[has_colors]
+            else:
+                # Farbzwang and Tarockzwang
+                follow = hand & (SUIT_OF[None, :] == lead_suit[:, None])
+                tarock = hand & IS_TAROCK
+                legal = hand.copy()
+                must_tarock = (lead_suit != Suit.TAROCK.value) & tarock.any(axis=1)
+                legal[must_tarock] = tarock[must_tarock]
+                has_follow = follow.any(axis=1)
+                legal[has_follow] = follow[has_follow]
+                ranks = RANKS[int(self.trumps), lead_suit]
+
+            if self.game_type is GameType.NEGATIVE:
+                # Stichzwang
+                if k == 0:
+                    wins = legal
+                else:
+                    has_mond = trick[:, MOND.index]
+                    wins = legal & (ranks > best_rank[:, None])
+                    wins[:, SKUES.index] &= ~(trick[:, PAGAT.index] & has_mond)
+                    wins[:, PAGAT.index] |= legal[:, PAGAT.index] & trick[:, SKUES.index] & has_mond
+                can_win = wins.any(axis=1)
+                legal[can_win] = wins[can_win]
+                # Pagat rule
+                pagat_blocked = (hand & IS_TAROCK).sum(axis=1) > 1
+                pagat_blocked &= ~(trick[:, SKUES.index] & trick[:, MOND.index])
+                legal[:, PAGAT.index] &= ~pagat_blocked
+
+            chosen = self._choose(seat, legal)
+            self.hands[self.rows, seat, chosen] = False
+            trick[self.rows, chosen] = True
+            played[self.rows, seat] = chosen
+            if k == 0:
+                lead_suit = SUIT_OF[chosen]
+                best_rank = RANKS[int(self.trumps), lead_suit, chosen]
+            else:
+                rank = ranks[self.rows, chosen]
+                better = rank > best_rank
+                best_rank = np.where(better, rank, best_rank)
+                best_seat = np.where(better, seat, best_seat)
+
+        # Pagat, Mond and Sküs in one trick: the Pagat wins
+        trull = trick[:, PAGAT.index] & trick[:, MOND.index] & trick[:, SKUES.index]
+        trull &= played[self.rows, best_seat] == SKUES.index
+        best_seat = np.where(trull, (played == PAGAT.index).argmax(axis=1), best_seat)
+
+        self.taken[self.rows, best_seat] |= trick
+        self.tricks[self.rows, best_seat] += 1
+        return best_seat
+
+    def run(self) -> 'BatchGame':
+        self.select_game_type()
+        leader = self.primary.copy()
+        for _ in range(12):
+            leader = self.play_trick(leader)
+        self.taken[:, 4:] = self.talons
+        if self.games is not None:
+            points, blatt = self.single_score()
+            for i, game in enumerate(self.games):
+                assert game.single_score == [(int(p), int(b)) for p, b in zip(points[i], blatt[i])], \
+                    f'Score differs in game {i!s}'
+                assert [len(p.taken_cards) for p in game.players] == \
+                       [int(t) + (self.game_type is not GameType.NEGATIVE and j == self.primary[i])
+                        for j, t in enumerate(self.tricks[i])], f'Tricks differ in game {i!s}'
+        return self
+
+    def single_score(self) -> (np.ndarray, np.ndarray):
+        # Equivalent of CardCollection.point_value for every entry of Game.single_score
+        n = self.taken.sum(axis=2)
+        points = (self.taken * POINTS).sum(axis=2) - 2*(n // 3)
+        blatt = n % 3
+        return points - blatt, blatt
+
+
+def simulate(game_type: GameType,
+             count: int,
+             seed: Optional[int] = None,
+             policy: Union[str, Policy] = 'random',
+             chunk_size: int = 10000,
+             cross_check: bool = False,
+             ) -> (np.ndarray, np.ndarray):
+    # Returns the primary player's points and the tricks per player for count games
+    rng = np.random.default_rng(seed)
+    points = []
+    tricks = []
+    for start in range(0, count, chunk_size):
+        n = min(chunk_size, count - start)
+        batch = BatchGame(n, game_type, seed=int(rng.integers(2**63)), policy=policy, cross_check=cross_check)
+        batch.run()
+        single_points, _ = batch.single_score()
+        points.append(single_points[batch.rows, batch.primary])
+        tricks.append(batch.tricks)
+    return np.concatenate(points), np.concatenate(tricks)
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description='Simulate many games and print score distributions')
+    parser.add_argument('--games', type=int, default=100000,
+                        help='number of games per game type')
+    parser.add_argument('--policy', choices=list(POLICIES), default='random',
+                        help='how players choose their cards')
+    parser.add_argument('--seed', type=int, default=None,
+                        help='random seed')
+    parser.add_argument('--cross-check', action='store_true',
+                        help='replay every game with the scalar engine and compare')
+    args = parser.parse_args(args)
+
+    for game_type in GameType:
+        t = time.monotonic()
+        points, tricks = simulate(game_type, args.games, seed=args.seed, policy=args.policy,
+                                  cross_check=args.cross_check)
+        elapsed = time.monotonic() - t
+        quantiles = np.percentile(points, [5, 25, 50, 75, 95])
+        print(f'{game_type.name}: {args.games} games in {elapsed:.2f}s, '
+              f'primary points mean {points.mean():.2f} std {points.std():.2f}, '
+              f'quantiles (5/25/50/75/95) {", ".join(f"{q:g}" for q in quantiles)}, '
+              f'primary tricks mean {tricks.mean(axis=0)[0]:.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,310 @@
+#!/usr/bin/env python
+# *-* encoding: utf-8 *-*
+
+# Micro-benchmarks of the hot paths of the game engine. Results can be saved as a baseline
+# and compared with a later run, e.g. before and after a change:
+#   python -m tarockgame.benchmark --save before.json
+#   python -m tarockgame.benchmark --compare before.json
+# Every benchmark is calibrated to run at least min_time seconds per repetition with the
+# garbage collector disabled (like timeit); the minimum over the repetitions is compared.
+
+import argparse
+import gc
+import json
+import platform
+import random
+import statistics
+import sys
+import time
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from .cards import CardCollection
+from .encoding import StateEncoder, dumps
+from .game import Game, GameType, STATE_GROUPS
+from .handstrength import HandEvaluator
+from .selfplay import play_game, RandomPolicy
+from .testutil import Seat
+
+# A benchmark prepares its data and returns the function to time and the number of operations per call
+Benchmark = Callable[[], Tuple[Callable[[], None], int]]
+BENCHMARKS: Dict[str, Benchmark] = {}
+SEEDS = range(8)
+
+
+def benchmark(name: str):
+    def register(f: Benchmark) -> Benchmark:
+        BENCHMARKS[name] = f
+        return f
+    return register
+
+
+SEATS = [Seat(f'Player {i!s}') for i in range(4)]
+
+
+def played_games(game_type: GameType) -> List[Game]:
+    games = []
+    for seed in SEEDS:
+        policies = [RandomPolicy() for _ in range(4)]
+        for i, policy in enumerate(policies):
+            policy.seed(seed + i)
+        games.append(play_game(Game(primary_player=seed % 4, seed=seed), policies, game_type))
+    return games
+
+
+def midgame(game_type: GameType, cards: int = 21) -> Game:
+    # A game in the middle of a trick after replaying its first actions
+    full = played_games(game_type)[0]
+    game = Game(primary_player=full.primary_player, deal=full.deal)
+    for action in full.history[:cards]:
+        game.replay(action)
+    return game
+
+
+@benchmark('deal_cards')
+def bench_deal_cards():
+    game = Game(primary_player=0, seed=0)
+    rng = random.Random(0)
+
+    def run():
+        game.deal_cards(rng=rng)
+    return run, 1
+
+
+def bench_play(game_type: GameType) -> Benchmark:
+    # Replays complete games from their deals, i.e. 48 calls of play_card per game plus the talon
+    def prepare():
+        games = [(g.primary_player, g.deal, g.history) for g in played_games(game_type)]
+
+        def run():
+            for primary, deal, history in games:
+                game = Game(primary_player=primary, deal=deal)
+                for action in history:
+                    game.replay(action)
+        return run, len(games)
+    return prepare
+
+
+for _game_type in GameType:
+    benchmark(f'play_{_game_type.name.lower()!s}')(bench_play(_game_type))
+
+
+@benchmark('find_highest_card')
+def bench_find_highest_card():
+    tricks = []
+    for game_type in GameType:
+        for game in played_games(game_type):
+            tricks.extend((game, ausspieler, cards) for ausspieler, cards in game.played_tricks)
+
+    def run():
+        for game, ausspieler, cards in tricks:
+            game.ausspieler = ausspieler
+            game._find_highest_card(cards)
+    return run, len(tricks)
+
+
+@benchmark('calculate_score')
+def bench_calculate_score():
+    games = played_games(GameType.POSITIVE)
+
+    def run():
+        for game in games:
+            game.calculate_score()
+    return run, len(games)
+
+
+@benchmark('point_value')
+def bench_point_value():
+    collections = [CardCollection.from_mask(mask) for game in played_games(GameType.POSITIVE) for mask in game.deal]
+
+    def run():
+        for cc in collections:
+            cc.point_value()
+    return run, len(collections)
+
+
+@benchmark('hand_strength')
+def bench_hand_strength():
+    hands = [Game(primary_player=0, seed=seed).players[0].hand_cards.mask for seed in range(64)]
+    evaluator = HandEvaluator.load()
+
+    def run():
+        for hand in hands:
+            evaluator.evaluate(hand)
+    return run, len(hands)
+
+
+@benchmark('get_state')
+def bench_get_state():
+    # Full states of all four seats; the encoded card lists are rebuilt once per call as after a change
+    game = midgame(GameType.POSITIVE)
+
+    def run():
+        game.touch(*STATE_GROUPS)
+        for seat in range(4):
+            game.get_state(seat, SEATS)
+    return run, 4
+
+
+@benchmark('get_state_update')
+def bench_get_state_update():
+    # The updates of all four seats after a card was played, as broadcast by the server
+    game = midgame(GameType.POSITIVE, cards=20)
+    old_states = [game.get_state(seat, SEATS) for seat in range(4)]
+    game.replay(played_games(GameType.POSITIVE)[0].history[20])
+    groups = game.take_changes()
+
+    def run():
+        game.touch(*groups)
+        for seat in range(4):
+            game.get_state_update(seat, SEATS, dict(old_states[seat]), groups=groups)
+    return run, 4
+
+
+@benchmark('encode_state')
+def bench_encode_state():
+    states = [midgame(GameType.POSITIVE).get_state(seat, SEATS) for seat in range(4)]
+
+    def run():
+        for state in states:
+            dumps(state)
+    return run, len(states)
+
+
+@benchmark('encode_broadcast')
+def bench_encode_broadcast():
+    game = midgame(GameType.POSITIVE)
+    states = [game.get_state(seat, SEATS) for seat in range(4)]
+
+    def run():
+        encoder = StateEncoder()
+        for state in states:
+            encoder.encode(state)
+    return run, len(states)
+
+
+def measure(f: Callable[[], None], ops: int, repeat: int = 7, min_time: float = 0.2) -> Dict:
+    # Seconds per operation of every repetition, timed with the garbage collector disabled
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        loops = 1
+        while True:
+            t = time.perf_counter()
+            for _ in range(loops):
+                f()
+            elapsed = time.perf_counter() - t
+            if elapsed >= min_time:
+                break
+            loops *= 2 if elapsed <= 0 else max(2, min(10, int(1.2 * min_time / elapsed) + 1))
+        runs = []
+        for _ in range(repeat):
+            t = time.perf_counter()
+            for _ in range(loops):
+                f()
+            runs.append((time.perf_counter() - t) / (loops * ops))
+    finally:
+        if gc_enabled:
+            gc.enable()
+    return {'loops': loops,
+            'ops': ops,
+            'min': min(runs),
+            'median': statistics.median(runs),
+            'runs': runs}
+
+
+def run_benchmarks(names: Optional[Sequence[str]] = None, repeat: int = 7, min_time: float = 0.2,
+                   progress: Optional[Callable[[str, Dict], None]] = None) -> Dict:
+    results = {}
+    for name in names or BENCHMARKS:
+        f, ops = BENCHMARKS[name]()
+        results[name] = measure(f, ops, repeat=repeat, min_time=min_time)
+        if progress is not None:
+            progress(name, results[name])
+    return {'python': sys.version.split()[0],
+            'implementation': platform.python_implementation(),
+            'machine': platform.machine(),
+            'processor': platform.processor(),
+            'time': time.time(),
+            'repeat': repeat,
+            'min_time': min_time,
+            'results': results}
+
+
+def compare(baseline: Dict, current: Dict, threshold: float = 0.1) -> List[Dict]:
+    # Ratio of the fastest runs; above 1 + threshold is a regression, below 1 - threshold an improvement
+    rows = []
+    for name, result in current['results'].items():
+        base = baseline['results'].get(name)
+        if base is None:
+            rows.append({'name': name, 'baseline': None, 'current': result['min'], 'ratio': None, 'verdict': 'new'})
+            continue
+        ratio = result['min'] / base['min']
+        if ratio > 1 + threshold:
+            verdict = 'slower'
+        elif ratio < 1 - threshold:
+            verdict = 'faster'
+        else:
+            verdict = 'same'
+        rows.append({'name': name, 'baseline': base['min'], 'current': result['min'], 'ratio': ratio,
+                     'verdict': verdict})
+    return rows
+
+
+def format_time(seconds: Optional[float]) -> str:
+    if seconds is None:
+        return '-'
+    for unit, scale in (('s', 1.), ('ms', 1e-3), ('us', 1e-6)):
+        if seconds >= scale:
+            return f'{seconds / scale:.2f}{unit!s}'
+    return f'{seconds / 1e-9:.0f}ns'
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description='Time the hot paths of the game engine')
+    parser.add_argument('benchmarks', nargs='*',
+                        help='benchmarks to run (default: all): ' + ', '.join(BENCHMARKS))
+    parser.add_argument('--repeat', type=int, default=7,
+                        help='number of timed repetitions of every benchmark')
+    parser.add_argument('--min-time', type=float, default=0.2,
+                        help='minimum seconds of every repetition')
+    parser.add_argument('--save', type=str, default=None,
+                        help='save the results as a baseline to this file')
+    parser.add_argument('--compare', type=str, default=None,
+                        help='compare the results with the baseline in this file')
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help='relative difference to the baseline that counts as a change')
+    args = parser.parse_args(args)
+
+    unknown = [name for name in args.benchmarks if name not in BENCHMARKS]
+    if unknown:
+        parser.error(f'Unknown benchmarks: {", ".join(unknown)!s}')
+    baseline = None
+    if args.compare is not None:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+
+    def progress(name: str, result: Dict):
+        spread = (result['median'] - result['min']) / result['min']
+        print(f"{name:22s} {format_time(result['min']):>10s} per op (median +{100 * spread:.1f}%, "
+              f"{result['loops']!s} loops)", flush=True)
+
+    current = run_benchmarks(args.benchmarks, repeat=args.repeat, min_time=args.min_time, progress=progress)
+    if args.save is not None:
+        with open(args.save, 'w') as f:
+            json.dump(current, f, indent=2)
+
+    if baseline is not None:
+        if (baseline['python'], baseline['machine']) != (current['python'], current['machine']):
+            print(f"Warning: the baseline was made with Python {baseline['python']!s} on {baseline['machine']!s}")
+        print()
+        rows = compare(baseline, current, threshold=args.threshold)
+        for row in rows:
+            ratio = '' if row['ratio'] is None else f"{row['ratio']:.2f}x"
+            print(f"{row['name']:22s} {format_time(row['baseline']):>10s} -> {format_time(row['current']):>10s} "
+                  f"{ratio:>7s} {row['verdict']!s}")
+        if any(row['verdict'] == 'slower' for row in rows):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,248 @@
+#!/usr/bin/env python
+# *-* encoding: utf-8 *-*
+
+# Monte Carlo bot: samples the hidden cards consistent with what a seat knows and
+# rates each legal card by simulating the rest of the game.
+
+import random
+import time
+from concurrent.futures import Executor
+from typing import Dict, List, Optional, Tuple
+
+from .cards import Card, CardCollection, Suit, DECK, FULL_MASK, SUIT_MASKS, UNDROPPABLE_MASK, \
+    iter_mask, mask_point_value, trick_winner
+from .game import Game, GameType, GameStage, legal_cards
+from .handstrength import hand_strength
+from .selfplay import Policy
+
+
+class SeatView:
+    # Everything one seat knows about a game, as plain data so it can be sent to worker processes.
+    playerid: int
+    game_type: GameType
+    primary: int
+    ausspieler: Optional[int]
+    center: List[Optional[Card]]
+    hands: List[Optional[int]]
+    hand_sizes: List[int]
+    taken: List[int]
+    tricks: List[int]
+    drop_owner: Optional[int]
+    drops: Optional[int]
+    drop_size: int
+    hidden_talon_size: int
+    allowed: List[int]
+    unknown: int
+    legal: CardCollection
+
+    def __init__(self, game: Game, playerid: int):
+        self.playerid = playerid
+        self.game_type = game.game_type
+        self.primary = game.primary_player
+        if game.game_stage is GameStage.INGAME and game.move != game.ausspieler:
+            self.ausspieler = game.ausspieler
+            self.center = list(game.center_cards)
+        else:
+            self.ausspieler = None
+            self.center = [None]*4
+
+        revealed = game.hands_revealed()
+        self.hands = [p.hand_cards.mask if p.id == playerid or revealed else None for p in game.players]
+        self.hand_sizes = [len(p.hand_cards) for p in game.players]
+
+        # Tricks are public, the cards dropped after taking the talon are only known to their owner
+        self.taken = [0]*4
+        self.drop_owner = None
+        self.drops = None
+        self.drop_size = 0
+        for p in game.players:
+            for cards in p.taken_cards:
+                if len(cards) == 4:
+                    for c in cards:
+                        self.taken[p.id] |= 1 << c.index
+                else:
+                    self.drop_owner = p.id
+                    self.drop_size = len(cards)
+                    if p.id == playerid:
+                        self.drops = CardCollection(cards).mask
+        self.tricks = game.tricks_taken()
+
+        known = sum(self.taken) | (self.drops or 0)
+        for h in self.hands:
+            known |= h or 0
+        for c in self.center:
+            if c is not None:
+                known |= 1 << c.index
+        self.hidden_talon_size = 0
+        for talon in game.talons:
+            if game.talons_uncovered:
+                known |= talon.mask
+            else:
+                self.hidden_talon_size += len(talon)
+        self.unknown = FULL_MASK & ~known
+
+        # A seat that did not follow suit has none of that suit left (and no tarock if it did not trump)
+        self.allowed = [FULL_MASK]*4
+        tricks = list(game.played_tricks)
+        if self.ausspieler is not None:
+            tricks.append((self.ausspieler, self.center))
+        for ausspieler, cards in tricks:
+            played_suit = cards[ausspieler].suit
+            for i, c in enumerate(cards):
+                if c is None or c.suit is played_suit:
+                    continue
+                self.allowed[i] &= ~SUIT_MASKS[played_suit]
+                if played_suit is not Suit.TAROCK and c.suit is not Suit.TAROCK:
+                    self.allowed[i] &= ~SUIT_MASKS[Suit.TAROCK]
+
+        self.legal = game.legal_moves(playerid)
+
+    def sample(self, rng: random.Random, attempts: int = 20) -> Tuple[List[CardCollection], int]:
+        # Deals the unknown cards to the hidden hands, the hidden drops and the hidden talon
+        slots = [(i, self.hand_sizes[i], self.allowed[i]) for i in range(4) if self.hands[i] is None]
+        if self.drop_owner is not None and self.drops is None:
+            slots.append(('drops', self.drop_size, FULL_MASK))
+        if self.hidden_talon_size:
+            slots.append(('talon', self.hidden_talon_size, FULL_MASK))
+        cards = list(iter_mask(self.unknown))
+        for attempt in range(attempts + 1):
+            # Without a consistent deal after some attempts, ignore what was inferred from the tricks
+            ignore_voids = attempt == attempts
+            rng.shuffle(cards)
+            eligible = [[k for k, (_, _, allowed) in enumerate(slots) if ignore_voids or allowed >> c.index & 1]
+                        for c in cards]
+            order = sorted(range(len(cards)), key=lambda n: len(eligible[n]))
+            capacity = [size for _, size, _ in slots]
+            masks = [0]*len(slots)
+            for n in order:
+                options = [k for k in eligible[n] if capacity[k] > 0]
+                if not options:
+                    break
+                k = rng.choices(options, weights=[capacity[k] for k in options])[0]
+                capacity[k] -= 1
+                masks[k] |= 1 << cards[n].index
+            else:
+                break
+        hands = list(self.hands)
+        drops = self.drops or 0
+        for (key, _, _), mask in zip(slots, masks):
+            if key == 'drops':
+                drops = mask
+            elif key != 'talon':
+                hands[key] = mask
+        return [CardCollection.from_mask(h) for h in hands], drops
+
+    def rollout(self, hands: List[CardCollection], drops: int, card: Card, rng: random.Random) -> float:
+        # Plays card and then random legal cards until the end; returns the value for this seat
+        trumps = self.game_type is not GameType.COLORGAME
+        cards = list(self.center)
+        ausspieler = self.ausspieler
+        move = self.playerid
+        taken = list(self.taken)
+        tricks = list(self.tricks)
+        while True:
+            if card is None:
+                card = rng.choice(list(legal_cards(hands[move], cards, ausspieler, move, self.game_type)))
+            if ausspieler is None:
+                ausspieler = move
+                cards = [None]*4
+            cards[move] = card
+            hands[move].remove(card)
+            card = None
+            move = (move + 1) % 4
+            if move == ausspieler:
+                winner = trick_winner(cards, ausspieler, trumps=trumps)
+                for c in cards:
+                    taken[winner] |= 1 << c.index
+                tricks[winner] += 1
+                ausspieler = None
+                move = winner
+                if not hands[move]:
+                    break
+        if self.game_type is GameType.NEGATIVE:
+            value = -tricks[self.primary]
+        else:
+            if self.drop_owner == self.primary:
+                taken[self.primary] |= drops
+            value, _ = mask_point_value(taken[self.primary])
+        return value if self.playerid == self.primary else -value
+
+
+def evaluate(view: SeatView, budget: float, seed: Optional[int] = None,
+             max_samples: Optional[int] = None) -> Tuple[Dict[int, float], int]:
+    # Sums of rollout values per candidate card index and the number of samples
+    rng = random.Random(seed)
+    deadline = time.monotonic() + budget
+    totals = {c.index: 0. for c in view.legal}
+    n = 0
+    while n == 0 or (time.monotonic() < deadline and (max_samples is None or n < max_samples)):
+        hands, drops = view.sample(rng)
+        for c in view.legal:
+            totals[c.index] += view.rollout([h.copy() for h in hands], drops, c, rng)
+        n += 1
+    return totals, n
+
+
+def choose_card(view: SeatView,
+                budget: float = 0.5,
+                executor: Optional[Executor] = None,
+                workers: int = 1,
+                seed: Optional[int] = None,
+                max_samples: Optional[int] = None) -> Card:
+    if len(view.legal) == 1:
+        return next(iter(view.legal))
+    if executor is None:
+        totals, _ = evaluate(view, budget, seed, max_samples)
+    else:
+        if seed is None:
+            seed = random.getrandbits(32)
+        futures = [executor.submit(evaluate, view, budget, seed + i, max_samples) for i in range(workers)]
+        totals = {c.index: 0. for c in view.legal}
+        for f in futures:
+            for index, total in f.result()[0].items():
+                totals[index] += total
+    return DECK[max(totals, key=lambda index: totals[index])]
+
+
+def choose_drop(game: Game, playerid: int) -> Card:
+    # Points in the dropped cards count for the player, so drop the most valuable suit card possible
+    droppable = CardCollection.from_mask(game.players[playerid].hand_cards.mask & ~UNDROPPABLE_MASK)
+    suits = droppable - droppable.suit_cards(Suit.TAROCK)
+    if suits:
+        return max(suits, key=lambda c: (c.value, -len(droppable.suit_cards(c.suit))))
+    return next(iter(droppable))
+
+
+def choose_talon(game: Game, playerid: int) -> int:
+    points = [talon.point_value()[0] + len(talon.suit_cards(Suit.TAROCK)) for talon in game.talons]
+    return 0 if points[0] >= points[1] else 1
+
+
+def choose_game_type(game: Game, playerid: int) -> GameType:
+    # The game type with the best chance according to the hand-strength tables
+    chances = hand_strength(game.players[playerid].hand_cards.mask)
+    return GameType(max(range(len(chances)), key=lambda i: chances[i]))
+
+
+class MonteCarloPolicy(Policy):
+    name = 'montecarlo'
+
+    def __init__(self, budget: float = 0.05, max_samples: Optional[int] = None):
+        self.budget = budget
+        self.max_samples = max_samples
+        self.rng = random.Random()
+
+    def seed(self, seed: int):
+        self.rng.seed(seed)
+
+    def choose_game_type(self, game: Game, playerid: int) -> GameType:
+        return choose_game_type(game, playerid)
+
+    def choose_talon(self, game: Game, playerid: int) -> int:
+        return choose_talon(game, playerid)
+
+    def choose_card(self, game: Game, playerid: int, legal: CardCollection) -> Card:
+        if game.game_stage is GameStage.TALONTAKEN:
+            return choose_drop(game, playerid)
+        return choose_card(SeatView(game, playerid), self.budget,
+                           seed=self.rng.getrandbits(32), max_samples=self.max_samples)
@@ -3,7 +3,7 @@
 
 
 from enum import Enum
-from typing import Set, Iterable, List
+from typing import MutableSet, Iterable, Iterator, List, Optional, Sequence, Tuple
 
 
 class Suit(Enum):
@@ -20,42 +20,80 @@ class Suit(Enum):
 # 1,2,3,4, 5,6,7,8
 
 class Card:
+    # Cards are interned: Card(suit, value) always returns the same immutable instance out of DECK,
+    # so equality is identity and index is the dense position 0..53 in the sorted deck.
     suit: Suit
     value: int
+    index: int
 
-    def __init__(self,
-                 suit: Suit,
-                 value: int,
-                 ):
-        self.suit = suit
-        self.value = value
-        assert isinstance(suit, Suit), 'Must specify suit'
-        if suit == suit.TAROCK:
-            assert 1 <= value <= 22, "Tarock have values between 1 and 22"
-        else:
-            assert 1 <= value <= 8, "Suits have values between 1 and 8"
+    __slots__ = ('suit', 'value', 'index', '_enc')
+
+    def __new__(cls,
+                suit: Suit,
+                value: int,
+                ):
+        card = _INTERNED.get((suit, value))
+        if card is None:
+            assert isinstance(suit, Suit), 'Must specify suit'
+            if suit == suit.TAROCK:
+                assert 1 <= value <= 22, "Tarock have values between 1 and 22"
+            else:
+                assert 1 <= value <= 8, "Suits have values between 1 and 8"
+            raise ValueError(f'There is no card {suit!s} {value!s}.')
+        return card
+
+    @classmethod
+    def _make(cls, suit: Suit, value: int, index: int) -> 'Card':
+        card = object.__new__(cls)
+        object.__setattr__(card, 'suit', suit)
+        object.__setattr__(card, 'value', value)
+        object.__setattr__(card, 'index', index)
+        object.__setattr__(card, '_enc', f"{suit.name[0]!s}{value}")
+        return card
+
+    def __setattr__(self, key, value):
+        raise AttributeError('Cards are immutable.')
+
+    def __delattr__(self, item):
+        raise AttributeError('Cards are immutable.')
+
+    def __reduce__(self):
+        return Card, (self.suit, self.value)
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
 
     def __gt__(self, other):
         if not isinstance(other, Card):
             raise ValueError('Can only compare two cards.')
-        if self.suit.value > other.suit.value:
-            return True
-        elif self.suit.value < other.suit.value:
-            return False
-        return self.value > other.value
+        return self.index > other.index
+
+    def __lt__(self, other):
+        if not isinstance(other, Card):
+            raise ValueError('Can only compare two cards.')
+        return self.index < other.index
 
     def __str__(self):
         return f"[{self.suit.name} {self.value}]"
 
-    def __eq__(self, other):
-        return hash(self) == hash(other)
+    def __repr__(self):
+        return f"Card({self.suit!s}, {self.value})"
 
     def __hash__(self):
-        return self.suit.value*100 + self.value
+        return self.index
 
     def enc_str(self):
-        return f"{self.suit.name[0]!s}{self.value}"
+        return self._enc
 
+    @staticmethod
+    def from_enc_str(encstr: str) -> 'Card':
+        card = _ENCODED.get(encstr)
+        if card is None:
+            raise ValueError(f'There is no card "{encstr!s}".')
+        return card
 
     @staticmethod
     def dec_str(encstr: str):
@@ -65,19 +103,204 @@ class Card:
         return Card(Suit(suit), val)
 
 
-class CardCollection(Set):
-    cards: Set[Card]
+def _build_deck() -> Tuple[Card, ...]:
+    deck = []
+    for suit in Suit:
+        maxval = 22 if suit is Suit.TAROCK else 8
+        for val in range(1, maxval+1):
+            deck.append(Card._make(suit, val, len(deck)))
+    return tuple(deck)
+
+
+# All 54 cards, ordered by Card.index
+DECK: Tuple[Card, ...] = _build_deck()
+_INTERNED = {(c.suit, c.value): c for c in DECK}
+_ENCODED = {c.enc_str(): c for c in DECK}
+
+PAGAT = Card(Suit.TAROCK, 1)
+MOND = Card(Suit.TAROCK, 21)
+SKUES = Card(Suit.TAROCK, 22)
+FULL_MASK = (1 << len(DECK)) - 1
+SUIT_MASKS = {suit: sum(1 << c.index for c in DECK if c.suit is suit) for suit in Suit}
+
+
+def _card_points(card: Card) -> int:
+    if card.suit is not Suit.TAROCK:
+        if card.value > 4:
+            return card.value - 3
+        return 1
+    if card.value in (1, 21, 22):
+        return 5
+    return 1
+
+
+# POINT_MASKS[p] holds all cards worth p points (before subtracting per three cards)
+POINT_MASKS = {p: sum(1 << c.index for c in DECK if _card_points(c) == p) for p in range(1, 6)}
+# CARD_POINTS[i] is the value of DECK[i], for sums that are kept up to date card by card
+CARD_POINTS = tuple(_card_points(c) for c in DECK)
+
+
+TRULL_MASK = (1 << PAGAT.index) | (1 << MOND.index) | (1 << SKUES.index)
+KINGS_MASK = sum(1 << c.index for c in DECK if c.suit is not Suit.TAROCK and c.value == 8)
+# Trull and kings cannot be dropped after taking the talon
+UNDROPPABLE_MASK = TRULL_MASK | KINGS_MASK
+
+
+def _trick_ranks(lead: Suit, trumps: bool) -> Tuple[int, ...]:
+    ranks = []
+    for c in DECK:
+        if c.suit is lead:
+            ranks.append(c.value)
+        elif c.suit is Suit.TAROCK and trumps:
+            ranks.append(100 + c.value)
+        else:
+            ranks.append(0)
+    return tuple(ranks)
+
+
+# TRICK_RANKS[trumps][lead suit][card index]: strength of a card in a trick, 0 if it cannot win.
+# Tarock only trump other suits if trumps is set (i.e., not in a colour game).
+TRICK_RANKS = {trumps: {lead: _trick_ranks(lead, trumps) for lead in Suit} for trumps in (True, False)}
+
+
+def trick_winner(cards: Sequence[Optional[Card]], lead: int, trumps: bool = True) -> int:
+    # Returns the index of the winning card; cards may contain None for seats yet to play
+    ranks = TRICK_RANKS[trumps][cards[lead].suit]
+    highest = lead
+    highest_rank = ranks[cards[lead].index]
+    mask = 0
+    for i, card in enumerate(cards):
+        if card is None:
+            continue
+        mask |= 1 << card.index
+        rank = ranks[card.index]
+        if rank > highest_rank:
+            highest = i
+            highest_rank = rank
+    # Pagat, Mond and Sküs in one trick: the Pagat wins
+    if cards[highest] is SKUES and mask & TRULL_MASK == TRULL_MASK:
+        highest = cards.index(PAGAT)
+    return highest
+
+
+def iter_mask(mask: int) -> Iterator[Card]:
+    while mask:
+        low = mask & -mask
+        yield DECK[low.bit_length() - 1]
+        mask ^= low
+
+
+class CardCollection(MutableSet):
+    # Set of cards stored as a bitmask over DECK; iteration yields the cards in sorted order
+    mask: int
+
+    __slots__ = ('mask',)
 
     def __init__(self, cards: Iterable[Card] = None):
-        super(CardCollection, self).__init__()
+        self.mask = 0
         if cards is not None:
             for card in cards:
                 self.add(card)
 
-    def __iter__(self):
-        sorted_cards = list(super(CardCollection, self).__iter__())
-        sorted_cards.sort()
-        return iter(sorted_cards)
+    @classmethod
+    def from_mask(cls, mask: int) -> 'CardCollection':
+        coll = cls.__new__(cls)
+        coll.mask = mask
+        return coll
+
+    @staticmethod
+    def _mask_of(other) -> Optional[int]:
+        if isinstance(other, CardCollection):
+            return other.mask
+        return None
+
+    def __contains__(self, card) -> bool:
+        if not isinstance(card, Card):
+            return False
+        return bool(self.mask >> card.index & 1)
+
+    def __iter__(self) -> Iterator[Card]:
+        return iter_mask(self.mask)
+
+    def __len__(self) -> int:
+        return self.mask.bit_count()
+
+    def __bool__(self) -> bool:
+        return self.mask != 0
+
+    def __repr__(self):
+        return f"CardCollection({self.enc_list()!r})"
+
+    def add(self, card: Card):
+        self.mask |= 1 << card.index
+
+    def discard(self, card: Card):
+        self.mask &= ~(1 << card.index)
+
+    def remove(self, card: Card):
+        bit = 1 << card.index
+        if not self.mask & bit:
+            raise KeyError(card)
+        self.mask ^= bit
+
+    def clear(self):
+        self.mask = 0
+
+    def copy(self) -> 'CardCollection':
+        return CardCollection.from_mask(self.mask)
+
+    def __eq__(self, other):
+        mask = self._mask_of(other)
+        if mask is None:
+            return super(CardCollection, self).__eq__(other)
+        return self.mask == mask
+
+    __hash__ = None
+
+    def __or__(self, other):
+        mask = self._mask_of(other)
+        if mask is None:
+            return super(CardCollection, self).__or__(other)
+        return CardCollection.from_mask(self.mask | mask)
+
+    def __and__(self, other):
+        mask = self._mask_of(other)
+        if mask is None:
+            return super(CardCollection, self).__and__(other)
+        return CardCollection.from_mask(self.mask & mask)
+
+    def __sub__(self, other):
+        mask = self._mask_of(other)
+        if mask is None:
+            return super(CardCollection, self).__sub__(other)
+        return CardCollection.from_mask(self.mask & ~mask)
+
+    def __ior__(self, other):
+        mask = self._mask_of(other)
+        if mask is None:
+            return super(CardCollection, self).__ior__(other)
+        self.mask |= mask
+        return self
+
+    def __iand__(self, other):
+        mask = self._mask_of(other)
+        if mask is None:
+            return super(CardCollection, self).__iand__(other)
+        self.mask &= mask
+        return self
+
+    def __isub__(self, other):
+        mask = self._mask_of(other)
+        if mask is None:
+            return super(CardCollection, self).__isub__(other)
+        self.mask &= ~mask
+        return self
+
+    def suit_cards(self, suit: Suit) -> 'CardCollection':
+        return CardCollection.from_mask(self.mask & SUIT_MASKS[suit])
+
+    def has_suit(self, suit: Suit) -> bool:
+        return bool(self.mask & SUIT_MASKS[suit])
 
     def enc_list(self):
         enclist = list()
@@ -94,33 +317,25 @@ class CardCollection(Set):
         return coll
 
     def point_value(self):
-        points = 0
-        for c in self:
-            if c.suit is not Suit.TAROCK:
-                if c.value > 4:
-                    points += c.value - 3
-                else:
-                    points += 1
-            else:
-                if c.value in (1, 21, 22):
-                    points += 5
-                else:
-                    points += 1
-        points -= 2*(len(self) // 3)
-        blatt = len(self) % 3
-        points -= blatt
-        return points, blatt
+        return mask_point_value(self.mask)
+
+
+def mask_point_value(mask: int) -> Tuple[int, int]:
+    points = 0
+    for p, point_mask in POINT_MASKS.items():
+        points += p*(mask & point_mask).bit_count()
+    return counted_points(points, mask.bit_count())
+
+
+def counted_points(points: int, n: int) -> Tuple[int, int]:
+    # Score of n cards whose values sum to points: cards are counted in groups of three
+    points -= 2*(n // 3)
+    blatt = n % 3
+    points -= blatt
+    return points, blatt
 
 
 def get_full_deck() -> CardCollection:
-    deck = CardCollection()
-    for suit in Suit:
-        if suit is not Suit.TAROCK:
-            maxval = 8
-        else:
-            maxval = 22
-        for val in range(1, maxval+1):
-            deck.add(Card(suit, val))
-    return deck
+    return CardCollection.from_mask(FULL_MASK)
 
 
@@ -0,0 +1,191 @@
+#!/usr/bin/env python
+# *-* encoding: utf-8 *-*
+
+# JSON and binary encoding of state updates for a broadcast. Lists that are shared between the
+# states of several seats (hands, talons, taken cards, scores) are encoded only once.
+# orjson is used when installed; both backends produce the same compact output.
+
+import json
+from typing import Any, Dict
+
+from .cards import DECK
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+_encoder = json.JSONEncoder(separators=(',', ':'), ensure_ascii=False)
+
+
+def dumps(value: Any) -> str:
+    if orjson is not None:
+        return orjson.dumps(value).decode()
+    return _encoder.encode(value)
+
+
+class StateEncoder:
+    # Use one encoder per broadcast: fragments are remembered by the identity of the encoded lists.
+    memo: Dict[int, tuple]
+
+    _keys: Dict[str, str] = {}
+
+    def __init__(self):
+        self.memo = dict()
+
+    def encode_value(self, value: Any) -> str:
+        if not isinstance(value, list):
+            return dumps(value)
+        hit = self.memo.get(id(value))
+        if hit is not None:
+            return hit[1]
+        if value and isinstance(value[0], list):
+            encoded = '[' + ','.join([self.encode_value(x) for x in value]) + ']'
+        else:
+            encoded = dumps(value)
+        # Keep a reference to value so that its id cannot be reused during the broadcast
+        self.memo[id(value)] = (value, encoded)
+        return encoded
+
+    def encode(self, update: Dict[str, Any]) -> str:
+        parts = []
+        for key, value in update.items():
+            encoded_key = self._keys.get(key)
+            if encoded_key is None:
+                encoded_key = self._keys[key] = dumps(key)
+            parts.append(encoded_key + ':' + self.encode_value(value))
+        return '{' + ','.join(parts) + '}'
+
+
+# Binary encoding of state updates, used for clients that negotiate the websocket subprotocol
+# BINARY_PROTOCOL (see decode_binary and htdocs/js/tarock.js). A message is a sequence of fields:
+# a tag byte (the index of the key in BINARY_KEYS, or 255 followed by the key as a string) and a
+# value. Values start with a type byte; integers are zigzag varints, cards are their index in DECK
+# (255 for a hidden card) and card lists in the order of DECK are sent as a 56-bit mask.
+BINARY_PROTOCOL = 'tarock.bin.v1'
+JSON_PROTOCOL = 'tarock.json'
+BINARY_KEYS = ('player_0', 'playerhand_1', 'playerhand_2', 'playerhand_3', 'talon_a', 'talon_b',
+               'move', 'played_0', 'played_1', 'played_2', 'played_3', 'stage', 'legal_moves', 'taken_0',
+               'taken_cards', 'post_talon_a', 'post_talon_b', 'teams', 'score', 'single_score', 'stiche',
+               'player_names', 'primary', 'gametype', 'alertmsg', 'running_score', 'hand_strength')
+# Keys whose strings are cards
+CARD_KEYS = frozenset(('player_0', 'playerhand_1', 'playerhand_2', 'playerhand_3', 'talon_a', 'talon_b',
+                       'played_0', 'played_1', 'played_2', 'played_3', 'legal_moves', 'taken_0', 'taken_cards',
+                       'post_talon_a', 'post_talon_b'))
+OTHER_KEY = 255
+HIDDEN_CARD = 255
+TYPE_NULL, TYPE_FALSE, TYPE_TRUE, TYPE_INT, TYPE_STR, TYPE_MASK, TYPE_CARDS, TYPE_LIST = range(8)
+MASK_BYTES = 7
+
+_tags = {key: bytes([i]) for i, key in enumerate(BINARY_KEYS)}
+_card_indices = {c.enc_str(): c.index for c in DECK}
+_card_names = [c.enc_str() for c in DECK]
+
+
+def _varint(n: int) -> bytes:
+    out = bytearray()
+    while n >= 0x80:
+        out.append(n & 0x7f | 0x80)
+        n >>= 7
+    out.append(n)
+    return bytes(out)
+
+
+def _is_card_list(value: list) -> bool:
+    return all(x is None or isinstance(x, str) for x in value)
+
+
+class BinaryStateEncoder(StateEncoder):
+    # Same use as StateEncoder, but encode() returns bytes
+
+    def encode_value(self, value: Any, cards: bool = False) -> bytes:
+        if value is None:
+            return bytes([TYPE_NULL])
+        if value is True or value is False:
+            return bytes([TYPE_TRUE if value else TYPE_FALSE])
+        if isinstance(value, int):
+            return bytes([TYPE_INT]) + _varint(value << 1 if value >= 0 else (-value << 1) - 1)
+        if isinstance(value, str):
+            encoded = value.encode('utf-8')
+            return bytes([TYPE_STR]) + _varint(len(encoded)) + encoded
+        if not isinstance(value, (list, tuple)):
+            raise TypeError(f'Cannot encode {value!r}')
+        hit = self.memo.get(id(value))
+        if hit is not None:
+            return hit[1]
+        if cards and _is_card_list(value):
+            indices = [HIDDEN_CARD if x is None else _card_indices[x] for x in value]
+            if len(indices) >= MASK_BYTES and HIDDEN_CARD not in indices and indices == sorted(set(indices)):
+                encoded = bytes([TYPE_MASK]) + sum(1 << i for i in indices).to_bytes(MASK_BYTES, 'little')
+            else:
+                encoded = bytes([TYPE_CARDS]) + _varint(len(indices)) + bytes(indices)
+        else:
+            encoded = bytes([TYPE_LIST]) + _varint(len(value)) + b''.join([self.encode_value(x, cards)
+                                                                           for x in value])
+        self.memo[id(value)] = (value, encoded)
+        return encoded
+
+    def encode(self, update: Dict[str, Any]) -> bytes:
+        parts = []
+        for key, value in update.items():
+            tag = _tags.get(key)
+            if tag is None:
+                tag = bytes([OTHER_KEY]) + self.encode_value(key)
+            parts.append(tag)
+            parts.append(self.encode_value(value, key in CARD_KEYS))
+        return b''.join(parts)
+
+
+def binary_dumps(update: Dict[str, Any]) -> bytes:
+    return BinaryStateEncoder().encode(update)
+
+
+def decode_binary(data: bytes) -> Dict[str, Any]:
+    # Inverse of BinaryStateEncoder.encode, for tests and tools; the web client has its own decoder
+    offset = 0
+
+    def varint() -> int:
+        nonlocal offset
+        n = shift = 0
+        while True:
+            b = data[offset]
+            offset += 1
+            n |= (b & 0x7f) << shift
+            shift += 7
+            if b < 0x80:
+                return n
+
+    def value() -> Any:
+        nonlocal offset
+        kind = data[offset]
+        offset += 1
+        if kind == TYPE_NULL:
+            return None
+        if kind in (TYPE_FALSE, TYPE_TRUE):
+            return kind == TYPE_TRUE
+        if kind == TYPE_INT:
+            n = varint()
+            return -((n + 1) >> 1) if n & 1 else n >> 1
+        if kind == TYPE_STR:
+            n = varint()
+            offset += n
+            return data[offset - n:offset].decode('utf-8')
+        if kind == TYPE_MASK:
+            mask = int.from_bytes(data[offset:offset + MASK_BYTES], 'little')
+            offset += MASK_BYTES
+            return [name for i, name in enumerate(_card_names) if mask >> i & 1]
+        if kind == TYPE_CARDS:
+            n = varint()
+            offset += n
+            return [None if i == HIDDEN_CARD else _card_names[i] for i in data[offset - n:offset]]
+        if kind == TYPE_LIST:
+            return [value() for _ in range(varint())]
+        raise ValueError(f'Unknown type {kind!s}')
+
+    update = {}
+    while offset < len(data):
+        tag = data[offset]
+        offset += 1
+        key = value() if tag == OTHER_KEY else BINARY_KEYS[tag]
+        update[key] = value()
+    return update
@@ -0,0 +1,173 @@
+#!/usr/bin/env python
+# *-* encoding: utf-8 *-*
+
+# Perfect-information endgame solver: an alpha-beta search over the remaining tricks of a game with
+# all hands known, used to check a player's claim to take all remaining tricks (see claim).
+
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from .cards import Card, CardCollection, TRICK_RANKS, trick_winner
+from .game import Game, GameStage, GameType, IllegalPlay, legal_cards
+
+# Claims are checked inline on the server, so the search for the last few tricks is limited to
+# MAX_CLAIM_NODES positions (about 50ms); 99% of the claims need fewer than 300.
+MAX_CLAIM_TRICKS = 6
+MAX_CLAIM_NODES = 10000
+
+# Hands (as masks), center cards, ausspieler (None at the start of a trick) and the seat to move
+Position = Tuple[List[int], List[Optional[Card]], Optional[int], int]
+
+
+def _(msg):
+    return msg
+
+
+class SearchLimit(Exception):
+    pass
+
+
+class EndgameSolver:
+    # The value of a position is the number of remaining tricks taken by the seats of side, which
+    # maximise it while the other seats minimise it. The transposition table maps the hands and the
+    # seat to lead at the start of a trick to (lower bound, upper bound, index of the best card).
+    game_type: GameType
+    trumps: bool
+    side: Tuple[bool, ...]
+    table: Dict[Tuple[Tuple[int, ...], int], Tuple[int, int, Optional[int]]]
+    nodes: int
+    max_nodes: Optional[int]
+
+    def __init__(self, game_type: GameType, side: Iterable[int], max_nodes: Optional[int] = None):
+        self.game_type = game_type
+        self.trumps = game_type is not GameType.COLORGAME
+        side = set(side)
+        self.side = tuple(i in side for i in range(4))
+        self.table = dict()
+        self.nodes = 0
+        # search raises SearchLimit once it visited more positions
+        self.max_nodes = max_nodes
+
+    def search(self, hands: List[int], cards: List[Optional[Card]], ausspieler: Optional[int], move: int,
+               alpha: int, beta: int) -> int:
+        # Fail-soft alpha-beta: the exact value if it lies between alpha and beta, otherwise a bound
+        self.nodes += 1
+        if self.max_nodes is not None and self.nodes > self.max_nodes:
+            raise SearchLimit()
+        key = None
+        first = None
+        if ausspieler is None:
+            tricks = hands[move].bit_count()
+            if tricks == 0:
+                return 0
+            key = (tuple(hands), move)
+            lower, upper, first = self.table.get(key, (0, tricks, None))
+            if lower >= beta or lower == upper:
+                return lower
+            if upper <= alpha:
+                return upper
+            alpha = max(alpha, lower)
+            beta = min(beta, upper)
+        window = (alpha, beta)
+        maximizing = self.side[move]
+        best = None
+        best_card = None
+        for card in self.order(hands, cards, ausspieler, move, first):
+            value = self.play(hands, cards, ausspieler, move, card, alpha, beta)
+            if best is None or (value > best if maximizing else value < best):
+                best = value
+                best_card = card
+            if maximizing:
+                alpha = max(alpha, value)
+            else:
+                beta = min(beta, value)
+            if alpha >= beta:
+                break
+        if key is not None:
+            lower, upper = self.table.get(key, (0, tricks, None))[:2]
+            if best > window[0]:
+                lower = max(lower, best)
+            if best < window[1]:
+                upper = min(upper, best)
+            self.table[key] = (lower, upper, best_card.index)
+        return best
+
+    def play(self, hands: List[int], cards: List[Optional[Card]], ausspieler: Optional[int], move: int,
+             card: Card, alpha: int, beta: int) -> int:
+        # Value of the position after move plays card, including the current trick
+        hands = list(hands)
+        hands[move] &= ~(1 << card.index)
+        if ausspieler is None:
+            ausspieler = move
+            cards = [None]*4
+        else:
+            cards = list(cards)
+        cards[move] = card
+        following = (move + 1) % 4
+        if following != ausspieler:
+            return self.search(hands, cards, ausspieler, following, alpha, beta)
+        winner = trick_winner(cards, ausspieler, trumps=self.trumps)
+        won = 1 if self.side[winner] else 0
+        return won + self.search(hands, [None]*4, None, winner, alpha - won, beta - won)
+
+    def order(self, hands: List[int], cards: List[Optional[Card]], ausspieler: Optional[int], move: int,
+              first: Optional[int] = None) -> List[Card]:
+        # Legal cards, the best card of an earlier search first. Then cards that take the trick so far
+        # from the strongest, then the others from the weakest; a lead counts as taking the trick.
+        legal = legal_cards(CardCollection.from_mask(hands[move]), cards, ausspieler, move, self.game_type)
+        if ausspieler is None:
+            ranked = sorted(legal, key=lambda c: (c.index != first, -TRICK_RANKS[self.trumps][c.suit][c.index]))
+        else:
+            ranks = TRICK_RANKS[self.trumps][cards[ausspieler].suit]
+            high = max(ranks[c.index] for c in cards if c is not None)
+            ranked = sorted(legal, key=lambda c: (c.index != first, ranks[c.index] <= high,
+                                                  ranks[c.index] if ranks[c.index] <= high else -ranks[c.index]))
+        return ranked
+
+
+def position(game: Game) -> Position:
+    hands = [p.hand_cards.mask for p in game.players]
+    if game.move == game.ausspieler:
+        # The cards of the last trick stay in the center until the next card is played
+        return hands, [None]*4, None, game.move
+    return hands, list(game.center_cards), game.ausspieler, game.move
+
+
+def remaining_tricks(game: Game) -> int:
+    # Including the current trick
+    return max(len(p.hand_cards) for p in game.players)
+
+
+def solve(game: Game, side: Iterable[int]) -> int:
+    # Number of remaining tricks the seats of side take if all seats play perfectly
+    hands, cards, ausspieler, move = position(game)
+    return EndgameSolver(game.game_type, side).search(hands, cards, ausspieler, move, 0, remaining_tricks(game))
+
+
+def claim(game: Game, playerid: int, max_tricks: int = MAX_CLAIM_TRICKS, max_nodes: int = MAX_CLAIM_NODES):
+    # Checks the claim of playerid to take all remaining tricks whatever the others play and plays
+    # them out if it holds: playerid with proven cards, the other seats with their first legal card.
+    if game.game_stage is not GameStage.INGAME:
+        raise IllegalPlay(_('Tricks can only be claimed during the game.'))
+    tricks = remaining_tricks(game)
+    if tricks > max_tricks:
+        raise IllegalPlay(_('Only the last tricks can be claimed.'))
+    solver = EndgameSolver(game.game_type, [playerid], max_nodes)
+    hands, cards, ausspieler, move = position(game)
+    # A null window: the search only has to prove that the value reaches tricks
+    try:
+        value = solver.search(hands, cards, ausspieler, move, tricks - 1, tricks)
+    except SearchLimit:
+        raise IllegalPlay(_('The claim cannot be checked yet, play a few more cards.'))
+    if value < tricks:
+        raise IllegalPlay(_('The remaining tricks are not certain to be yours.'))
+    # The proof is in the transposition table, playing it out takes few more positions
+    solver.max_nodes = None
+    while game.game_stage is GameStage.INGAME:
+        if game.move != playerid:
+            game.autoplay()
+            continue
+        tricks = remaining_tricks(game)
+        hands, cards, ausspieler, move = position(game)
+        card = next(c for c in solver.order(hands, cards, ausspieler, move)
+                    if solver.play(hands, cards, ausspieler, move, c, tricks - 1, tricks) >= tricks)
+        game.play_card(playerid, card)
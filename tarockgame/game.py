@@ -1,17 +1,63 @@
 import time
 
-from .cards import Card, CardCollection, get_full_deck, Suit
-from typing import Optional, List, Tuple, Dict
+from .cards import Card, CardCollection, Suit, trick_winner, DECK, FULL_MASK, PAGAT, MOND, SKUES, UNDROPPABLE_MASK, \
+    CARD_POINTS, counted_points
+from .handstrength import hand_strength
+from typing import Optional, List, Tuple, Dict, Iterable, Iterator, Set, TYPE_CHECKING
 from enum import Enum
 import random
 from collections import deque
 from prometheus_client import Summary, Counter
 
+if TYPE_CHECKING:
+    from .gamelog import GameLog
+
 PYTAROCK_GAMES = Summary(name='pytarock_games_seconds', documentation='Finished game lengths')
 PYTAROCK_CARDS_PLAYED = Counter(name='pytarock_cards_played', documentation='Number of cards played')
 PYTAROCK_ILLEGAL_PLAYS = Counter(name='pytarock_illegal_plays', documentation='Number of illegal moves')
 
 
+# A deal is given by six card masks: the four hands (12 cards each) followed by the two talons (3 cards each)
+Deal = Tuple[int, int, int, int, int, int]
+DEAL_SIZES = (12, 12, 12, 12, 3, 3)
+
+
+def random_deal(rng=random) -> Deal:
+    order = list(range(len(DECK)))
+    rng.shuffle(order)
+    deal = []
+    start = 0
+    for size in DEAL_SIZES:
+        mask = 0
+        for i in order[start:start+size]:
+            mask |= 1 << i
+        deal.append(mask)
+        start += size
+    return tuple(deal)
+
+
+def generate_deals(count: int, seed: Optional[int] = None) -> Iterator[Deal]:
+    rng = random.Random(seed)
+    for _ in range(count):
+        yield random_deal(rng)
+
+
+def check_deal(deal: Deal):
+    if len(deal) != len(DEAL_SIZES):
+        raise ValueError('A deal consists of four hands and two talons.')
+    seen = 0
+    for mask, size in zip(deal, DEAL_SIZES):
+        if mask.bit_count() != size or mask & seen:
+            raise ValueError('Invalid deal.')
+        seen |= mask
+    if seen != FULL_MASK:
+        raise ValueError('Invalid deal.')
+
+
+# Parts of the state sent to the players, see Game.get_state
+STATE_GROUPS = ('hands', 'talons', 'move', 'played', 'stage', 'taken', 'score', 'stiche', 'names', 'gametype')
+
+
 class IllegalPlay(Exception):
     def __init__(self, msg, *args):
         Exception.__init__(self, msg, *args)
@@ -64,6 +110,49 @@ class GameStage(Enum):
         return self.value < other.value
 
 
+def legal_cards(hand: CardCollection,
+                cards: List[Optional[Card]],
+                ausspieler: Optional[int],
+                playerid: int,
+                game_type: GameType) -> CardCollection:
+    # Cards of hand that playerid may add to the trick cards led by ausspieler (None if playerid leads)
+    if ausspieler is None:
+        cards = [None]*4
+        ausspieler = playerid
+        if game_type is GameType.COLORGAME and hand - hand.suit_cards(Suit.TAROCK):
+            legal = hand - hand.suit_cards(Suit.TAROCK)
+        else:
+            legal = hand.copy()
+    else:
+        cards = list(cards)
+        played_suit = cards[ausspieler].suit
+        # Farbzwang
+        if hand.has_suit(played_suit):
+            legal = hand.suit_cards(played_suit)
+        # Tarockzwang
+        elif played_suit is not Suit.TAROCK and hand.has_suit(Suit.TAROCK):
+            legal = hand.suit_cards(Suit.TAROCK)
+        else:
+            legal = hand.copy()
+
+    if game_type is GameType.NEGATIVE:
+        # Stichzwang: if any legal card takes the trick, one of those has to be played
+        winning = CardCollection()
+        for c in legal:
+            cards[playerid] = c
+            if trick_winner(cards, ausspieler) == playerid:
+                winning.add(c)
+        cards[playerid] = None
+        if winning:
+            legal = winning
+        # The Pagat may only be played last, unless Sküs and Mond are in the trick
+        if PAGAT in legal and len(hand.suit_cards(Suit.TAROCK)) > 1 \
+                and (SKUES not in cards or MOND not in cards):
+            legal.discard(PAGAT)
+
+    return legal
+
+
 class Table:
     talons_in_center: List[Optional[bool]]
     center_cards: List[Card]
@@ -91,14 +180,34 @@ class Game(Table):
     teams: Optional[List[int]]
     score: Optional[List[str]]
     single_score: Optional[List[str]]
+    points: List[List[int]]
+    dropped_points: List[int]
     ouvert: bool
     stiche: int
+    played_tricks: List[Tuple[int, List[Card]]]
+    seed: Optional[int]
+    deal: Deal
+    changed: Set[str]
+    version: int
+    history: List[Tuple]
+    id: int
+    log: Optional['GameLog']
 
     def __init__(self,
                  primary_player: int,
                  game_type: Optional[GameType] = None,
+                 seed: Optional[int] = None,
+                 rng: Optional[random.Random] = None,
+                 deal: Optional[Deal] = None,
                  ):
         Table.__init__(self)
+        self.changed = set(STATE_GROUPS)
+        self.version = 0
+        self._encoded = {}
+        # Every accepted action, enough to replay the game from its deal (see snapshot)
+        self.history = []
+        self.id = random.getrandbits(64)
+        self.log = None
         players = list()
         for i in range(4):
             p = Player(playerid=i)
@@ -107,7 +216,11 @@ class Game(Table):
         self.primary_player = primary_player
         assert 0 <= primary_player < 4
         self.game_type = game_type
-        self.deal_cards()
+        if deal is None:
+            self.deal_cards(rng=rng, seed=seed)
+        else:
+            self.seed = None
+            self.set_deal(deal)
         self.move = None
         self.ausspieler = None
         self.game_stage = GameStage.PREGAME
@@ -116,27 +229,37 @@ class Game(Table):
         self.single_score = [""]*6
         self.ouvert = False
         self.stiche = 0
-
-    def deal_cards(self):
-        deck = get_full_deck()
-        for p in self.players:
-            for _ in range(12):
-                c = random.choice(list(deck))
-                deck.remove(c)
-                p.hand_cards.add(c)
-        self.talons = (CardCollection(), CardCollection())
-        self.original_talons = (CardCollection(), CardCollection())
-        for t, t2 in zip(self.talons, self.original_talons):
-            for _ in range(3):
-                c = random.choice(list(deck))
-                deck.remove(c)
-                t.add(c)
-                t2.add(c)
-        assert len(deck) == 0
+        # (ausspieler, cards) of every finished trick in order
+        self.played_tricks = []
+
+    def deal_cards(self, rng: Optional[random.Random] = None, seed: Optional[int] = None):
+        if rng is None:
+            # Draw a seed so the deal can be reproduced later
+            if seed is None:
+                seed = random.getrandbits(64)
+            rng = random.Random(seed)
+        self.seed = seed
+        self.set_deal(random_deal(rng))
+
+    def set_deal(self, deal: Deal):
+        check_deal(deal)
+        self.touch('hands', 'talons', 'move')
+        self.deal = tuple(deal)
+        for p, mask in zip(self.players, deal[:4]):
+            p.hand_cards = CardCollection.from_mask(mask)
+        self.talons = (CardCollection.from_mask(deal[4]), CardCollection.from_mask(deal[5]))
+        self.original_talons = (CardCollection.from_mask(deal[4]), CardCollection.from_mask(deal[5]))
+        # [sum of the card values, number of cards] taken by each player and left in each talon, in the
+        # order of single_score; kept up to date as cards move so that scores need no card collections
+        self.points = [[0, 0] for _ in range(4)] + [[sum(CARD_POINTS[c.index] for c in talon), len(talon)]
+                                                    for talon in self.talons]
+        # The part of the points of the primary player that was dropped after taking the talon (hidden)
+        self.dropped_points = [0, 0]
 
     def set_game_type(self, type: GameType):
         if self.game_stage > GameStage.PREGAME:
             raise IllegalPlay("Game Type can only be selected pre-game.")
+        self.touch('stage', 'gametype', 'move', 'stiche')
         if type is GameType.SECHSERDREIER:
             self.game_type = GameType.POSITIVE
             self._transfer_talon(self.primary_player, 0)
@@ -147,15 +270,23 @@ class Game(Table):
         if self.game_type is not GameType.NEGATIVE:
             self.move = self.primary_player
             self.ausspieler = self.primary_player
+        self.record(('gametype', type.value))
 
     def set_ouvert(self, ouvert: bool):
         if self.game_stage > GameStage.PREGAME:
             raise IllegalPlay("Ouvert can only be selected pre-game.")
+        self.touch('hands')
         self.ouvert = ouvert
+        self.record(('ouvert', ouvert))
 
     def finish_play(self):
         highest, highest_card = self._find_highest_card()
+        self.touch('taken', 'move', 'hands', 'stiche')
         self.players[highest].taken_cards.append(self.center_cards)
+        points = self.points[highest]
+        points[0] += sum(CARD_POINTS[c.index] for c in self.center_cards)
+        points[1] += 4
+        self.played_tricks.append((self.ausspieler, self.center_cards))
         self.ausspieler = highest
         self.move = highest
         self.stiche += 1
@@ -163,38 +294,19 @@ class Game(Table):
     def _find_highest_card(self, cards: List[Card] = None) -> (int, Card):
         if cards is None:
             cards = self.center_cards
-        highest = self.ausspieler
-        highest_card = cards[self.ausspieler]
-        i_one = None
-        i_twentyone = None
-        for i, card in enumerate(cards):
-            if card is None:
-                continue
-            if card == Card(Suit.TAROCK, 21):
-                i_twentyone = i
-            elif card == Card(Suit.TAROCK, 1):
-                i_one = i
-            if highest_card.suit == card.suit:
-                if card.value > highest_card.value:
-                    highest = i
-                    highest_card = card
-            elif card.suit is Suit.TAROCK and self.game_type is not GameType.COLORGAME:
-                highest = i
-                highest_card = card
-        if highest_card == Card(Suit.TAROCK, 22) and i_one is not None and i_twentyone is not None:
-            highest = i_one
-        return highest, highest_card
+        highest = trick_winner(cards, self.ausspieler, trumps=self.game_type is not GameType.COLORGAME)
+        return highest, cards[highest]
+
+    def tricks_taken(self) -> List[int]:
+        # Cards dropped after taking the talon are kept in taken_cards as well, but are not a trick
+        return [len([x for x in p.taken_cards if len(x) == 4]) for p in self.players]
 
     def autoplay(self):
         if self.move is None:
             return False
-        for c in self.players[self.move].hand_cards:
-            try:
-                self.play_card(self.move, c)
-            except IllegalPlay:
-                pass
-            else:
-                return True
+        for c in self.legal_moves(self.move):
+            self.play_card(self.move, c)
+            return True
         return False
 
     def play_card(self,
@@ -215,10 +327,14 @@ class Game(Table):
                     # Trull und Könige können nicht abgelegt werden.
                     raise IllegalPlay("You cannot drop this card.")
 
+                self.touch('hands', 'taken', 'stage', 'move')
                 if len(self.players[playerid].taken_cards) == 0:
                     self.players[playerid].taken_cards.append([])
                 self.players[playerid].taken_cards[-1].append(card)
                 self.players[playerid].hand_cards.remove(card)
+                for points in (self.points[playerid], self.dropped_points):
+                    points[0] += CARD_POINTS[card.index]
+                    points[1] += 1
                 if len(self.players[playerid].hand_cards) == 12:
                     self.game_stage = GameStage.TALONRETURNED
             else:
@@ -229,6 +345,7 @@ class Game(Table):
                     assert self.ausspieler is None
                     self.ausspieler = playerid
                     self.move = playerid
+                self.touch('stage', 'move')
                 self.game_stage = GameStage.INGAME
                 self.game_started_timer = time.monotonic()
                 self.talons_in_center = [False]*2
@@ -241,9 +358,11 @@ class Game(Table):
             if card not in self.players[playerid].hand_cards:
                 raise IllegalPlay("You do not have this card. Are you cheating?")
             if self.move == self.ausspieler:
+                self.touch('played')
                 self.center_cards = [None]*4
-            if not self._check_legal_play(playerid=playerid, card=card):
+            if card not in self.legal_moves(playerid):
                 raise IllegalPlay("You are not allowed to play this card.")
+            self.touch('hands', 'played', 'move')
             self.center_cards[playerid] = card
             self.players[playerid].hand_cards.remove(card)
             self.move = (playerid + 1) % 4
@@ -252,9 +371,11 @@ class Game(Table):
                 self.finish_play()
             self.is_finished()
             PYTAROCK_CARDS_PLAYED.inc()
+        self.record(('card', playerid, card.index))
 
     def is_finished(self) -> bool:
         if all([len(p.hand_cards) == 0 for p in self.players]):
+            self.touch('stage', 'move', 'taken', 'score')
             self.move = None
             self.game_stage = GameStage.POSTGAME
             self.calculate_score()
@@ -264,63 +385,30 @@ class Game(Table):
         else:
             return False
 
-    def _check_legal_play(self,
-                          playerid: int,
-                          card: Card,
-                          check_stichzwang=True) -> bool:
-        if playerid == self.ausspieler:
-            if self.game_type is GameType.COLORGAME:
-                if card.suit is Suit.TAROCK:
-                    for c in self.players[playerid].hand_cards:
-                        if c.suit is not Suit.TAROCK:
-                            return False
-        else:
-            # Farbzwang
-            played_suit = self.center_cards[self.ausspieler].suit
-            if card.suit is not played_suit:
-                for c in self.players[playerid].hand_cards:
-                    if c.suit is played_suit:
-                        return False
-                # Tarockzwang
-                if played_suit is not Suit.TAROCK and card.suit is not Suit.TAROCK:
-                    for c in self.players[playerid].hand_cards:
-                        if c.suit is Suit.TAROCK:
-                            return False
-
-            if not check_stichzwang:
-                return True
-
-        if self.game_type is GameType.NEGATIVE:
-            cards = self.center_cards.copy()
-            cards[playerid] = card
-            i_highest, _ = self._find_highest_card(cards)
-            if i_highest != playerid:
-                for c in self.players[playerid].hand_cards:
-                    if c == card:
-                        continue
-                    if not self._check_legal_play(playerid, c, check_stichzwang=False):
-                        continue
-                    cards[playerid] = c
-                    i_tmp, _ = self._find_highest_card(cards)
-                    if i_tmp == playerid:
-                        return False
-            if card == Card(Suit.TAROCK, 1):
-                has_other = False
-                for c in self.players[playerid].hand_cards:
-                    if c.suit is Suit.TAROCK and c.value > 1:
-                        has_other = True
-                        break
-                if has_other and (Card(Suit.TAROCK, 22) not in self.center_cards or Card(Suit.TAROCK, 21) not in self.center_cards):
-                    return False
-
-        return True
+    def legal_moves(self, playerid: int) -> CardCollection:
+        hand = self.players[playerid].hand_cards
+        if self.game_stage is GameStage.TALONTAKEN:
+            if len(hand) > 12:
+                # Trull und Könige können nicht abgelegt werden.
+                return CardCollection.from_mask(hand.mask & ~UNDROPPABLE_MASK)
+            return CardCollection()
+        if self.game_stage < GameStage.TYPESELECTED or self.game_stage > GameStage.INGAME:
+            return CardCollection()
+        if self.move is not None and self.move != playerid:
+            return CardCollection()
+
+        if self.move is None or self.move == self.ausspieler:
+            return legal_cards(hand, [None]*4, None, playerid, self.game_type)
+        return legal_cards(hand, self.center_cards, self.ausspieler, playerid, self.game_type)
 
     def uncover_talon(self, playerid: int):
         if playerid != self.primary_player:
             raise IllegalPlay('It needs to be your game to uncover the talon.')
         if self.talons_uncovered:
             raise IllegalPlay('The talon was already uncovered.')
+        self.touch('talons')
         self.talons_uncovered = True
+        self.record(('uncover', playerid))
 
     def take_talon(self, playerid: int, talon_number: int):
         if self.game_stage < GameStage.TYPESELECTED:
@@ -337,149 +425,282 @@ class Game(Table):
         if not all(self.talons_in_center):
             raise IllegalPlay('Talon was already taken.')
         self._transfer_talon(playerid=playerid, talon_number=talon_number)
+        self.record(('talon', playerid, talon_number))
 
     def _transfer_talon(self, playerid: int, talon_number: int):
+        self.touch('stage', 'talons', 'hands', 'move')
         self.game_stage = GameStage.TALONTAKEN
         self.talons_in_center[talon_number] = False
+        self.points[4 + talon_number] = [0, 0]
         for card in self.talons[talon_number]:
             self.players[playerid].hand_cards.add(card)
             self.talons[talon_number].remove(card)
 
+    def set_teams(self, teams: List[int]):
+        # The team (0 or 1) of each player and of the two talons
+        if len(teams) != 6 or not all(isinstance(t, int) and t in (0, 1) for t in teams):
+            raise IllegalPlay('Each player and talon needs to be in team 0 or 1.')
+        # Checked before anything changes, the teams are only recorded with a score
+        if self.game_stage < GameStage.POSTGAME:
+            raise IllegalPlay('Score can only be calculated after the game.')
+        self.teams = teams
+        self.calculate_score()
+        self.record(('teams', list(teams)))
+
+    def finish_game(self):
+        self.touch('stage', 'move', 'taken', 'score')
+        self.game_stage = GameStage.POSTGAME
+        self.calculate_score()
+        self.record(('finish',))
+
     def calculate_score(self):
         if self.game_stage < GameStage.POSTGAME:
             raise IllegalPlay('Score can only be calculated after the game.')
         if self.teams is None:
             raise IllegalPlay('You have to select the teams first.')
+        self.touch('score')
         team_points = list()
         for i_team in range(2):
-            cc = CardCollection()
-            for i_player in range(4):
-                if self.teams[i_player] == i_team:
-                    for stich in self.players[i_player].taken_cards:
-                        for c in stich:
-                            cc.add(c)
-            if self.teams[4] == i_team:
-                cc |= self.talons[0]
-            if self.teams[5] == i_team:
-                cc |= self.talons[1]
-            points = cc.point_value()
-            team_points.append(points)
+            value = n = 0
+            for i, points in enumerate(self.points):
+                if self.teams[i] == i_team:
+                    value += points[0]
+                    n += points[1]
+            team_points.append(counted_points(value, n))
         self.score = team_points
-        self.single_score = []
-        for i in range(6):
-            cc = CardCollection()
-            if i < 4:
-                for stich in self.players[i].taken_cards:
-                    for c in stich:
-                        cc.add(c)
-            elif i == 4:
-                cc |= self.talons[0]
-            elif i == 5:
-                cc |= self.talons[1]
-            points = cc.point_value()
-            self.single_score.append(points)
-
-    def get_state(self, playerid, players):
+        self.single_score = [counted_points(*points) for points in self.points]
+
+    def running_score(self, playerid: int, public: bool = False) -> List[Tuple[int, int]]:
+        # Scores of the cards taken so far by each player, seen by playerid; the cards dropped by
+        # the primary player count only for themselves until the end of the game
+        running = []
+        for i in range(4):
+            j = (playerid + i) % 4
+            value, n = self.points[j]
+            if j == self.primary_player and (public or j != playerid) and self.game_stage < GameStage.POSTGAME:
+                value -= self.dropped_points[0]
+                n -= self.dropped_points[1]
+            running.append(counted_points(value, n))
+        return running
+
+    def hands_revealed(self) -> bool:
+        # In ouvert games all hands are shown once the first card of the second trick is played
+        return self.ouvert and (self.stiche > 1 or
+                                (self.stiche == 1 and len([True for x in self.center_cards if x is not None]) in (1, 2, 3)))
+
+    def touch(self, *groups: str):
+        # Marks parts of the state (see STATE_GROUPS) as changed since the last broadcast
+        self.changed.update(groups)
+        self.version += 1
+        self._encoded = {}
+
+    def take_changes(self) -> Set[str]:
+        changed = self.changed
+        self.changed = set()
+        self._encoded = {}
+        return changed
+
+    def record(self, action: Tuple):
+        self.history.append(action)
+        if self.log is not None:
+            self.log.write(self.id, action)
+
+    def snapshot(self) -> Dict:
+        # Plain data (JSON compatible) from which from_snapshot restores the game.
+        # Card plays are stored as playerid << 6 | card index to keep snapshots small.
+        history = []
+        for action in self.history:
+            if action[0] == 'card':
+                history.append(action[1] << 6 | action[2])
+            else:
+                history.append(list(action))
+        return {'id': self.id,
+                'primary': self.primary_player,
+                'seed': self.seed,
+                'deal': list(self.deal),
+                'history': history}
+
+    @classmethod
+    def from_snapshot(cls, data: Dict) -> 'Game':
+        game = cls(primary_player=data['primary'], deal=tuple(data['deal']))
+        # Snapshots written before games had ids keep the new random id
+        game.id = data.get('id', game.id)
+        game.seed = data['seed']
+        for action in data['history']:
+            if isinstance(action, int):
+                game.replay(('card', action >> 6, action & 63))
+            else:
+                game.replay(tuple(action))
+        return game
+
+    def replay(self, action: Tuple):
+        kind, args = action[0], action[1:]
+        if kind == 'card':
+            self.play_card(args[0], DECK[args[1]])
+        elif kind == 'gametype':
+            self.set_game_type(GameType(args[0]))
+        elif kind == 'ouvert':
+            self.set_ouvert(args[0])
+        elif kind == 'uncover':
+            self.uncover_talon(args[0])
+        elif kind == 'talon':
+            self.take_talon(args[0], args[1])
+        elif kind == 'teams':
+            self.set_teams(args[0])
+        elif kind == 'finish':
+            self.finish_game()
+        else:
+            raise ValueError(f'Unknown action {kind!s}')
+
+    def _encoded_cards(self, kind: str, i: int) -> List:
+        # Encoded card lists are shared by the states of all seats (and reused by StateEncoder)
+        key = (kind, i)
+        encoded = self._encoded.get(key)
+        if encoded is None:
+            if kind == 'hand':
+                encoded = self.players[i].hand_cards.enc_list()
+            elif kind == 'talon':
+                encoded = self.talons[i].enc_list()
+            else:
+                encoded = [[x.enc_str() for x in y] for y in self.players[i].taken_cards]
+            self._encoded[key] = encoded
+        return encoded
+
+    def get_state(self, playerid, players, groups: Optional[Iterable[str]] = None, public: bool = False):
+        # Builds the state as seen by playerid; with groups, only the fields of those groups.
+        # The public state is the view of a spectator sitting behind playerid, without the hand of playerid.
+        if groups is None:
+            groups = STATE_GROUPS
         player = self.players[playerid]
         msg = {}
 
-        hand = player.hand_cards.enc_list()
-        msg['player_0'] = hand
-
-        for i in range(1, 4):
-            if self.ouvert and (self.stiche > 1 or
-                                (self.stiche == 1 and len([True for x in self.center_cards if x is not None]) in (1, 2, 3))):
-                hand = self.players[(playerid + i) % 4].hand_cards.enc_list()
+        if 'hands' in groups:
+            revealed = self.hands_revealed()
+            if public and not revealed:
+                msg['player_0'] = []
             else:
-                hand = []
-            msg[f'playerhand_{i!s}'] = hand
-
-        talon_a = self.talons[0].enc_list()
-        talon_b = self.talons[1].enc_list()
-
-        # msg['talons_in_center'] = self.talons_in_center
-        if self.talons_uncovered:
-            msg['talon_a'] = talon_a
-            msg['talon_b'] = talon_b
-        else:
-            msg['talon_a'] = [None] * len(talon_a)
-            msg['talon_b'] = [None] * len(talon_b)
+                msg['player_0'] = self._encoded_cards('hand', playerid)
+
+            for i in range(1, 4):
+                if revealed:
+                    hand = self._encoded_cards('hand', (playerid + i) % 4)
+                else:
+                    hand = []
+                msg[f'playerhand_{i!s}'] = hand
+
+        if 'talons' in groups:
+            talon_a = self._encoded_cards('talon', 0)
+            talon_b = self._encoded_cards('talon', 1)
+
+            # msg['talons_in_center'] = self.talons_in_center
+            if self.talons_uncovered:
+                msg['talon_a'] = talon_a
+                msg['talon_b'] = talon_b
+            else:
+                msg['talon_a'] = [None] * len(talon_a)
+                msg['talon_b'] = [None] * len(talon_b)
 
-        if self.move is not None:
-            msg['move'] = (self.move - playerid) % 4
-        else:
-            msg['move'] = None
+        if 'move' in groups:
+            if self.move is not None:
+                msg['move'] = (self.move - playerid) % 4
+            else:
+                msg['move'] = None
 
-        for i in range(4):
-            card = self.center_cards[(i + playerid) % 4]
-            center = [] if card is None else [card.enc_str()]
-            msg[f"played_{i!s}"] = center
+        if 'played' in groups:
+            for i in range(4):
+                card = self.center_cards[(i + playerid) % 4]
+                center = [] if card is None else [card.enc_str()]
+                msg[f"played_{i!s}"] = center
+
+        if 'stage' in groups:
+            if self.game_stage < GameStage.TYPESELECTED:
+                msg['stage'] = 'pregame'
+            elif self.game_stage < GameStage.TALONRETURNED:
+                msg['stage'] = 'talon'
+            elif self.game_stage < GameStage.POSTGAME:
+                msg['stage'] = 'ingame'
+            else:
+                msg['stage'] = 'postgame'
+            # Advice for the choice of the game type: chances to win in percent in the order of GameType
+            if self.game_stage is GameStage.PREGAME and playerid == self.primary_player and not public:
+                msg['hand_strength'] = hand_strength(player.hand_cards.mask)
+            else:
+                msg['hand_strength'] = None
 
-        if self.game_stage < GameStage.TYPESELECTED:
-            msg['stage'] = 'pregame'
-        elif self.game_stage < GameStage.TALONRETURNED:
-            msg['stage'] = 'talon'
-        elif self.game_stage < GameStage.POSTGAME:
-            msg['stage'] = 'ingame'
-        else:
-            msg['stage'] = 'postgame'
+        if 'move' in groups:
+            msg['legal_moves'] = [] if public else self.legal_moves(playerid).enc_list()
 
-        msg['taken_0'] = [[x.enc_str() for x in y] for y in self.players[playerid].taken_cards]
+        if 'taken' in groups:
+            taken = self._encoded_cards('taken', playerid)
+            if public and playerid == self.primary_player and self.dropped_points[1] \
+                    and self.game_stage < GameStage.POSTGAME:
+                # Like in running_score, the cards dropped by the primary player stay hidden until the end
+                taken = [[None]*len(taken[0])] + taken[1:]
+            msg['taken_0'] = taken
+            msg['running_score'] = self.running_score(playerid, public)
 
         if self.game_stage == GameStage.POSTGAME:
-            taken_cards = []
-            for i in range(4):
-                j = (playerid + i) % 4
-                taken = [[x.enc_str() for x in y] for y in self.players[j].taken_cards]
-                taken_cards.append(taken)
-            msg['taken_cards'] = taken_cards
-            msg['post_talon_a'] = [x.enc_str() for x in self.talons[0]]
-            msg['post_talon_b'] = [x.enc_str() for x in self.talons[1]]
-
-            teams1 = deque(self.teams[:4])
-            teams1.rotate(-playerid)
-            msg['teams'] = list(teams1) + self.teams[4:]
-            msg['score'] = self.score
-
-            single_score1 = deque(self.single_score[:4])
-            single_score1.rotate(-playerid)
-            msg['single_score'] = list(single_score1) + self.single_score[4:]
-
-        if self.game_type == GameType.NEGATIVE:
+            if 'taken' in groups:
+                taken_cards = []
+                for i in range(4):
+                    j = (playerid + i) % 4
+                    taken = self._encoded_cards('taken', j)
+                    taken_cards.append(taken)
+                msg['taken_cards'] = taken_cards
+                msg['post_talon_a'] = self._encoded_cards('talon', 0)
+                msg['post_talon_b'] = self._encoded_cards('talon', 1)
+
+            if 'score' in groups:
+                teams1 = deque(self.teams[:4])
+                teams1.rotate(-playerid)
+                msg['teams'] = list(teams1) + self.teams[4:]
+                msg['score'] = self.score
+
+                single_score1 = deque(self.single_score[:4])
+                single_score1.rotate(-playerid)
+                msg['single_score'] = list(single_score1) + self.single_score[4:]
+
+        if self.game_type == GameType.NEGATIVE and 'stiche' in groups:
             stiche = deque([len(x.taken_cards) for x in self.players])
             stiche.rotate(-playerid)
             msg['stiche'] = list(stiche)
 
-
-        player_names = []
-        for j in range(4):
-            k = (playerid + j) % 4
-            p = players[k]
-            if p is None:
-                player_names.append(None)
-            else:
-                player_names.append(p.data['name'])
-
-        msg['player_names'] = player_names
-
-        msg['primary'] = (self.primary_player - playerid) % 4
-        if self.game_type is None:
-            msg['gametype'] = None
-        elif self.game_type is GameType.NEGATIVE:
-            msg['gametype'] = _("Negative")
-        elif self.game_type is GameType.POSITIVE:
-            msg['gametype'] = _("Positive")
-        elif self.game_type is GameType.COLORGAME:
-            msg['gametype'] = _("Colorgame")
-        elif self.game_type is GameType.SECHSERDREIER:
-            msg['gametype'] = _("Take all 6")
+        if 'names' in groups:
+            player_names = []
+            for j in range(4):
+                k = (playerid + j) % 4
+                p = players[k]
+                if p is None:
+                    player_names.append(None)
+                else:
+                    player_names.append(p.data['name'])
+
+            msg['player_names'] = player_names
+
+        if 'gametype' in groups:
+            msg['primary'] = (self.primary_player - playerid) % 4
+            if self.game_type is None:
+                msg['gametype'] = None
+            elif self.game_type is GameType.NEGATIVE:
+                msg['gametype'] = _("Negative")
+            elif self.game_type is GameType.POSITIVE:
+                msg['gametype'] = _("Positive")
+            elif self.game_type is GameType.COLORGAME:
+                msg['gametype'] = _("Colorgame")
+            elif self.game_type is GameType.SECHSERDREIER:
+                msg['gametype'] = _("Take all 6")
 
         return msg
 
-    def get_state_update(self, playerid, players, old_state=None):
+    def get_state_update(self, playerid, players, old_state=None, groups: Optional[Iterable[str]] = None,
+                         public: bool = False):
+        # Returns the fields that differ from old_state and updates old_state in place.
+        # groups limits the comparison to the changed parts of the state, see take_changes().
         if old_state is None:
             old_state = {}
-        new_state = self.get_state(playerid=playerid, players=players)
+        if not old_state:
+            groups = None
+        new_state = self.get_state(playerid=playerid, players=players, groups=groups, public=public)
         update = {}
 
         for key, value in new_state.items():
@@ -489,6 +710,7 @@ class Game(Table):
                 if value != old_state[key]:
                     update[key] = value
 
+        old_state.update(update)
         return update
 
 
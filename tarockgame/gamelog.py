@@ -0,0 +1,184 @@
+#!/usr/bin/env python
+# *-* encoding: utf-8 *-*
+
+# Append-only binary log of all game actions and a tool that replays games from it.
+# Every record starts with the action kind (1 byte), the game id (8 bytes) and a timestamp
+# (8 bytes), followed by a fixed payload per kind; cards are stored as one byte.
+
+import argparse
+import struct
+import time
+from typing import BinaryIO, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from .game import Game, GameStage, GameType
+
+HEADER = struct.Struct('<BQd')
+# Payloads in the order of the fields of the actions in Game.history
+PAYLOADS = {'new': struct.Struct('<B6QB'),  # primary player, deal, length of the table name (name follows)
+            'gametype': struct.Struct('<B'),
+            'ouvert': struct.Struct('<?'),
+            'uncover': struct.Struct('<B'),
+            'talon': struct.Struct('<BB'),
+            'card': struct.Struct('<BB'),
+            'teams': struct.Struct('<6B'),
+            'finish': struct.Struct('<')}
+KINDS = list(PAYLOADS)
+KIND_CODES = {kind: code for code, kind in enumerate(KINDS)}
+DROPS = {GameType.POSITIVE: 3,
+         GameType.NEGATIVE: 0,
+         GameType.COLORGAME: 3,
+         GameType.SECHSERDREIER: 6}
+
+# (kind, game id, timestamp, fields); the fields of 'new' are (primary player, deal, table name)
+Record = Tuple[str, int, float, Tuple]
+
+
+class GameLog:
+    # Buffered writer, attach it to games with start(). Call flush() regularly and on shutdown.
+    path: str
+    buffer: bytearray
+    buffer_size: int
+    file: Optional[BinaryIO]
+
+    def __init__(self, path: str, buffer_size: int = 1 << 16):
+        self.path = path
+        self.buffer = bytearray()
+        self.buffer_size = buffer_size
+        self.file = open(path, 'ab')
+
+    def start(self, game: Game, table: str = ''):
+        # Logs the deal of game and all its later actions
+        name = table.encode('utf-8')[:255]
+        payload = PAYLOADS['new'].pack(game.primary_player, *game.deal, len(name)) + name
+        self.buffer += HEADER.pack(KIND_CODES['new'], game.id, time.time()) + payload
+        game.log = self
+        for action in game.history:
+            self.write(game.id, action)
+
+    def write(self, game_id: int, action: Tuple):
+        kind = action[0]
+        fields = action[1] if kind == 'teams' else action[1:]
+        # Packed before anything is added, so that a bad action leaves no partial record
+        payload = PAYLOADS[kind].pack(*fields)
+        self.buffer += HEADER.pack(KIND_CODES[kind], game_id, time.time()) + payload
+        if len(self.buffer) >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        if self.buffer:
+            self.file.write(self.buffer)
+            self.file.flush()
+            self.buffer = bytearray()
+
+    def close(self):
+        self.flush()
+        self.file.close()
+
+
+def read_records(data: bytes) -> Iterator[Record]:
+    # Stops at a truncated record at the end, as left by a crash during a write
+    view = memoryview(data)
+    offset = 0
+    while offset + HEADER.size <= len(view):
+        code, game_id, timestamp = HEADER.unpack_from(view, offset)
+        kind = KINDS[code]
+        payload = PAYLOADS[kind]
+        start = offset + HEADER.size
+        if start + payload.size > len(view):
+            return
+        fields = payload.unpack_from(view, start)
+        offset = start + payload.size
+        if kind == 'new':
+            end = offset + fields[7]
+            if end > len(view):
+                return
+            fields = (fields[0], fields[1:7], bytes(view[offset:end]).decode('utf-8', 'replace'))
+            offset = end
+        elif kind == 'teams':
+            fields = (list(fields),)
+        yield kind, game_id, timestamp, fields
+
+
+def read_logs(paths: Iterable[str]) -> Iterator[Record]:
+    for path in paths:
+        with open(path, 'rb') as f:
+            yield from read_records(f.read())
+
+
+def list_games(records: Iterable[Record]) -> Dict[int, Dict]:
+    games = {}
+    for kind, game_id, timestamp, fields in records:
+        if kind == 'new':
+            games[game_id] = {'table': fields[2], 'primary': fields[0], 'started': timestamp,
+                              'actions': 0, 'cards': 0, 'drops': 0, 'finished': False}
+        elif game_id in games:
+            info = games[game_id]
+            info['actions'] += 1
+            info['last'] = timestamp
+            if kind == 'gametype':
+                # Cards dropped after taking the talon are logged as card plays as well
+                info['drops'] = DROPS[GameType(fields[0])]
+            elif kind == 'card':
+                info['cards'] += 1
+            info['finished'] |= kind == 'finish' or info['cards'] == 48 + info['drops']
+    return games
+
+
+def replay(records: Iterable[Record], game_id: int, actions: Optional[int] = None) -> Game:
+    # Rebuilds the game game_id after its first actions actions (all if None)
+    game = None
+    for kind, record_id, timestamp, fields in records:
+        if record_id != game_id:
+            continue
+        if kind == 'new':
+            game = Game(primary_player=fields[0], deal=tuple(fields[1]))
+            game.id = game_id
+            continue
+        if game is None:
+            raise ValueError(f'The start of game {game_id:016x} is not in the log.')
+        if actions is not None and len(game.history) >= actions:
+            break
+        game.replay((kind,) + tuple(fields))
+    if game is None:
+        raise ValueError(f'Game {game_id:016x} is not in the log.')
+    return game
+
+
+def describe(game: Game) -> List[str]:
+    lines = [f'Game {game.id:016x}: {game.game_stage.name.lower()}, primary player {game.primary_player!s}, '
+             f'{game.game_type.name.lower() if game.game_type is not None else "no game type"}'
+             f'{", ouvert" if game.ouvert else ""}']
+    for p in game.players:
+        lines.append(f'Player {p.id!s}: hand {" ".join(p.hand_cards.enc_list())}, '
+                     f'{game.tricks_taken()[p.id]!s} tricks')
+    for ausspieler, cards in game.played_tricks:
+        lines.append(f'Trick led by {ausspieler!s}: {" ".join(c.enc_str() for c in cards)}')
+    if any(c is not None for c in game.center_cards) and game.game_stage is GameStage.INGAME:
+        lines.append(f'Center: {" ".join("--" if c is None else c.enc_str() for c in game.center_cards)}')
+    if game.game_stage is GameStage.POSTGAME:
+        lines.append(f'Score: {game.score!s}, single: {game.single_score!s}, teams: {game.teams!s}')
+    return lines
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description='List the games in game logs or replay one of them')
+    parser.add_argument('logs', nargs='+',
+                        help='game log files')
+    parser.add_argument('--game', type=str, default=None,
+                        help='id (hex) of the game to replay')
+    parser.add_argument('--actions', type=int, default=None,
+                        help='replay only this many actions of the game')
+    args = parser.parse_args(args)
+
+    if args.game is None:
+        for game_id, info in list_games(read_logs(args.logs)).items():
+            started = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(info['started']))
+            print(f'{game_id:016x} {started} table "{info["table"]}", primary player {info["primary"]!s}, '
+                  f'{info["actions"]!s} actions{", finished" if info["finished"] else ""}')
+    else:
+        game = replay(read_logs(args.logs), int(args.game, 16), args.actions)
+        print('\n'.join(describe(game)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,209 @@
+#!/usr/bin/env python
+# *-* encoding: utf-8 *-*
+
+# Hand-strength evaluator for the choice of the game type. A dealt hand of 12 cards is reduced to
+# a few features (see FEATURES). For each game type, the chance of the primary player to win is
+# the sum of one table entry per feature. The tables are fitted to games simulated with the batch
+# engine and stored in handstrength.json. Rebuild them with (needs numpy):
+#   python -m tarockgame.handstrength --games 400000 --seed 0
+# A game counts as won with more than half of the 70 points, or without a trick in a negative game.
+
+import argparse
+import json
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from .cards import DECK, Suit, SUIT_MASKS, TRULL_MASK, KINGS_MASK, POINT_MASKS
+
+TABLES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'handstrength.json')
+# Names of the game types in the order of their GameType values
+GAME_TYPES = ('positive', 'negative', 'colorgame', 'sechserdreier')
+WIN_POINTS = 36
+
+TAROCK_MASK = SUIT_MASKS[Suit.TAROCK]
+HIGH_TAROCK_MASK = sum(1 << c.index for c in DECK if c.suit is Suit.TAROCK and 15 <= c.value <= 20)
+COLOR_MASKS = tuple(SUIT_MASKS[suit] for suit in Suit if suit is not Suit.TAROCK)
+# Each feature is clipped to its number of values minus one, so that rare values share a table entry
+FEATURES = (('tarocks', 10),
+            ('high_tarocks', 5),
+            ('trull', 4),
+            ('kings', 5),
+            ('voids', 3),
+            ('singletons', 4),
+            ('points', 10))
+
+
+def features(mask: int) -> Tuple[int, ...]:
+    tarocks = (mask & TAROCK_MASK).bit_count()
+    colors = [(mask & m).bit_count() for m in COLOR_MASKS]
+    points = sum(p*(mask & point_mask).bit_count() for p, point_mask in POINT_MASKS.items())
+    return (min(tarocks, 9),
+            min((mask & HIGH_TAROCK_MASK).bit_count(), 4),
+            (mask & TRULL_MASK).bit_count(),
+            (mask & KINGS_MASK).bit_count(),
+            min(colors.count(0), 2),
+            min(colors.count(1), 3),
+            # The card values of a hand lie between 12 and 43, in steps of three from 15
+            max(0, min((points - 12) // 3, 9)))
+
+
+class HandEvaluator:
+    # tables[game type value][feature][value]; the base value is added to the entries of the first feature
+    tables: List[List[List[float]]]
+    info: Dict
+    # Chances by features; there are at most 120000 combinations of the feature values
+    chances: Dict[Tuple[int, ...], List[float]]
+
+    def __init__(self, data: Dict):
+        self.info = {key: value for key, value in data.items() if key != 'tables'}
+        self.chances = dict()
+        self.tables = []
+        for name in GAME_TYPES:
+            table = data['tables'][name]
+            self.tables.append([table[feature] for feature, _ in FEATURES])
+            self.tables[-1][0] = [table['base'] + x for x in self.tables[-1][0]]
+
+    @classmethod
+    def load(cls, path: str = TABLES_PATH) -> 'HandEvaluator':
+        with open(path) as f:
+            return cls(json.load(f))
+
+    def evaluate(self, mask: int) -> List[float]:
+        # Chances to win in the order of GAME_TYPES
+        values = features(mask)
+        chances = self.chances.get(values)
+        if chances is None:
+            chances = []
+            for table in self.tables:
+                chance = 0.
+                for entries, value in zip(table, values):
+                    chance += entries[value]
+                chances.append(min(1., max(0., chance)))
+            self.chances[values] = chances
+        return chances
+
+
+_evaluator: Optional[HandEvaluator] = None
+
+
+def hand_strength(mask: int) -> List[int]:
+    # Chances to win in percent in the order of GAME_TYPES, with the tables of TABLES_PATH
+    global _evaluator
+    if _evaluator is None:
+        _evaluator = HandEvaluator.load()
+    return [round(100 * chance) for chance in _evaluator.evaluate(mask)]
+
+
+def batch_features(hands):
+    # features() of a (games x 54) boolean array of hands, one array per feature
+    import numpy as np
+    from .batch import masks_to_array, POINTS
+
+    def count(mask: int):
+        return (hands & masks_to_array(mask)).sum(axis=1)
+
+    colors = np.stack([count(m) for m in COLOR_MASKS], axis=1)
+    return [np.minimum(count(TAROCK_MASK), 9),
+            np.minimum(count(HIGH_TAROCK_MASK), 4),
+            count(TRULL_MASK),
+            count(KINGS_MASK),
+            np.minimum((colors == 0).sum(axis=1), 2),
+            np.minimum((colors == 1).sum(axis=1), 3),
+            np.clip(((hands * POINTS).sum(axis=1) - 12) // 3, 0, 9)]
+
+
+def _design_matrix(values: Sequence):
+    # One column for the base and one per value of every feature except the first value
+    import numpy as np
+    columns = [np.ones(len(values[0]))]
+    for (_, size), v in zip(FEATURES, values):
+        columns.extend(v == k for k in range(1, size))
+    return np.stack(columns, axis=1).astype(float)
+
+
+def _simulate_chunk(count: int, seed: int, policy: str) -> List[Tuple]:
+    # Terms of the normal equations of the fit per game type; all game types are played with the same deals
+    from .batch import BatchGame
+    from .game import GameType
+
+    results = []
+    for name in GAME_TYPES:
+        game_type = GameType[name.upper()]
+        batch = BatchGame(count, game_type, primary_player=0, seed=seed, policy=policy)
+        x = _design_matrix(batch_features(batch.hands[:, 0]))
+        batch.run()
+        if game_type is GameType.NEGATIVE:
+            won = batch.tricks[:, 0] == 0
+        else:
+            won = batch.single_score()[0][:, 0] >= WIN_POINTS
+        results.append((x.T @ x, x.T @ won))
+    return results
+
+
+def build_tables(games: int, seed: int = 0, policy: str = 'random', workers: Optional[int] = None,
+                 chunk_size: int = 20000, ridge: float = 1.) -> Dict:
+    # Fits the tables by least squares; the result only depends on games, seed, policy and chunk_size
+    import numpy as np
+
+    chunks = [min(chunk_size, games - start) for start in range(0, games, chunk_size)]
+    seeds = [int(np.random.SeedSequence([seed, i]).generate_state(1)[0]) for i in range(len(chunks))]
+    if workers == 1:
+        outputs = [_simulate_chunk(count, s, policy) for count, s in zip(chunks, seeds)]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            outputs = list(executor.map(_simulate_chunk, chunks, seeds, [policy]*len(chunks)))
+    tables = {}
+    for i, name in enumerate(GAME_TYPES):
+        xtx = sum(output[i][0] for output in outputs)
+        xty = sum(output[i][1] for output in outputs)
+        # A little ridge keeps values that never occurred at the first value of their feature
+        penalty = ridge * np.eye(len(xty))
+        penalty[0, 0] = 0.
+        weights = np.linalg.solve(xtx + penalty, xty)
+        table = {'base': round(float(weights[0]), 5)}
+        k = 1
+        for feature, size in FEATURES:
+            table[feature] = [0.] + [round(float(w), 5) for w in weights[k:k + size - 1]]
+            k += size - 1
+        tables[name] = table
+    return {'games': games,
+            'seed': seed,
+            'policy': policy,
+            'chunk_size': chunk_size,
+            'tables': tables}
+
+
+def dumps_tables(data: Dict) -> str:
+    # JSON with every table on one line
+    return re.sub(r'\[\s+([^\[\]]*?)\s+\]', lambda m: '[' + ' '.join(m.group(1).split()) + ']',
+                  json.dumps(data, indent=1)) + '\n'
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description='Build the hand-strength tables from simulated games')
+    parser.add_argument('--games', type=int, default=400000,
+                        help='number of simulated games per game type')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='random seed')
+    parser.add_argument('--policy', choices=['first', 'random'], default='random',
+                        help='how the simulated players choose their cards')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                        help='number of worker processes')
+    parser.add_argument('--output', type=str, default=TABLES_PATH,
+                        help='file to write the tables to')
+    args = parser.parse_args(args)
+
+    t = time.monotonic()
+    data = build_tables(args.games, seed=args.seed, policy=args.policy, workers=args.workers)
+    with open(args.output, 'w') as f:
+        f.write(dumps_tables(data))
+    print(f'Simulated {args.games!s} games per game type in {time.monotonic() - t:.1f}s')
+    for name in GAME_TYPES:
+        print(f'{name:14s} base chance {data["tables"][name]["base"]:.3f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,180 @@
+#!/usr/bin/env python
+# *-* encoding: utf-8 *-*
+
+# Headless driver that plays complete games with pluggable policies, optionally on a process pool.
+
+import argparse
+import importlib
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Sequence
+
+from .cards import Card, CardCollection
+from .game import Game, GameType, GameStage
+
+
+class Policy:
+    # Decides for one seat. Subclass and override the choose_* methods for custom strategies.
+    name = 'policy'
+
+    def seed(self, seed: int):
+        pass
+
+    def choose_game_type(self, game: Game, playerid: int) -> GameType:
+        return GameType.POSITIVE
+
+    def choose_talon(self, game: Game, playerid: int) -> int:
+        return 0
+
+    def choose_card(self, game: Game, playerid: int, legal: CardCollection) -> Card:
+        raise NotImplementedError
+
+
+class FirstLegalPolicy(Policy):
+    # Plays like Game.autoplay
+    name = 'first'
+
+    def choose_card(self, game: Game, playerid: int, legal: CardCollection) -> Card:
+        return next(iter(legal))
+
+
+class RandomPolicy(Policy):
+    name = 'random'
+
+    def __init__(self):
+        self.rng = random.Random()
+
+    def seed(self, seed: int):
+        self.rng.seed(seed)
+
+    def choose_talon(self, game: Game, playerid: int) -> int:
+        return self.rng.randrange(2)
+
+    def choose_card(self, game: Game, playerid: int, legal: CardCollection) -> Card:
+        return self.rng.choice(list(legal))
+
+
+POLICIES = {'first': FirstLegalPolicy,
+            'random': RandomPolicy}
+
+
+def load_policy(spec: str) -> Policy:
+    # Either a name from POLICIES or "module:Class" for a user-supplied policy
+    if spec in POLICIES:
+        return POLICIES[spec]()
+    module, _, cls = spec.partition(':')
+    return getattr(importlib.import_module(module), cls)()
+
+
+def play_game(game: Game, policies: Sequence[Policy], game_type: Optional[GameType] = None) -> Game:
+    primary = game.primary_player
+    if game_type is None:
+        game_type = policies[primary].choose_game_type(game, primary)
+    game.set_game_type(game_type)
+    if game.game_stage is GameStage.TYPESELECTED and game.game_type is not GameType.NEGATIVE:
+        game.uncover_talon(primary)
+        game.take_talon(primary, policies[primary].choose_talon(game, primary))
+    while game.game_stage is not GameStage.POSTGAME:
+        playerid = game.move if game.move is not None else primary
+        if game.game_stage is GameStage.TALONTAKEN:
+            playerid = primary
+        legal = game.legal_moves(playerid)
+        game.play_card(playerid, policies[playerid].choose_card(game, playerid, legal))
+    # The primary player plays against the others, the talon left over counts for the others
+    game.set_teams([0 if i == primary else 1 for i in range(4)] + [1, 1])
+    return game
+
+
+def game_result(game: Game) -> Dict:
+    return {'primary': game.primary_player,
+            'score': [points for points, _ in game.score],
+            'single_score': [points for points, _ in game.single_score],
+            'tricks': game.tricks_taken()}
+
+
+def _play_chunk(policy_specs: Sequence[str], game_type: Optional[GameType], seeds: Sequence[int]) -> (List[Dict], float):
+    policies = [load_policy(spec) for spec in policy_specs]
+    results = []
+    t = time.process_time()
+    for i, seed in enumerate(seeds):
+        for j, policy in enumerate(policies):
+            policy.seed(seed + j)
+        game = Game(primary_player=seed % 4, seed=seed)
+        results.append(game_result(play_game(game, policies, game_type)))
+    return results, time.process_time() - t
+
+
+def summarize(results: List[Dict], policy_specs: Sequence[str]) -> Dict:
+    n = len(results)
+    summary = {'games': n,
+               'seats': []}
+    for seat, spec in enumerate(policy_specs):
+        primary = [r for r in results if r['primary'] == seat]
+        summary['seats'].append({
+            'policy': spec,
+            'points': sum(r['single_score'][seat] for r in results) / max(n, 1),
+            'tricks': sum(r['tricks'][seat] for r in results) / max(n, 1),
+            'primary_games': len(primary),
+            'primary_score': sum(r['score'][0] for r in primary) / max(len(primary), 1),
+        })
+    return summary
+
+
+def run_tournament(games: int,
+                   policy_specs: Sequence[str] = ('random',)*4,
+                   game_type: Optional[GameType] = None,
+                   workers: Optional[int] = None,
+                   seed: int = 0,
+                   chunk_size: int = 200,
+                   ) -> Dict:
+    # Policies are given as specs (see load_policy) so that worker processes can build their own
+    seeds = [seed + i for i in range(games)]
+    chunks = [seeds[i:i+chunk_size] for i in range(0, games, chunk_size)]
+    results = []
+    cpu_time = 0.
+    t = time.monotonic()
+    if workers == 1:
+        outputs = [_play_chunk(policy_specs, game_type, chunk) for chunk in chunks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            outputs = list(executor.map(_play_chunk, [policy_specs]*len(chunks), [game_type]*len(chunks), chunks))
+    for chunk_results, chunk_time in outputs:
+        results.extend(chunk_results)
+        cpu_time += chunk_time
+    elapsed = time.monotonic() - t
+    summary = summarize(results, policy_specs)
+    summary['seconds'] = elapsed
+    summary['games_per_second'] = games / elapsed if elapsed > 0 else float('inf')
+    summary['games_per_cpu_second'] = games / cpu_time if cpu_time > 0 else float('inf')
+    return summary
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description='Play games between policies without a server')
+    parser.add_argument('--games', type=int, default=1000,
+                        help='number of games to play')
+    parser.add_argument('--policy', action='append', default=None,
+                        help='policy per seat: ' + ', '.join(POLICIES) + ' or module:Class (give up to 4 times)')
+    parser.add_argument('--gametype', choices=[t.name.lower() for t in GameType], default=None,
+                        help='always play this game type instead of asking the primary player')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                        help='number of worker processes')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='seed of the first game')
+    args = parser.parse_args(args)
+
+    specs = args.policy or ['random']
+    specs = (specs * 4)[:4]
+    game_type = None if args.gametype is None else GameType[args.gametype.upper()]
+    summary = run_tournament(args.games, specs, game_type=game_type, workers=args.workers, seed=args.seed)
+    print(f"{summary['games']} games in {summary['seconds']:.2f}s: "
+          f"{summary['games_per_second']:.1f} games/s, {summary['games_per_cpu_second']:.1f} games/s per core")
+    for seat, s in enumerate(summary['seats']):
+        print(f"Seat {seat} ({s['policy']}): {s['points']:.2f} points, {s['tricks']:.2f} tricks, "
+              f"{s['primary_score']:.2f} team points in {s['primary_games']} own games")
+
+
+if __name__ == '__main__':
+    main()
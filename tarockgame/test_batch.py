@@ -0,0 +1,26 @@
+import unittest
+from tarockgame.game import GameType
+
+try:
+    import numpy
+    from tarockgame.batch import BatchGame, simulate
+except ImportError:
+    numpy = None
+
+
+@unittest.skipIf(numpy is None, 'numpy is not installed')
+class BatchTest(unittest.TestCase):
+    def test_cross_check(self):
+        for game_type in GameType:
+            for policy in ('first', 'random'):
+                BatchGame(40, game_type, primary_player=[0, 1, 2, 3]*10, seed=3, policy=policy,
+                          cross_check=True).run()
+
+    def test_simulate(self):
+        points, tricks = simulate(GameType.POSITIVE, 100, seed=1, chunk_size=30)
+        self.assertEqual(points.shape, (100,))
+        self.assertTrue((tricks.sum(axis=1) == 12).all())
+
+
+if __name__ == '__main__':
+    unittest.main()
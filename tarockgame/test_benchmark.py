@@ -0,0 +1,21 @@
+import unittest
+from tarockgame.benchmark import BENCHMARKS, run_benchmarks, compare
+
+
+class BenchmarkTest(unittest.TestCase):
+    def test_run(self):
+        current = run_benchmarks(list(BENCHMARKS), repeat=1, min_time=0.)
+        self.assertEqual(list(current['results']), list(BENCHMARKS))
+        for result in current['results'].values():
+            self.assertGreater(result['min'], 0.)
+            self.assertEqual(len(result['runs']), 1)
+
+    def test_compare(self):
+        baseline = {'results': {'a': {'min': 1.}, 'b': {'min': 1.}, 'c': {'min': 1.}}}
+        current = {'results': {'a': {'min': 1.2}, 'b': {'min': 0.8}, 'c': {'min': 1.05}, 'd': {'min': 1.}}}
+        verdicts = {row['name']: row['verdict'] for row in compare(baseline, current, threshold=0.1)}
+        self.assertEqual(verdicts, {'a': 'slower', 'b': 'faster', 'c': 'same', 'd': 'new'})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,38 @@
+import random
+import unittest
+from tarockgame.cards import FULL_MASK
+from tarockgame.game import Game, GameType, GameStage
+from tarockgame.bot import SeatView, MonteCarloPolicy, choose_card
+from tarockgame.selfplay import play_game, RandomPolicy
+
+
+class BotTest(unittest.TestCase):
+    def test_sample(self):
+        game = Game(primary_player=0, seed=11)
+        game.set_game_type(GameType.POSITIVE)
+        game.uncover_talon(0)
+        game.take_talon(0, 1)
+        while game.game_stage is not GameStage.INGAME or game.stiche < 3:
+            game.autoplay()
+        view = SeatView(game, game.move)
+        rng = random.Random(1)
+        played = sum(view.taken)
+        for c in game.center_cards:
+            if c is not None and game.move != game.ausspieler:
+                played |= 1 << c.index
+        for _ in range(20):
+            hands, drops = view.sample(rng)
+            self.assertEqual([len(h) for h in hands], [len(p.hand_cards) for p in game.players])
+            self.assertEqual(hands[game.move], game.players[game.move].hand_cards)
+            masks = [h.mask for h in hands] + [drops, played, game.talons[0].mask]
+            self.assertEqual(sum(masks), FULL_MASK)
+        self.assertIn(choose_card(view, budget=0., max_samples=2), view.legal)
+
+    def test_play_game(self):
+        game = play_game(Game(primary_player=2, seed=3),
+                         [MonteCarloPolicy(budget=0., max_samples=1), RandomPolicy()]*2, GameType.NEGATIVE)
+        self.assertIs(game.game_stage, GameStage.POSTGAME)
+
+
+if __name__ == '__main__':
+    unittest.main()
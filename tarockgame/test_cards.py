@@ -1,5 +1,5 @@
 import unittest
-from cards import Card, CardCollection, Suit
+from cards import Card, CardCollection, Suit, get_full_deck, trick_winner
 
 
 class CardTest(unittest.TestCase):
@@ -26,6 +26,44 @@ class CardTest(unittest.TestCase):
         for i, c0 in enumerate(cc):
             self.assertEqual(c[i], c0)
 
+    def test_collection_ops(self):
+        deck = get_full_deck()
+        self.assertEqual(len(deck), 54)
+        tarock = deck.suit_cards(Suit.TAROCK)
+        self.assertEqual(len(tarock), 22)
+        self.assertTrue(deck.has_suit(Suit.HEARTS))
+        self.assertFalse(tarock.has_suit(Suit.HEARTS))
+        rest = deck - tarock
+        self.assertEqual(len(rest), 32)
+        self.assertEqual(rest | tarock, deck)
+        self.assertEqual(list(deck), sorted(deck))
+        self.assertEqual(CardCollection.dec_list(['5 21', '1 8']).enc_list(), ['H8', 'T21'])
+
+    def test_point_value(self):
+        deck = get_full_deck()
+        self.assertEqual(deck.point_value(), (70, 0))
+        cc = CardCollection([Card(Suit.TAROCK, 22), Card(Suit.HEARTS, 8), Card(Suit.TAROCK, 2)])
+        self.assertEqual(cc.point_value(), (9, 0))
+        cc.remove(Card(Suit.TAROCK, 2))
+        self.assertEqual(cc.point_value(), (8, 2))
+
+    def test_interned(self):
+        c = Card(Suit.TAROCK, 21)
+        self.assertIs(c, Card(Suit.TAROCK, 21))
+        self.assertIs(c, Card.from_enc_str('T21'))
+        self.assertIs(c, Card.dec_str('5 21'))
+        self.assertEqual(c.index, 52)
+        with self.assertRaises(AttributeError):
+            c.value = 20
+
+    def test_trick_winner(self):
+        cards = [Card.from_enc_str(x) for x in ('H3', 'T2', 'H8', 'C8')]
+        self.assertEqual(trick_winner(cards, 0), 1)
+        self.assertEqual(trick_winner(cards, 0, trumps=False), 2)
+        self.assertEqual(trick_winner(cards, 3), 1)
+        cards = [Card.from_enc_str('T21'), Card.from_enc_str('T22'), Card.from_enc_str('T1'), None]
+        self.assertEqual(trick_winner(cards, 0), 2)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,38 @@
+import json
+import unittest
+from tarockgame.game import Game, GameType
+from tarockgame.encoding import StateEncoder, BinaryStateEncoder, decode_binary
+from tarockgame.selfplay import play_game, FirstLegalPolicy
+from tarockgame.testutil import Seat
+
+
+class EncodingTest(unittest.TestCase):
+    def test_encode_states(self):
+        seats = [Seat('Jürgen'), None, Seat('B "2"'), Seat('C')]
+        game = Game(primary_player=0, seed=9)
+        play_game(game, [FirstLegalPolicy()]*4, GameType.POSITIVE)
+        encoder = StateEncoder()
+        for i in range(4):
+            state = game.get_state(i, seats)
+            encoded = encoder.encode(state)
+            self.assertEqual(json.loads(encoded), json.loads(json.dumps(state)))
+            self.assertEqual(encoded, json.dumps(state, separators=(',', ':'), ensure_ascii=False))
+
+    def test_binary(self):
+        seats = [Seat('Jürgen'), None, Seat('B "2"'), Seat('C')]
+        for i, game_type in enumerate(GameType):
+            game = Game(primary_player=i, seed=i)
+            states = [game.get_state(0, seats)]
+            play_game(game, [FirstLegalPolicy()]*4, game_type)
+            states += [game.get_state(j, seats, public=public) for j in range(4) for public in (False, True)]
+            encoder = BinaryStateEncoder()
+            for state in states:
+                encoded = encoder.encode(state)
+                self.assertEqual(decode_binary(encoded), json.loads(json.dumps(state)))
+                self.assertLess(len(encoded), len(json.dumps(state)))
+        other = {'alertmsg': 'Fehler', 'unknown': [-300, None, True, 'ä']}
+        self.assertEqual(decode_binary(BinaryStateEncoder().encode(other)), other)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+import random
+import unittest
+from tarockgame.cards import Card, CardCollection, trick_winner
+from tarockgame.game import Game, GameType, GameStage, IllegalPlay, legal_cards
+from tarockgame.endgame import claim, position, solve
+
+
+def _cc(*cards):
+    return CardCollection([Card.from_enc_str(c) for c in cards])
+
+
+def minimax(game_type, side, hands, cards, ausspieler, move):
+    # Tricks taken by side, without pruning
+    if ausspieler is None and not hands[move]:
+        return 0
+    values = []
+    for card in legal_cards(CardCollection.from_mask(hands[move]), cards, ausspieler, move, game_type):
+        h = list(hands)
+        h[move] &= ~(1 << card.index)
+        lead = move if ausspieler is None else ausspieler
+        trick = [None]*4 if ausspieler is None else list(cards)
+        trick[move] = card
+        if (move + 1) % 4 != lead:
+            values.append(minimax(game_type, side, h, trick, lead, (move + 1) % 4))
+        else:
+            winner = trick_winner(trick, lead, trumps=game_type is not GameType.COLORGAME)
+            values.append((winner in side) + minimax(game_type, side, h, [None]*4, None, winner))
+    return max(values) if move in side else min(values)
+
+
+class EndgameTest(unittest.TestCase):
+    def _game(self, game_type, hands):
+        game = Game(primary_player=0)
+        for p, hand in zip(game.players, hands):
+            p.hand_cards = _cc(*hand)
+        game.set_game_type(game_type)
+        game.play_card(0, next(iter(game.legal_moves(0))))
+        return game
+
+    def test_claim(self):
+        game = self._game(GameType.POSITIVE, [('T22', 'T21', 'T20'), ('H1', 'H2', 'T1'), ('C1', 'C2', 'C3'),
+                                              ('S1', 'S2', 'T2')])
+        with self.assertRaises(IllegalPlay):
+            claim(game, 1)
+        with self.assertRaises(IllegalPlay):
+            claim(game, 0, max_nodes=3)
+        self.assertEqual(len(game.history), 2)
+        claim(game, 0)
+        self.assertIs(game.game_stage, GameStage.POSTGAME)
+        self.assertEqual(game.tricks_taken(), [3, 0, 0, 0])
+
+    def test_solve(self):
+        rng = random.Random(4)
+        for seed in range(20):
+            game = Game(primary_player=0, seed=seed)
+            game.set_game_type((GameType.POSITIVE, GameType.NEGATIVE, GameType.COLORGAME)[seed % 3])
+            game.play_card(0, next(iter(game.legal_moves(0))))
+            while max(len(p.hand_cards) for p in game.players) > 3:
+                game.play_card(game.move, rng.choice(list(game.legal_moves(game.move))))
+            side = {seed % 4, (seed + seed // 4) % 4}
+            self.assertEqual(solve(game, side), minimax(game.game_type, side, *position(game)))
+
+
+if __name__ == '__main__':
+    unittest.main()
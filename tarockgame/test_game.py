@@ -0,0 +1,187 @@
+import json
+import unittest
+from tarockgame.cards import Card, CardCollection
+from tarockgame.game import Game, GameType, GameStage, IllegalPlay, generate_deals
+from tarockgame.testutil import Seat
+
+
+def _cc(*cards):
+    return CardCollection([Card.from_enc_str(c) for c in cards])
+
+
+class GameTest(unittest.TestCase):
+    def _game(self, game_type, hands):
+        game = Game(primary_player=0)
+        for p, hand in zip(game.players, hands):
+            p.hand_cards = _cc(*hand)
+        game.set_game_type(game_type)
+        return game
+
+    def test_legal_moves_farbzwang(self):
+        game = self._game(GameType.POSITIVE, [('H3', 'C2'), ('H5', 'T4'), ('C3', 'T2'), ('S3', 'D2')])
+        self.assertEqual(game.legal_moves(0), _cc('H3', 'C2'))
+        self.assertEqual(game.legal_moves(1), CardCollection())
+        game.play_card(0, Card.from_enc_str('H3'))
+        self.assertEqual(game.legal_moves(1), _cc('H5'))
+        with self.assertRaises(IllegalPlay):
+            game.play_card(1, Card.from_enc_str('T4'))
+        game.play_card(1, Card.from_enc_str('H5'))
+        # Tarockzwang
+        self.assertEqual(game.legal_moves(2), _cc('T2'))
+        game.play_card(2, Card.from_enc_str('T2'))
+        self.assertEqual(game.legal_moves(3), _cc('S3', 'D2'))
+
+    def test_legal_moves_colorgame(self):
+        game = self._game(GameType.COLORGAME, [('H3', 'T2'), ('H5',), ('C3',), ('S3',)])
+        self.assertEqual(game.legal_moves(0), _cc('H3'))
+
+    def test_legal_moves_negative(self):
+        game = self._game(GameType.NEGATIVE, [('H3', 'T5'), ('H5', 'H2'), ('T1', 'T3', 'C2'), ('T22', 'T21', 'C3')])
+        self.assertEqual(game.game_stage, GameStage.TYPESELECTED)
+        game.play_card(0, Card.from_enc_str('H3'))
+        # Stichzwang
+        self.assertEqual(game.legal_moves(1), _cc('H5'))
+        game.play_card(1, Card.from_enc_str('H5'))
+        # Pagat may not be played while holding other tarock
+        self.assertEqual(game.legal_moves(2), _cc('T3'))
+
+    def test_autoplay(self):
+        game = self._game(GameType.POSITIVE, [('H3', 'C2'), ('H5', 'T4'), ('C3', 'T2'), ('S3', 'D2')])
+        while game.autoplay():
+            pass
+        self.assertIs(game.game_stage, GameStage.POSTGAME)
+        self.assertEqual(sum(len(p.taken_cards) for p in game.players), 2)
+
+    def test_reproducible_deal(self):
+        game = Game(primary_player=0, seed=1234)
+        self.assertEqual(game.deal, Game(primary_player=0, seed=1234).deal)
+        replay = Game(primary_player=0, deal=game.deal)
+        self.assertEqual([p.hand_cards for p in replay.players], [p.hand_cards for p in game.players])
+        self.assertEqual(replay.talons, game.talons)
+        self.assertEqual(list(generate_deals(3, seed=7)), list(generate_deals(3, seed=7)))
+        with self.assertRaises(ValueError):
+            Game(primary_player=0, deal=(game.deal[0],)*6)
+
+    def test_incremental_state(self):
+        seats = [Seat(f'P{i!s}') for i in range(4)]
+        for game_type in GameType:
+            game = Game(primary_player=1, seed=2)
+            game.set_ouvert(True)
+            baselines = [{} for _ in range(4)]
+
+            def check():
+                groups = game.take_changes()
+                for i in range(4):
+                    game.get_state_update(i, seats, baselines[i], groups)
+                    self.assertEqual(baselines[i], {**baselines[i], **game.get_state(i, seats)})
+
+            check()
+            game.set_game_type(game_type)
+            check()
+            if game_type in (GameType.POSITIVE, GameType.COLORGAME):
+                game.take_talon(1, 0)
+                check()
+                game.take_talon(1, 0)
+                check()
+            if game.move is None:
+                game.play_card(1, next(iter(game.legal_moves(1))))
+                check()
+            while game.autoplay():
+                check()
+            game.set_teams([0, 1, 0, 1, 1, 0])
+            check()
+
+    def test_public_state(self):
+        seats = [Seat(f'P{i!s}') for i in range(4)]
+        for game_type, ouvert in ((GameType.NEGATIVE, False), (GameType.NEGATIVE, True), (GameType.POSITIVE, False)):
+            game = Game(primary_player=0, seed=3)
+            game.set_ouvert(ouvert)
+            game.set_game_type(game_type)
+            if game_type is not GameType.NEGATIVE:
+                game.uncover_talon(0)
+                game.take_talon(0, 1)
+            baseline = {}
+            shown = False
+            hidden = False
+            while True:
+                groups = game.take_changes()
+                game.get_state_update(0, seats, baseline, groups, public=True)
+                state = game.get_state(0, seats, public=True)
+                self.assertEqual(baseline, {**baseline, **state})
+                self.assertEqual(state['legal_moves'], [])
+                hands = [state['player_0']] + [state[f'playerhand_{i!s}'] for i in range(1, 4)]
+                if game.hands_revealed():
+                    self.assertEqual(hands, [game.get_state(i, seats)['player_0'] for i in range(4)])
+                else:
+                    self.assertEqual(hands, [[]]*4)
+                shown |= any(hands)
+                taken = game.get_state(0, seats)['taken_0']
+                if game.dropped_points[1] and game.game_stage is not GameStage.POSTGAME:
+                    self.assertEqual(state['taken_0'], [[None]*len(taken[0])] + taken[1:])
+                    hidden = True
+                else:
+                    self.assertEqual(state['taken_0'], taken)
+                if game.move is None and game.game_stage is not GameStage.POSTGAME:
+                    game.play_card(0, next(iter(game.legal_moves(0))))
+                elif not game.autoplay():
+                    break
+            self.assertEqual(shown, ouvert)
+            self.assertEqual(hidden, game_type is not GameType.NEGATIVE)
+            self.assertIs(game.game_stage, GameStage.POSTGAME)
+
+    def test_running_score(self):
+        seats = [None]*4
+        game = Game(primary_player=1, seed=7)
+        game.set_game_type(GameType.POSITIVE)
+        game.take_talon(1, 0)
+        game.take_talon(1, 0)
+        # Teams can only be set with the score, after the game
+        teams, history = list(game.teams), list(game.history)
+        with self.assertRaises(IllegalPlay):
+            game.set_teams([0, 1, 0, 1, 1, 0])
+        self.assertEqual((game.teams, game.history), (teams, history))
+        while game.autoplay():
+            taken = [CardCollection([c for trick in p.taken_cards for c in trick]) for p in game.players]
+            tricks = [CardCollection([c for trick in p.taken_cards if len(trick) == 4 for c in trick])
+                      for p in game.players]
+            for i in range(4):
+                running = game.get_state(i, seats)['running_score']
+                expected = [taken[j] if j == i or game.game_stage is GameStage.POSTGAME else tricks[j]
+                            for j in range(i, i + 4) for j in [j % 4]]
+                self.assertEqual(running, [cc.point_value() for cc in expected])
+        game.set_teams([0, 1, 0, 1, 1, 0])
+        self.assertEqual(sum(points for points, _ in game.score), 70)
+        self.assertEqual(game.single_score, [cc.point_value() for cc in taken + list(game.talons)])
+
+    def test_snapshot(self):
+        seats = [Seat(f'P{i!s}') for i in range(4)]
+        for game_type in GameType:
+            game = Game(primary_player=2, seed=5)
+
+            def check():
+                restored = Game.from_snapshot(json.loads(json.dumps(game.snapshot())))
+                self.assertEqual(restored.seed, game.seed)
+                self.assertEqual(restored.game_stage, game.game_stage)
+                for i in range(4):
+                    self.assertEqual(restored.get_state(i, seats), game.get_state(i, seats))
+
+            game.set_ouvert(True)
+            check()
+            game.set_game_type(game_type)
+            check()
+            if game_type in (GameType.POSITIVE, GameType.COLORGAME):
+                game.take_talon(2, 1)
+                check()
+                game.take_talon(2, 1)
+                check()
+            if game.move is None:
+                game.play_card(2, next(iter(game.legal_moves(2))))
+                check()
+            while game.autoplay():
+                check()
+            game.set_teams([0, 1, 0, 1, 1, 0])
+            check()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+import os
+import struct
+import tempfile
+import unittest
+from tarockgame.game import Game, GameType, IllegalPlay
+from tarockgame.gamelog import GameLog, read_logs, read_records, list_games, replay
+from tarockgame.selfplay import play_game, RandomPolicy
+from tarockgame.testutil import Seat
+
+
+class GameLogTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, 'games.log')
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_replay(self):
+        seats = [Seat(f'P{i!s}') for i in range(4)]
+        log = GameLog(self.path, buffer_size=100)
+        games = []
+        for i, game_type in enumerate(GameType):
+            game = Game(primary_player=i, seed=i)
+            log.start(game, f'table {i!s}')
+            game.set_ouvert(i == 1)
+            policies = [RandomPolicy() for _ in range(4)]
+            for j, policy in enumerate(policies):
+                policy.seed(i + j)
+            play_game(game, policies, game_type)
+            with self.assertRaises(IllegalPlay):
+                game.set_teams([0, 1, 1, 0, 1, -1])
+            buffered = len(log.buffer)
+            with self.assertRaises(struct.error):
+                log.write(game.id, ('teams', [0, 1, 1, 0, 1, -1]))
+            self.assertEqual(len(log.buffer), buffered)
+            game.set_teams([0, 1, 1, 0, 1, 0])
+            games.append(game)
+        log.close()
+
+        records = list(read_logs([self.path]))
+        listed = list_games(records)
+        self.assertEqual(list(listed), [game.id for game in games])
+        for i, game in enumerate(games):
+            self.assertEqual(listed[game.id]['table'], f'table {i!s}')
+            self.assertEqual(listed[game.id]['actions'], len(game.history))
+            self.assertTrue(listed[game.id]['finished'])
+            replayed = replay(records, game.id)
+            self.assertEqual(replayed.history, game.history)
+            for seat in range(4):
+                self.assertEqual(replayed.get_state(seat, seats), game.get_state(seat, seats))
+            partial = replay(records, game.id, actions=10)
+            self.assertEqual(partial.history, game.history[:10])
+
+    def test_truncated(self):
+        log = GameLog(self.path)
+        game = Game(primary_player=0, seed=1)
+        log.start(game, 't')
+        game.set_game_type(GameType.NEGATIVE)
+        game.play_card(0, next(iter(game.legal_moves(0))))
+        for _ in range(3):
+            game.autoplay()
+        log.close()
+        with open(self.path, 'rb') as f:
+            data = f.read()
+        records = list(read_records(data[:-1]))
+        self.assertEqual(len(records), 5)
+        self.assertEqual(replay(records, game.id).history, game.history[:4])
+
+
+if __name__ == '__main__':
+    unittest.main()
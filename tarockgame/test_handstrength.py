@@ -0,0 +1,49 @@
+import unittest
+from tarockgame.game import Game, GameType
+from tarockgame.bot import choose_game_type
+from tarockgame.handstrength import HandEvaluator, features, FEATURES, GAME_TYPES
+from tarockgame.testutil import Seat
+
+try:
+    import numpy
+    from tarockgame.batch import random_deals, array_to_masks
+    from tarockgame.handstrength import batch_features, build_tables
+except ImportError:
+    numpy = None
+
+
+class HandStrengthTest(unittest.TestCase):
+    def test_pregame_state(self):
+        seats = [Seat(f'P{i!s}') for i in range(4)]
+        evaluator = HandEvaluator.load()
+        for seed in range(20):
+            game = Game(primary_player=seed % 4, seed=seed)
+            primary = game.primary_player
+            hand = game.players[primary].hand_cards.mask
+            values = features(hand)
+            self.assertTrue(all(0 <= v < size for v, (_, size) in zip(values, FEATURES)))
+            chances = game.get_state(primary, seats)['hand_strength']
+            self.assertEqual(chances, [round(100 * c) for c in evaluator.evaluate(hand)])
+            self.assertTrue(all(0 <= c <= 100 for c in chances))
+            self.assertIsNone(game.get_state((primary + 1) % 4, seats)['hand_strength'])
+            self.assertIsNone(game.get_state(primary, seats, public=True)['hand_strength'])
+            game_type = choose_game_type(game, primary)
+            self.assertEqual(chances[game_type.value], max(chances))
+            game.set_game_type(game_type)
+            self.assertIsNone(game.get_state(primary, seats)['hand_strength'])
+        self.assertEqual([t.name.lower() for t in GameType], list(GAME_TYPES))
+
+    @unittest.skipIf(numpy is None, 'numpy is not installed')
+    def test_build_tables(self):
+        hands = random_deals(500, numpy.random.default_rng(2))[:, 0]
+        values = batch_features(hands)
+        for i, mask in enumerate(array_to_masks(hands)):
+            self.assertEqual(features(int(mask)), tuple(int(v[i]) for v in values))
+        data = build_tables(300, seed=1, workers=1, chunk_size=100)
+        self.assertEqual(build_tables(300, seed=1, workers=2, chunk_size=100), data)
+        for table in data['tables'].values():
+            self.assertEqual([len(table[feature]) for feature, _ in FEATURES], [size for _, size in FEATURES])
+
+
+if __name__ == '__main__':
+    unittest.main()
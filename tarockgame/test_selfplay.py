@@ -0,0 +1,22 @@
+import unittest
+from tarockgame.game import Game, GameType, GameStage
+from tarockgame.selfplay import play_game, run_tournament, FirstLegalPolicy, RandomPolicy
+
+
+class SelfPlayTest(unittest.TestCase):
+    def test_play_game(self):
+        for game_type in GameType:
+            game = play_game(Game(primary_player=1, seed=5), [RandomPolicy(), FirstLegalPolicy()]*2, game_type)
+            self.assertIs(game.game_stage, GameStage.POSTGAME)
+            self.assertEqual(sum(game.tricks_taken()), 12)
+            self.assertIn(sum(points for points, _ in game.score), (69, 70))
+            self.assertEqual(game.history[-1], ('teams', [1, 0, 1, 1, 1, 1]))
+
+    def test_tournament(self):
+        summary = run_tournament(20, ['first', 'random', 'first', 'random'], workers=1, chunk_size=7)
+        self.assertEqual(summary['games'], 20)
+        self.assertAlmostEqual(sum(s['tricks'] for s in summary['seats']), 12.)
+
+
+if __name__ == '__main__':
+    unittest.main()
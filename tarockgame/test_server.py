@@ -0,0 +1,196 @@
+import asyncio
+import json
+import unittest
+from TarockWSServer import Bots, Outbox, Scheduler, Table, get_args, make_game
+from tarockgame.encoding import dumps
+from tarockgame.game import GameType
+
+
+class FakeWebSocket:
+    # Records what the server sends; send blocks while unblocked is cleared, like the connection of a slow client
+    def __init__(self):
+        self.subprotocol = None
+        self.data = dict()
+        self.sent = []
+        self.close_code = None
+        self.unblocked = asyncio.Event()
+        self.unblocked.set()
+
+    async def send(self, message):
+        await self.unblocked.wait()
+        self.sent.append(message)
+
+    async def close(self, code=1000, reason=''):
+        self.close_code = code
+
+
+class OutboxTest(unittest.IsolatedAsyncioTestCase):
+    async def drain(self, outbox):
+        while outbox.queue or outbox.pending:
+            await asyncio.sleep(0)
+
+    async def test_merge(self):
+        websocket = FakeWebSocket()
+        outbox = Outbox(websocket)
+        outbox.put({'a': 1})
+        await self.drain(outbox)
+        self.assertEqual(websocket.sent, [dumps({'a': 1})])
+
+        websocket.unblocked.clear()
+        outbox.put({'a': 2, 'b': 1})
+        # Sending the first update blocks, the following ones wait in the queue and are merged
+        await asyncio.sleep(0)
+        outbox.put({'b': 2}, encoded='ignored')
+        outbox.put({'c': 1})
+        outbox.put({'alertmsg': 'x'}, merge=False)
+        outbox.put({'c': 2})
+        self.assertEqual(len(outbox.queue), 3)
+        self.assertEqual(outbox.pending, 5)
+        websocket.unblocked.set()
+        await self.drain(outbox)
+        self.assertEqual(websocket.sent[1:], [dumps({'a': 2, 'b': 1}), dumps({'b': 2, 'c': 1}),
+                                              dumps({'alertmsg': 'x'}), dumps({'c': 2})])
+        self.assertIsNone(websocket.close_code)
+
+    async def test_max_pending(self):
+        websocket = FakeWebSocket()
+        websocket.unblocked.clear()
+        outbox = Outbox(websocket, max_pending=3)
+        for i in range(3):
+            outbox.put({'a': i})
+            await asyncio.sleep(0)
+        self.assertFalse(outbox.closed)
+        outbox.put({'a': 3})
+        self.assertTrue(outbox.closed)
+        await asyncio.sleep(0)
+        self.assertEqual(websocket.close_code, 1008)
+        # Nothing is queued for a closed connection
+        outbox.put({'a': 4})
+        self.assertEqual(len(outbox.queue), 0)
+
+
+class SchedulerTest(unittest.IsolatedAsyncioTestCase):
+    def table(self, window, max_window):
+        sent = []
+        table = Table(bots=Bots(workers=0), scheduler=Scheduler(window=window, max_window=max_window))
+        send_state = table.send_state
+
+        def counted(*args):
+            sent.append(asyncio.get_running_loop().time())
+            send_state(*args)
+        table.send_state = counted
+        return table, sent
+
+    async def test_window(self):
+        loop = asyncio.get_running_loop()
+        table, sent = self.table(window=0.05, max_window=0.5)
+        start = loop.time()
+        for _ in range(3):
+            table.schedule_state()
+            await asyncio.sleep(0.01)
+        # Every further action moves the broadcast back
+        self.assertEqual(sent, [])
+        self.assertGreaterEqual(table.state_handle.when(), start + 0.07)
+        await asyncio.sleep(0.1)
+        self.assertEqual(len(sent), 1)
+        self.assertIsNone(table.state_handle)
+
+    async def test_max_window(self):
+        loop = asyncio.get_running_loop()
+        table, sent = self.table(window=0.05, max_window=0.1)
+        start = loop.time()
+        while loop.time() < start + 0.3:
+            table.schedule_state()
+            self.assertLessEqual(table.state_handle.when(), table.state_first + 0.1)
+            await asyncio.sleep(0.01)
+        await asyncio.sleep(0.1)
+        # Actions arriving without a break still get broadcast every max_window seconds
+        self.assertGreaterEqual(len(sent), 3)
+        self.assertLessEqual(sent[0] - start, 0.15)
+
+    async def test_no_window(self):
+        table, sent = self.table(window=0., max_window=0.)
+        table.schedule_state()
+        self.assertEqual(len(sent), 1)
+        self.assertIsNone(table.state_handle)
+
+
+class BackpressureTest(unittest.IsolatedAsyncioTestCase):
+    async def test_slow_client(self):
+        wsgame = make_game(get_args(['--max-pending', '5', '--bot-workers', '0', '--broadcast-window', '0.001',
+                                     '--max-broadcast-delay', '0.002']))
+        fast, slow = FakeWebSocket(), FakeWebSocket()
+        slow.unblocked.clear()
+        for websocket in (fast, slow):
+            websocket.outbox = Outbox(websocket, max_pending=wsgame.max_pending)
+            await wsgame.register(websocket, '/table')
+        table = wsgame.tables['table']
+        game = table.game
+        game.set_game_type(GameType.NEGATIVE)
+        game.play_card(0, next(iter(game.legal_moves(0))))
+        for _ in range(10):
+            game.autoplay()
+            table.schedule_state()
+            await asyncio.sleep(0.01)
+        # The slow client fell more than --max-pending updates behind, the other one got every update
+        self.assertTrue(slow.outbox.closed)
+        self.assertEqual(slow.close_code, 1008)
+        self.assertEqual(slow.sent, [])
+        self.assertFalse(fast.outbox.closed)
+        self.assertIsNone(fast.close_code)
+        self.assertGreaterEqual(len(fast.sent), 10)
+        self.assertEqual(fast.outbox.pending, 0)
+        for websocket in (fast, slow):
+            await wsgame.unregister(websocket)
+        self.assertNotIn('table', wsgame.tables)
+
+
+class SpectatorTest(unittest.IsolatedAsyncioTestCase):
+    async def test_rejoin(self):
+        table = Table(bots=Bots(workers=0), scheduler=Scheduler(window=0.))
+        game = table.game
+        game.set_game_type(GameType.NEGATIVE)
+        game.play_card(0, next(iter(game.legal_moves(0))))
+
+        async def check():
+            # Every spectator's view, built from all messages it got, equals the public state
+            await asyncio.sleep(0)
+            state = json.loads(dumps(game.get_state(playerid=0, players=table.players, public=True)))
+            for websocket in table.spectators:
+                view = {}
+                for message in websocket.sent:
+                    view.update(json.loads(message))
+                self.assertEqual(view, state)
+
+        def join():
+            websocket = FakeWebSocket()
+            websocket.outbox = Outbox(websocket)
+            table.add_spectator(websocket)
+            return websocket
+
+        # The first spectator sees the first card of the trick, the second one joins after the third card.
+        # Once the next trick started, the seats of the second or third card show none, like to the first one.
+        first = join()
+        table.send_state()
+        await check()
+        table.remove_spectator(first)
+        for _ in range(2):
+            game.autoplay()
+            table.send_state()
+        join()
+        await check()
+        for _ in range(2):
+            game.autoplay()
+        table.send_state()
+        await check()
+        for i in range(12):
+            game.autoplay()
+            if i % 4 == 0:
+                # Joins while a change is not broadcast yet
+                join()
+            table.send_state()
+            await check()
+
+
+if __name__ == '__main__':
+    unittest.main()
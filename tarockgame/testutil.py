@@ -0,0 +1,10 @@
+#!/usr/bin/env python
+# *-* encoding: utf-8 *-*
+
+# Helpers shared by the tests and the benchmarks
+
+
+class Seat:
+    # Stands in for the websocket players of the server
+    def __init__(self, name: str):
+        self.data = {'name': name}